@@ -23,7 +23,7 @@ DEBUG = config('DEBUG', default=True, cast=bool)
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
-USER_SERVICE = "http://userservice:8001"
+USER_SERVICE = config('USER_SERVICE', default="http://userservice:8001")
 
 ALLOWED_HOSTS = ['*']
 
@@ -52,6 +52,26 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Số JWT đã verify được giữ trong cache (shared/token_cache)
+JWT_CACHE_SIZE = config('JWT_CACHE_SIZE', default=4096, cast=int)
+
+# Thời gian giữ kết quả của /api/appointments/calendar-density/ (giây); cache key có version của dữ liệu
+# (versioning.py) nên thay đổi được thấy ngay, timeout chỉ để dọn các entry cũ
+CALENDAR_DENSITY_CACHE_TIMEOUT = config('CALENDAR_DENSITY_CACHE_TIMEOUT', default=300, cast=int)
+
+# Phân trang keyset của /api/appointments/ (chỉ khi request có limit hoặc cursor)
+APPOINTMENT_LIST_PAGE_SIZE = config('APPOINTMENT_LIST_PAGE_SIZE', default=50, cast=int)
+APPOINTMENT_LIST_MAX_PAGE_SIZE = config('APPOINTMENT_LIST_MAX_PAGE_SIZE', default=500, cast=int)
+
+# Dashboard đọc số liệu từ bảng AppointmentCounter (cập nhật khi lịch hẹn đổi trạng thái) thay vì đếm trên
+# bảng Appointment. Chạy `manage.py rebuild_stats_counters` trước khi bật
+APPOINTMENT_STATS_COUNTERS = config('APPOINTMENT_STATS_COUNTERS', default=False, cast=bool)
+
+# Danh bạ tên bác sĩ/bệnh nhân (directory.py): dict trong process được làm mới nền từ user_service sau mỗi
+# USER_DIRECTORY_TTL giây (0: chỉ làm mới bằng `manage.py refresh_user_directory`)
+USER_DIRECTORY_TTL = config('USER_DIRECTORY_TTL', default=300, cast=int)
+USER_DIRECTORY_FETCH_TIMEOUT = config('USER_DIRECTORY_FETCH_TIMEOUT', default=10, cast=int)
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=9999),  # hoặc 100 năm cũng được
     'REFRESH_TOKEN_LIFETIME': timedelta(days=9999),
@@ -97,10 +117,30 @@ WSGI_APPLICATION = 'appointment_service.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLITE_PATH: DB riêng, vd DB tạm của load test (gateway: manage.py loadtest --real-services)
+        'NAME': config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
     }
 }
 
+# Cache của calendar-density và version dữ liệu lịch (appointments/versioning.py).
+# Mặc định LocMem: riêng cho từng process, chỉ đúng khi service chạy một process (runserver như trong Dockerfile).
+# Chạy nhiều worker (gunicorn, uwsgi) thì đặt REDIS_URL (cần package redis) để mọi worker thấy cùng version,
+# nếu không một worker có thể trả mật độ cũ tới CALENDAR_DENSITY_CACHE_TIMEOUT giây sau khi có lượt đặt mới.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -4,11 +4,18 @@ from django.conf import settings
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth.models import AnonymousUser
+from token_cache import decode_token
 
 class MicroserviceUser:
     """
     Simple user class for microservices that don't have direct access to User model
     """
+    __slots__ = ('id', 'username', 'email', 'first_name', 'last_name', 'role', 'is_staff', 'is_superuser')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
     def __init__(self, user_data):
         self.id = user_data.get('id')
         self.username = user_data.get('username', '')
@@ -16,9 +23,6 @@ class MicroserviceUser:
         self.first_name = user_data.get('first_name', '')
         self.last_name = user_data.get('last_name', '')
         self.role = user_data.get('role', 'PATIENT')
-        self.is_authenticated = True
-        self.is_active = True
-        self.is_anonymous = False
         self.is_staff = user_data.get('is_staff', False)
         self.is_superuser = user_data.get('is_superuser', False)
     
@@ -39,8 +43,8 @@ class MicroserviceJWTAuthentication(BaseAuthentication):
         token = auth_header.split(' ', 1)[1]
         
         try:
-            # Decode JWT token
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+            # Decode JWT token (token đã verify được lấy từ cache)
+            payload = decode_token(token)
             user_id = payload.get('user_id')
             
             if not user_id:
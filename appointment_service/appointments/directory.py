@@ -0,0 +1,140 @@
+"""
+Danh bạ tên người dùng (bác sĩ, bệnh nhân) của user_service, để appointment_service không phải gọi HTTP mỗi khi
+cần hiển thị một cái tên.
+
+    user_service --(cả danh sách, thread nền)--> bảng UserDirectoryEntry --> dict trong process (TTL)
+
+Request chỉ đọc dict trong process; id chưa có trong dict được đọc từ bảng bằng một query theo index.
+Khi dict cũ hơn USER_DIRECTORY_TTL giây, hoặc có id không tìm thấy, một thread nền lấy lại toàn bộ danh sách
+từ user_service, ghi vào bảng rồi nạp lại dict: request không bao giờ chờ user_service. Bảng dùng chung cho mọi
+process nên user_service lỗi thì danh bạ vẫn dùng được với dữ liệu lần làm mới trước.
+"""
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.db import connection
+
+from .models import UserDirectoryEntry
+
+# Endpoint trả về cả danh sách của user_service (AllowAny, dành cho các service khác)
+SOURCES = [
+    ('DOCTOR', '/api/users/doctors/list/'),
+    ('PATIENT', '/api/users/patients/list/'),
+]
+
+# Chuyên khoa mặc định của DoctorListAPIView khi bác sĩ chưa có DoctorProfile
+UNKNOWN_SPECIALTY = 'Chưa xác định'
+
+# Có id không tìm thấy thì làm mới, nhưng không quá một lần mỗi khoảng này (giây)
+MISS_REFRESH_INTERVAL = 30
+
+
+def display_name(data):
+    name = data.get('full_name') or f"{data.get('first_name', '')} {data.get('last_name', '')}".strip()
+    return name or data.get('username') or ''
+
+
+def fetch_users():
+    """Lấy toàn bộ bác sĩ và bệnh nhân từ user_service: list (user_id, role, full_name, department)"""
+    users = []
+    for role, path in SOURCES:
+        response = requests.get(f"{settings.USER_SERVICE}{path}", timeout=settings.USER_DIRECTORY_FETCH_TIMEOUT)
+        response.raise_for_status()
+        for data in response.json():
+            name = display_name(data)
+            department = data.get('specialty') or ''
+            if department == UNKNOWN_SPECIALTY:
+                department = ''
+            if data.get('id') is not None and name:
+                users.append((data['id'], role, name, department))
+    return users
+
+
+class UserDirectory:
+    """
+    Dict user_id -> tên trong process. ttl <= 0: không tự làm mới, chỉ đọc bảng (làm mới bằng
+    `manage.py refresh_user_directory`).
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._names = {}
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._refreshed_at = None  # time.monotonic() của lần làm mới gần nhất, kể cả khi thất bại
+
+    def names(self, user_ids):
+        """{user_id: tên} của các id đã biết, id không có trong danh bạ bị bỏ qua; không gọi user_service"""
+        user_ids = set(user_ids)
+        with self._lock:
+            found = {user_id: self._names[user_id] for user_id in user_ids if user_id in self._names}
+        missing = user_ids - found.keys()
+        if missing:
+            loaded = dict(UserDirectoryEntry.objects.filter(user_id__in=missing).values_list('user_id', 'full_name'))
+            with self._lock:
+                self._names.update(loaded)
+            found.update(loaded)
+
+        self.refresh_if_stale(missing=len(found) < len(user_ids))
+        return found
+
+    def name(self, user_id):
+        return self.names([user_id]).get(user_id)
+
+    def doctor_ids(self, department):
+        """id các bác sĩ thuộc chuyên khoa (DoctorProfile.specialty bên user_service), đọc từ bảng"""
+        doctor_ids = list(UserDirectoryEntry.objects.filter(
+            department=department, role='DOCTOR',
+        ).order_by('user_id').values_list('user_id', flat=True))
+        self.refresh_if_stale(missing=not doctor_ids)
+        return doctor_ids
+
+    def refresh_if_stale(self, missing=False):
+        """Làm mới nền khi dict quá ttl, hoặc khi có dữ liệu không tìm thấy (tối đa mỗi MISS_REFRESH_INTERVAL)"""
+        age = None if self._refreshed_at is None else time.monotonic() - self._refreshed_at
+        if age is None or age > self.ttl or (missing and age > MISS_REFRESH_INTERVAL):
+            self.refresh_in_background()
+
+    def reload(self):
+        """Nạp lại dict từ bảng"""
+        names = dict(UserDirectoryEntry.objects.values_list('user_id', 'full_name'))
+        with self._lock:
+            self._names = names
+        return len(names)
+
+    def refresh(self):
+        """Lấy lại danh sách từ user_service, ghi vào bảng và nạp lại dict; trả về số người dùng lấy được"""
+        self._refreshed_at = time.monotonic()
+        users = fetch_users()
+        UserDirectoryEntry.store(users)
+        self.reload()
+        return len(users)
+
+    def refresh_in_background(self):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self._refreshed_at = time.monotonic()
+        threading.Thread(target=self._refresh_worker, name='user-directory-refresh', daemon=True).start()
+
+    def _refresh_worker(self):
+        try:
+            try:
+                self.refresh()
+            except requests.RequestException as e:
+                # user_service lỗi: vẫn nạp lại từ bảng, process khác có thể đã làm mới
+                print(f"⚠️ Could not refresh user directory from user_service: {e}")
+                self.reload()
+        except Exception as e:
+            print(f"⚠️ Error refreshing user directory: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+            connection.close()
+
+
+user_directory = UserDirectory(ttl=settings.USER_DIRECTORY_TTL)
@@ -0,0 +1,97 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from appointments.authentication import MicroserviceUser
+from appointments.models import AppointmentSlot, DoctorSchedule
+from appointments.views import AvailableSlotsView, slot_grid
+
+
+# Bác sĩ giả dùng trong benchmark, tránh trùng id với dữ liệu thật (mọi thứ đều bị rollback khi kết thúc)
+BENCH_DOCTOR_ID = 900000
+
+
+def legacy_slots(doctor_id, date_obj):
+    """Cách cũ của AvailableSlotsView: một get_or_create cho mỗi slot"""
+    schedules = DoctorSchedule.objects.filter(
+        doctor_id=doctor_id, weekday=date_obj.weekday(), is_active=True,
+    ).order_by('start_time')
+    result = []
+    for start, end, max_appointments in slot_grid(schedules, date_obj, timezone.get_current_timezone()):
+        slot, _ = AppointmentSlot.objects.get_or_create(
+            doctor_id=doctor_id, date=date_obj, start_time=start.time(),
+            defaults={'end_time': end.time(), 'max_appointments': max_appointments},
+        )
+        result.append((start.isoformat(), slot.booked_count))
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        'So sánh số query và thời gian của AvailableSlotsView (bulk) với cách get_or_create từng slot '
+        'cho bác sĩ có lịch dày; chạy trong transaction được rollback'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--durations', default='5,10,15,30',
+                            help='Thời gian khám mỗi slot (phút), cách nhau bởi dấu phẩy')
+        parser.add_argument('--hours', type=int, default=12, help='Số giờ làm việc mỗi ngày')
+        parser.add_argument('--days', type=int, default=5, help='Số ngày đo cho mỗi trường hợp')
+
+    def handle(self, *args, **options):
+        durations = [int(d) for d in options['durations'].split(',')]
+        self.stdout.write(
+            f"{'duration':>8} {'slots':>6} {'path':<8} {'case':<5} {'queries':>8} {'ms/call':>9}"
+        )
+        with transaction.atomic():
+            for index, duration in enumerate(durations):
+                self.bench_duration(BENCH_DOCTOR_ID + index * 2, duration, options['hours'], options['days'])
+            transaction.set_rollback(True)
+
+    def bench_duration(self, doctor_id, duration, hours, days):
+        # Hai bác sĩ có lịch giống hệt nhau để cách cũ và cách mới đều bắt đầu từ bảng slot trống
+        for pk in (doctor_id, doctor_id + 1):
+            DoctorSchedule.objects.bulk_create([
+                DoctorSchedule(
+                    doctor_id=pk, weekday=weekday, start_time=datetime.time(7, 0),
+                    end_time=datetime.time(7 + hours, 0), appointment_duration=duration,
+                    max_patients_per_hour=max(1, 60 // duration),
+                )
+                for weekday in range(7)
+            ])
+        start_date = timezone.now().date() + datetime.timedelta(days=365)
+        dates = [start_date + datetime.timedelta(days=i) for i in range(days)]
+        slots = hours * 60 // duration
+
+        view = AvailableSlotsView.as_view()
+        factory = APIRequestFactory()
+        user = MicroserviceUser({'id': 1, 'role': 'PATIENT'})
+
+        def bulk(date_obj):
+            request = factory.get('/api/appointments/available-slots/', {
+                'doctor_id': doctor_id, 'date': date_obj.isoformat(),
+            })
+            force_authenticate(request, user=user)
+            response = view(request)
+            assert response.status_code == 200 and len(response.data['slots']) == slots, response.data
+
+        def legacy(date_obj):
+            assert len(legacy_slots(doctor_id + 1, date_obj)) == slots
+
+        # cold: slot của ngày chưa được tạo, warm: gọi lại cùng ngày khi slot đã có
+        for case in ('cold', 'warm'):
+            for name, call in (('legacy', legacy), ('bulk', bulk)):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for date_obj in dates:
+                        call(date_obj)
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{duration:>8} {slots:>6} {name:<8} {case:<5} {len(queries) / days:>8.1f} "
+                    f"{elapsed / days * 1000:>9.2f}"
+                )
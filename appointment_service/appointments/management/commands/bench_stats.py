@@ -0,0 +1,122 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from appointments.models import Appointment, AppointmentCounter
+from appointments.views import (
+    doctor_stats, doctor_stats_from_counters, patient_stats, patient_stats_from_counters,
+)
+
+
+# id của dữ liệu giả, mọi thứ đều bị rollback khi kết thúc
+BENCH_DOCTOR_BASE = 800000
+BENCH_PATIENT_BASE = 8000000
+
+
+def legacy_doctor_stats(doctor_id, today):
+    """Cách cũ của DoctorStatsView: năm query COUNT riêng"""
+    appointments = Appointment.objects.filter(doctor_id=doctor_id)
+    return {
+        'todays_appointments': appointments.filter(scheduled_time__date=today).count(),
+        'total_patients': appointments.values('patient_id').distinct().count(),
+        'completed_appointments': appointments.filter(status='COMPLETED').count(),
+        'total_appointments': appointments.count(),
+        'pending_reports': appointments.filter(status__in=['PENDING', 'CONFIRMED']).count(),
+    }
+
+
+def legacy_patient_stats(patient_id, now):
+    """Cách cũ của PatientStatsView: hai query COUNT riêng"""
+    appointments = Appointment.objects.filter(patient_id=patient_id)
+    return {
+        'upcoming_appointments': appointments.filter(
+            scheduled_time__gte=now, status__in=['PENDING', 'CONFIRMED'],
+        ).count(),
+        'completed_appointments': appointments.filter(status='COMPLETED').count(),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'So sánh DoctorStatsView/PatientStatsView: nhiều COUNT riêng, một query conditional aggregation và '
+        'bảng AppointmentCounter, trên bảng Appointment lớn; chạy trong transaction được rollback'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Số lịch hẹn giả')
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--patients', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=5, help='Số lần gọi mỗi cách')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.populate(options)
+            self.bench(options)
+            transaction.set_rollback(True)
+
+    def populate(self, options):
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        statuses = [status for status, _ in Appointment.STATUS_CHOICES]
+
+        def rows():
+            for _ in range(options['rows']):
+                scheduled_time = now + datetime.timedelta(minutes=15 * rng.randint(-35040, 35040))
+                yield Appointment(
+                    patient_id=BENCH_PATIENT_BASE + rng.randrange(options['patients']),
+                    doctor_id=BENCH_DOCTOR_BASE + rng.randrange(options['doctors']),
+                    scheduled_time=scheduled_time, end_time=scheduled_time + datetime.timedelta(minutes=30),
+                    status=rng.choice(statuses),
+                )
+
+        started = time.perf_counter()
+        batch = []
+        for appointment in rows():
+            batch.append(appointment)
+            if len(batch) == 10000:
+                Appointment.objects.bulk_create(batch)
+                batch = []
+        Appointment.objects.bulk_create(batch)
+        self.stdout.write(f"Đã tạo {options['rows']} lịch hẹn trong {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        AppointmentCounter.rebuild()
+        self.stdout.write(f'rebuild_stats_counters: {time.perf_counter() - started:.2f}s')
+
+    def bench(self, options):
+        today = datetime.date.today()
+        now = timezone.now()
+        doctor_id = BENCH_DOCTOR_BASE
+        patient_id = BENCH_PATIENT_BASE
+
+        cases = [
+            ('doctor', 'legacy', lambda: legacy_doctor_stats(doctor_id, today)),
+            ('doctor', 'aggregate', lambda: doctor_stats(doctor_id, today)),
+            ('doctor', 'counters', lambda: doctor_stats_from_counters(doctor_id, today)),
+            ('patient', 'legacy', lambda: legacy_patient_stats(patient_id, now)),
+            ('patient', 'aggregate', lambda: patient_stats(patient_id, now)),
+            ('patient', 'counters', lambda: patient_stats_from_counters(patient_id, now)),
+        ]
+        self.stdout.write(f"{'view':<8} {'path':<10} {'queries':>8} {'ms/call':>10}  result")
+        expected = {}
+        for view, name, call in cases:
+            # Log query của connection chỉ giữ 9000 query gần nhất, bulk_create ở trên đã làm đầy
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    result = call()
+                elapsed = time.perf_counter() - started
+            # Ba cách phải cho cùng kết quả
+            if expected.setdefault(view, result) != result:
+                self.stderr.write(f'⚠️  {view}/{name} khác kết quả: {result} != {expected[view]}')
+            self.stdout.write(
+                f"{view:<8} {name:<10} {len(queries) / options['repeat']:>8.1f} "
+                f"{elapsed / options['repeat'] * 1000:>10.2f}  {dict(sorted(result.items()))}"
+            )
@@ -0,0 +1,176 @@
+import datetime
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from appointments import views
+from appointments.authentication import MicroserviceUser
+from appointments.models import Appointment, AppointmentSlot, DoctorSchedule, UserDirectoryEntry
+
+
+# Dữ liệu giả dùng để chạy các view, bị rollback khi kết thúc
+PLAN_DOCTOR_ID = 900200
+PLAN_PATIENT_ID = 9002000
+PLAN_DEPARTMENT = 'plan department'
+
+# Dòng "SCAN <bảng>" trong EXPLAIN QUERY PLAN của SQLite: đọc cả bảng (hoặc cả index) thay vì SEARCH theo index
+FULL_SCAN = re.compile(r'^SCAN (appointments_\w+)')
+
+
+def plan_cases():
+    """
+    Tạo dữ liệu giả và trả về [(tên, hàm gọi)], mỗi hàm chạy một view / một thao tác của app.
+    Phải được gọi trong transaction sẽ bị rollback.
+    """
+    day = timezone.now().date() + datetime.timedelta(days=5)
+    for weekday in range(7):
+        DoctorSchedule.objects.create(
+            doctor_id=PLAN_DOCTOR_ID, weekday=weekday, start_time=datetime.time(8, 0),
+            end_time=datetime.time(12, 0), appointment_duration=30,
+        )
+    slot = AppointmentSlot.objects.create(
+        doctor_id=PLAN_DOCTOR_ID, date=day, start_time=datetime.time(9, 0), end_time=datetime.time(9, 30),
+        max_appointments=4,
+    )
+    scheduled_time = timezone.make_aware(datetime.datetime.combine(day, slot.start_time))
+    appointment = Appointment.objects.create(
+        patient_id=PLAN_PATIENT_ID, doctor_id=PLAN_DOCTOR_ID, scheduled_time=scheduled_time,
+        appointment_slot=slot, reason='plan',
+    )
+
+    UserDirectoryEntry.store([(PLAN_DOCTOR_ID, 'DOCTOR', 'plan doctor', PLAN_DEPARTMENT)])
+
+    doctor = MicroserviceUser({'id': PLAN_DOCTOR_ID, 'role': 'DOCTOR'})
+    patient = MicroserviceUser({'id': PLAN_PATIENT_ID, 'role': 'PATIENT'})
+    factory = APIRequestFactory()
+    today = datetime.date.today()
+    now = timezone.now()
+
+    def get(view, user, path='/', **kwargs):
+        params = kwargs.pop('params', {})
+        def call():
+            request = factory.get(path, params)
+            if user:
+                force_authenticate(request, user=user)
+            response = view.as_view()(request, **kwargs)
+            assert response.status_code < 400, (view.__name__, response.status_code, response.data)
+            return response
+        return call
+
+    list_page = get(views.AppointmentListView, doctor, params={'role': 'DOCTOR', 'limit': 1})
+
+    def next_page():
+        cursor = views.encode_cursor(scheduled_time - datetime.timedelta(hours=1), 0)
+        return get(views.AppointmentListView, doctor, params={'role': 'DOCTOR', 'limit': 1, 'cursor': cursor})()
+
+    def book():
+        Appointment.objects.create(
+            patient_id=PLAN_PATIENT_ID + 1, doctor_id=PLAN_DOCTOR_ID, scheduled_time=scheduled_time,
+            appointment_slot=slot, reason='plan',
+        )
+
+    def cancel():
+        booked = Appointment.objects.get(pk=appointment.pk)
+        booked.status = 'CANCELLED'
+        booked.save()
+
+    cases = [
+        ('list patient', get(views.AppointmentListView, patient, params={'role': 'PATIENT'})),
+        ('list doctor status', get(views.AppointmentListView, doctor,
+                                   params={'role': 'DOCTOR', 'status': 'PENDING'})),
+        ('list doctor date', get(views.AppointmentListView, doctor,
+                                 params={'role': 'DOCTOR', 'date': day.isoformat()})),
+        ('list doctor page', list_page),
+        ('list doctor next page', next_page),
+        ('detail', get(views.AppointmentDetailView, doctor, pk=appointment.pk)),
+        ('schedules', get(views.DoctorScheduleView, doctor, params={'doctor_id': PLAN_DOCTOR_ID})),
+        ('available slots', get(views.AvailableSlotsView, patient,
+                                params={'doctor_id': PLAN_DOCTOR_ID, 'date': day.isoformat()})),
+        ('earliest slots department', get(views.EarliestAvailableSlotsView, patient,
+                                          params={'department': PLAN_DEPARTMENT, 'limit': 3})),
+        ('earliest slots doctors', get(views.EarliestAvailableSlotsView, patient,
+                                       params={'doctor_ids': f'{PLAN_DOCTOR_ID},{PLAN_DOCTOR_ID + 1}',
+                                               'start_date': day.isoformat(), 'end_date': day.isoformat()})),
+        ('daily availability', get(views.DailyAvailabilityView, None, params={'doctor_id': PLAN_DOCTOR_ID})),
+        # Gọi thẳng phần tính toán, không qua cache của view
+        ('calendar density', lambda: views.CalendarDensityView().density(PLAN_DOCTOR_ID, day.replace(day=1))),
+        ('patient calendar', get(views.PatientAppointmentCalendarView, patient,
+                                 params={'year': day.year, 'month': day.month})),
+        ('doctor stats', get(views.DoctorStatsView, doctor, doctor_id=PLAN_DOCTOR_ID)),
+        ('patient stats', get(views.PatientStatsView, patient, patient_id=PLAN_PATIENT_ID)),
+        ('doctor stats (counters)', lambda: views.doctor_stats_from_counters(PLAN_DOCTOR_ID, today)),
+        ('patient stats (counters)', lambda: views.patient_stats_from_counters(PLAN_PATIENT_ID, now)),
+        ('recent doctor', get(views.RecentAppointmentsView, doctor,
+                              user_type='doctor', user_id=PLAN_DOCTOR_ID)),
+        ('recent patient', get(views.RecentAppointmentsView, patient,
+                               user_type='patient', user_id=PLAN_PATIENT_ID)),
+        ('book', book),
+        ('cancel', cancel),
+    ]
+    return cases
+
+
+def collect_plans(cases):
+    """Chạy từng case, trả về [(tên, [(sql, [dòng của EXPLAIN QUERY PLAN])])] của các SELECT/UPDATE/DELETE"""
+    results = []
+    with connection.cursor() as cursor:
+        for name, call in cases:
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                call()
+            plans = []
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+            results.append((name, plans))
+    return results
+
+
+def full_scans(plan):
+    return [detail for detail in plan if FULL_SCAN.match(detail)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Chạy các view của appointment_service, lấy EXPLAIN QUERY PLAN của từng query và báo lỗi nếu query nào '
+        'phải quét toàn bộ một bảng của app (thiếu index cho access path đó)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='In plan của mọi query')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Chỉ hỗ trợ SQLite (EXPLAIN QUERY PLAN)')
+
+        with transaction.atomic():
+            failures = self.run_cases(options['verbose_plans'])
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'{len(failures)} query quét toàn bảng: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('✅ Không query nào quét toàn bảng'))
+
+    def run_cases(self, verbose):
+        failures = []
+        for name, plans in collect_plans(plan_cases()):
+            scans = 0
+            for sql, plan in plans:
+                scanned = full_scans(plan)
+                if scanned:
+                    scans += 1
+                    failures.append(f"{name}: {', '.join(scanned)}")
+                if verbose or scanned:
+                    self.stdout.write(f'    {sql}')
+                    for detail in plan:
+                        self.stdout.write(f'        {detail}')
+            status = self.style.ERROR(f'{scans} full scan') if scans else 'ok'
+            self.stdout.write(f'{name:<26} {len(plans):>3} query  {status}')
+        return failures
@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.db import models
-from appointments.models import DoctorSchedule, AppointmentSlot, Appointment
+from appointments.models import DoctorSchedule, AppointmentSlot, Appointment, AppointmentCounter, SlotFullError
 import requests
 import json
 from datetime import datetime, timedelta, time, date
@@ -34,6 +34,7 @@ class Command(BaseCommand):
         if options['clear']:
             self.stdout.write('🗑️  Xóa dữ liệu lịch cũ...')
             Appointment.objects.all().delete()
+            AppointmentCounter.objects.all().delete()
             AppointmentSlot.objects.all().delete()
             DoctorSchedule.objects.all().delete()
 
@@ -217,28 +218,28 @@ class Command(BaseCommand):
                 datetime.combine(slot.date, slot.start_time)
             )
             
-            # Tạo appointment
-            appointment = Appointment.objects.create(
-                patient_id=patient['id'],
-                doctor_id=slot.doctor_id,
-                scheduled_time=scheduled_datetime,
-                end_time=scheduled_datetime + timedelta(minutes=30),
-                status=random.choice(statuses),
-                reason=random.choice(reasons),
-                priority=random.randint(1, 3),
-                patient_name=patient['full_name'],
-                doctor_name=doctor['full_name'],
-                department=doctor.get('specialty', 'Nội khoa'),
-                appointment_slot=slot,
-                notes=f'Lịch khám mẫu số {i+1}'
-            )
+            # Tạo appointment (Appointment.save() tăng booked_count của slot)
+            try:
+                appointment = Appointment.objects.create(
+                    patient_id=patient['id'],
+                    doctor_id=slot.doctor_id,
+                    scheduled_time=scheduled_datetime,
+                    end_time=scheduled_datetime + timedelta(minutes=30),
+                    status=random.choice(statuses),
+                    reason=random.choice(reasons),
+                    priority=random.randint(1, 3),
+                    patient_name=patient['full_name'],
+                    doctor_name=doctor['full_name'],
+                    department=doctor.get('specialty', 'Nội khoa'),
+                    appointment_slot=slot,
+                    notes=f'Lịch khám mẫu số {i+1}'
+                )
+            except SlotFullError:
+                available_slots = available_slots.exclude(id=slot.id)
+                continue
             
             appointments_created += 1
             
-            # Cập nhật slot
-            slot.booked_count += 1
-            slot.save()
-            
             # Nếu slot đã full, remove khỏi available_slots
             if slot.booked_count >= slot.max_appointments:
                 available_slots = available_slots.exclude(id=slot.id)
@@ -0,0 +1,32 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.models import DailyOccupancy
+
+
+class Command(BaseCommand):
+    help = (
+        'Tính lại bảng DailyOccupancy từ AppointmentSlot và DoctorSchedule '
+        '(backfill sau khi migrate, hoặc sau khi ghi slot bằng bulk_create/update())'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, action='append', dest='doctors',
+                            help='Chỉ tính lại cho bác sĩ này (có thể lặp lại)')
+        parser.add_argument('--start-date', help='Từ ngày (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Đến ngày (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start_date = self.parse_date(options['start_date'], '--start-date')
+        end_date = self.parse_date(options['end_date'], '--end-date')
+        rows = DailyOccupancy.rebuild(doctor_ids=options['doctors'], start_date=start_date, end_date=end_date)
+        self.stdout.write(self.style.SUCCESS(f'✅ Đã ghi {rows} dòng DailyOccupancy'))
+
+    def parse_date(self, value, option):
+        if not value:
+            return None
+        try:
+            return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'{option} không hợp lệ (YYYY-MM-DD)')
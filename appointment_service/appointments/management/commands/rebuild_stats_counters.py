@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from appointments.models import AppointmentCounter
+
+
+class Command(BaseCommand):
+    help = (
+        'Tính lại bảng AppointmentCounter từ Appointment '
+        '(trước khi bật APPOINTMENT_STATS_COUNTERS, hoặc sau khi ghi lịch hẹn bằng bulk_create/update())'
+    )
+
+    def handle(self, *args, **options):
+        rows = AppointmentCounter.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✅ Đã ghi {rows} dòng AppointmentCounter'))
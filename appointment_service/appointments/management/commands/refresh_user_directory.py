@@ -0,0 +1,18 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.directory import user_directory
+
+
+class Command(BaseCommand):
+    help = (
+        'Lấy toàn bộ bác sĩ và bệnh nhân từ user_service và ghi vào bảng UserDirectoryEntry '
+        '(lúc deploy, hoặc chạy định kỳ khi USER_DIRECTORY_TTL=0)'
+    )
+
+    def handle(self, *args, **options):
+        try:
+            users = user_directory.refresh()
+        except requests.RequestException as e:
+            raise CommandError(f'Không gọi được user_service: {e}')
+        self.stdout.write(self.style.SUCCESS(f'✅ Đã ghi {users} người dùng vào danh bạ'))
@@ -0,0 +1,130 @@
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from appointments.models import (
+    Appointment, AppointmentCounter, AppointmentSlot, DailyOccupancy, DoctorSchedule, SlotFullError,
+)
+
+
+# Bác sĩ giả dùng trong stress test, dữ liệu bị xóa khi kết thúc (trừ khi --keep)
+STRESS_DOCTOR_ID = 900100
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Bắn nhiều lượt đặt lịch song song vào cùng một slot: đo throughput và kiểm tra slot không bao giờ '
+        'bị đặt quá max_appointments (booked_count, số lịch hẹn và DailyOccupancy phải khớp nhau)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=200, help='Tổng số lượt đặt')
+        parser.add_argument('--capacity', type=int, default=20, help='max_appointments của slot')
+        parser.add_argument('--workers', type=int, default=16, help='Số thread đặt lịch đồng thời')
+        parser.add_argument('--keep', action='store_true', help='Giữ lại dữ liệu đã tạo')
+
+    def handle(self, *args, **options):
+        date_obj = timezone.now().date() + datetime.timedelta(days=400)
+        start = datetime.time(9, 0)
+        DoctorSchedule.objects.create(
+            doctor_id=STRESS_DOCTOR_ID, weekday=date_obj.weekday(), start_time=start, end_time=datetime.time(10, 0),
+            appointment_duration=60, max_patients_per_hour=options['capacity'],
+        )
+        slot = AppointmentSlot.objects.create(
+            doctor_id=STRESS_DOCTOR_ID, date=date_obj, start_time=start, end_time=datetime.time(10, 0),
+            max_appointments=options['capacity'],
+        )
+        scheduled_time = timezone.make_aware(datetime.datetime.combine(date_obj, start))
+        try:
+            results, elapsed = self.fire(slot, scheduled_time, options['attempts'], options['workers'])
+            self.report(slot, results, elapsed, options)
+        finally:
+            if not options['keep']:
+                # Xóa từng lịch để AppointmentCounter (nếu bật) của các bệnh nhân được trừ lại
+                for appointment in Appointment.objects.filter(doctor_id=STRESS_DOCTOR_ID):
+                    appointment.delete()
+                AppointmentCounter.objects.filter(role=AppointmentCounter.DOCTOR, user_id=STRESS_DOCTOR_ID).delete()
+                AppointmentSlot.objects.filter(doctor_id=STRESS_DOCTOR_ID).delete()
+                DoctorSchedule.objects.filter(doctor_id=STRESS_DOCTOR_ID).delete()
+                DailyOccupancy.objects.filter(doctor_id=STRESS_DOCTOR_ID).delete()
+
+    def fire(self, slot, scheduled_time, attempts, workers):
+        barrier = threading.Barrier(workers)
+        local = threading.local()
+
+        def book(i):
+            if not getattr(local, 'started', False):
+                # Mọi thread bắt đầu cùng lúc để tranh chấp thật sự
+                local.started = True
+                barrier.wait()
+            started = time.perf_counter()
+            try:
+                Appointment(
+                    patient_id=i + 1, doctor_id=STRESS_DOCTOR_ID, scheduled_time=scheduled_time,
+                    reason='stress', appointment_slot=AppointmentSlot.objects.get(pk=slot.pk),
+                ).save()
+                outcome = 'booked'
+            except SlotFullError:
+                outcome = 'full'
+            except OperationalError:
+                # SQLite: chờ khóa ghi quá timeout
+                outcome = 'locked'
+            return outcome, time.perf_counter() - started
+
+        def worker(indexes):
+            try:
+                return [book(i) for i in indexes]
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunks = executor.map(worker, [range(w, attempts, workers) for w in range(workers)])
+            results = [result for chunk in chunks for result in chunk]
+        return results, time.perf_counter() - started
+
+    def report(self, slot, results, elapsed, options):
+        outcomes = {'booked': 0, 'full': 0, 'locked': 0}
+        for outcome, _ in results:
+            outcomes[outcome] += 1
+        latencies = [duration for _, duration in results]
+
+        slot.refresh_from_db()
+        appointments = Appointment.objects.filter(appointment_slot=slot).count()
+        rollup = DailyOccupancy.objects.filter(doctor_id=STRESS_DOCTOR_ID, date=slot.date).aggregate(
+            booked=Sum('booked'),
+        )['booked'] or 0
+
+        self.stdout.write(
+            f"attempts={len(results)} workers={options['workers']} capacity={slot.max_appointments} "
+            f"elapsed={elapsed:.3f}s throughput={len(results) / elapsed:.0f} lượt/s"
+        )
+        self.stdout.write(
+            f"booked={outcomes['booked']} full={outcomes['full']} locked={outcomes['locked']} "
+            f"p50={percentile(latencies, 50) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms"
+        )
+        self.stdout.write(
+            f"slot.booked_count={slot.booked_count} appointments={appointments} daily_occupancy.booked={rollup}"
+        )
+
+        errors = []
+        if slot.booked_count > slot.max_appointments:
+            errors.append(f'slot bị đặt quá: {slot.booked_count} > {slot.max_appointments}')
+        if not slot.booked_count == appointments == outcomes['booked'] == rollup:
+            errors.append('booked_count, số lịch hẹn và DailyOccupancy không khớp')
+        if outcomes['locked'] == 0 and outcomes['booked'] != min(len(results), slot.max_appointments):
+            errors.append(f"chỉ đặt được {outcomes['booked']} lượt dù slot còn chỗ")
+        if errors:
+            raise CommandError('; '.join(errors))
+        self.stdout.write(self.style.SUCCESS('✅ Slot không bị đặt quá, các bộ đếm khớp nhau'))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_auto_20250528_0425'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doctor_id', models.IntegerField()),
+                ('date', models.DateField()),
+                ('half_day', models.CharField(choices=[('AM', 'Sáng'), ('PM', 'Chiều')], max_length=2)),
+                ('capacity', models.IntegerField(default=0)),
+                ('booked', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('doctor_id', 'date', 'half_day')},
+            },
+        ),
+    ]
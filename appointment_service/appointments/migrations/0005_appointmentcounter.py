@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_dailyoccupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('DOCTOR', 'Doctor'), ('PATIENT', 'Patient')], max_length=10)),
+                ('user_id', models.IntegerField()),
+                ('total', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('confirmed', models.IntegerField(default=0)),
+                ('cancelled', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('rescheduled', models.IntegerField(default=0)),
+                ('patients', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('role', 'user_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_appointmentcounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor_id', 'scheduled_time'], name='appt_doctor_scheduled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient_id', 'scheduled_time'], name='appt_patient_scheduled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor_id', 'created_at'], name='appt_doctor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient_id', 'created_at'], name='appt_patient_created_idx'),
+        ),
+    ]
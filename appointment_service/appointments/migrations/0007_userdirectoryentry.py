@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDirectoryEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField(unique=True)),
+                ('role', models.CharField(max_length=20)),
+                ('full_name', models.CharField(max_length=255)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
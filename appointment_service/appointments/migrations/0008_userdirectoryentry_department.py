@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_userdirectoryentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdirectoryentry',
+            name='department',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+    ]
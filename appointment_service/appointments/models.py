@@ -1,6 +1,12 @@
-from django.db import models
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
+
+from . import versioning
 
 class AppointmentSlot(models.Model):
     """Model để quản lý các khung giờ khám bệnh"""
@@ -32,6 +38,32 @@ class AppointmentSlot(models.Model):
         else:
             return 'AVAILABLE'
 
+    def add_booked(self, delta):
+        """
+        Cộng delta vào booked_count bằng một UPDATE có điều kiện (không đọc-sửa-ghi nên không mất lượt đặt khi
+        nhiều request cùng lúc): chỉ tăng khi còn đủ chỗ, chỉ giảm khi không xuống dưới 0.
+        DailyOccupancy của buổi chứa slot được cập nhật trong cùng transaction.
+        Trả về False (không có gì thay đổi) nếu slot đã đầy.
+        """
+        rows = AppointmentSlot.objects.filter(pk=self.pk)
+        if delta > 0:
+            rows = rows.filter(booked_count__lte=F('max_appointments') - delta)
+        else:
+            rows = rows.filter(booked_count__gte=-delta)
+        with transaction.atomic():
+            if not rows.update(booked_count=F('booked_count') + delta):
+                return delta < 0
+            DailyOccupancy.add_booked(self.doctor_id, self.date, self.start_time, delta)
+        self.booked_count += delta
+        return True
+
+
+class SlotFullError(Exception):
+    """Slot không còn chỗ lúc ghi lịch hẹn (đã bị request khác đặt hết sau khi validate)"""
+    def __init__(self, slot):
+        super().__init__(f'{slot} đã đầy')
+        self.slot = slot
+
 
 class Appointment(models.Model):
     """Model đặt lịch khám bệnh"""
@@ -73,33 +105,178 @@ class Appointment(models.Model):
         related_name='appointments'
     )
 
+    class Meta:
+        # Mọi view đều lọc theo bác sĩ hoặc bệnh nhân rồi theo / sắp xếp theo scheduled_time hoặc created_at
+        # (kiểm tra bằng `manage.py check_query_plans`)
+        indexes = [
+            models.Index(fields=['doctor_id', 'scheduled_time'], name='appt_doctor_scheduled_idx'),
+            models.Index(fields=['patient_id', 'scheduled_time'], name='appt_patient_scheduled_idx'),
+            models.Index(fields=['doctor_id', 'created_at'], name='appt_doctor_created_idx'),
+            models.Index(fields=['patient_id', 'created_at'], name='appt_patient_created_idx'),
+        ]
+
     def __str__(self):
         return f"Appointment {self.id} - Patient {self.patient_id} with Doctor {self.doctor_id}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Trạng thái và slot lúc load, để save() biết lịch vừa bị hủy / mở lại / đổi slot
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_slot_id = instance.__dict__.get('appointment_slot_id')
+        instance._loaded_key = instance.counter_key
+        return instance
+
+    @property
+    def counter_key(self):
+        """(doctor_id, patient_id, status): các giá trị AppointmentCounter đếm theo"""
+        return (self.__dict__.get('doctor_id'), self.__dict__.get('patient_id'), self.__dict__.get('status'))
+
+    @property
+    def holds_slot(self):
+        """Lịch chưa hủy chiếm một chỗ trong slot của nó"""
+        return self.status != 'CANCELLED'
     
     def save(self, *args, **kwargs):
         # Nếu không có end_time, mặc định thời gian khám là 30 phút
         if not self.end_time and self.scheduled_time:
             self.end_time = self.scheduled_time + timedelta(minutes=30)
         
-        # Nếu là đặt lịch mới và có liên kết slot
-        is_new = self.pk is None
-        if is_new and self.appointment_slot:
-            # Tăng số lượng đặt lịch trong slot
-            self.appointment_slot.booked_count += 1
-            self.appointment_slot.save()
-        
         # Ensure scheduled_time is timezone-aware
         if self.scheduled_time and self.scheduled_time.tzinfo is None:
             self.scheduled_time = timezone.make_aware(self.scheduled_time, timezone.get_current_timezone())
         
-        super().save(*args, **kwargs)
+        # Giữ chỗ trong slot (và DailyOccupancy) cùng transaction với việc ghi lịch hẹn:
+        # slot đầy thì SlotFullError và không có gì được ghi
+        with transaction.atomic():
+            adding = self._state.adding
+            self.sync_slot_booking()
+            super().save(*args, **kwargs)
+            if AppointmentCounter.enabled():
+                old_key = None if adding else getattr(self, '_loaded_key', self.counter_key)
+                AppointmentCounter.track(old_key, self.counter_key, pk=self.pk)
+            self._loaded_status = self.status
+            self._loaded_slot_id = self.appointment_slot_id
+            self._loaded_key = self.counter_key
+
+    def sync_slot_booking(self):
+        """Đặt lịch mới, đổi slot, hủy hoặc mở lại lịch: chiếm chỗ ở slot mới trước, rồi trả chỗ ở slot cũ"""
+        if self._state.adding:
+            old_slot_id, old_holds = None, False
+        else:
+            old_slot_id = getattr(self, '_loaded_slot_id', self.appointment_slot_id)
+            old_holds = getattr(self, '_loaded_status', self.status) != 'CANCELLED'
+        new_slot_id = self.appointment_slot_id
+        new_holds = self.holds_slot
+
+        if new_slot_id and new_holds and (new_slot_id != old_slot_id or not old_holds):
+            if not self.appointment_slot.add_booked(1):
+                raise SlotFullError(self.appointment_slot)
+        if old_slot_id and old_holds and (old_slot_id != new_slot_id or not new_holds):
+            old_slot = self.appointment_slot if old_slot_id == new_slot_id else (
+                AppointmentSlot.objects.filter(pk=old_slot_id).first()
+            )
+            if old_slot:
+                old_slot.add_booked(-1)
     
     def delete(self, *args, **kwargs):
-        # Khi xóa lịch, giảm số lượng đặt trong slot
-        if self.appointment_slot:
-            self.appointment_slot.booked_count = max(0, self.appointment_slot.booked_count - 1)
-            self.appointment_slot.save()
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            # Khi xóa lịch (chưa hủy), trả chỗ cho slot
+            if self.appointment_slot and getattr(self, '_loaded_status', self.status) != 'CANCELLED':
+                self.appointment_slot.add_booked(-1)
+            result = super().delete(*args, **kwargs)
+            if AppointmentCounter.enabled():
+                AppointmentCounter.track(getattr(self, '_loaded_key', self.counter_key), None)
+            return result
+
+
+class AppointmentCounter(models.Model):
+    """
+    Bộ đếm lịch hẹn của từng bác sĩ / bệnh nhân để dashboard đọc một dòng thay vì đếm trên bảng Appointment:
+    tổng số, số theo từng trạng thái, và (với bác sĩ) số bệnh nhân khác nhau.
+    Chỉ được cập nhật khi settings.APPOINTMENT_STATS_COUNTERS bật, trong cùng transaction với Appointment.save()
+    / delete(). Trước khi bật (hoặc sau khi ghi Appointment bằng bulk_create/update()): `manage.py rebuild_stats_counters`.
+    """
+    DOCTOR = 'DOCTOR'
+    PATIENT = 'PATIENT'
+    ROLES = [
+        (DOCTOR, 'Doctor'),
+        (PATIENT, 'Patient'),
+    ]
+
+    role = models.CharField(max_length=10, choices=ROLES)
+    user_id = models.IntegerField()
+    total = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    confirmed = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    rescheduled = models.IntegerField(default=0)
+    patients = models.IntegerField(default=0)  # Số bệnh nhân khác nhau, chỉ dùng cho bác sĩ
+
+    class Meta:
+        unique_together = ('role', 'user_id')
+
+    def __str__(self):
+        return f"{self.role} {self.user_id}: {self.total} appointments"
+
+    @staticmethod
+    def enabled():
+        return settings.APPOINTMENT_STATS_COUNTERS
+
+    @classmethod
+    def add(cls, role, user_id, **deltas):
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        rows = cls.objects.filter(role=role, user_id=user_id)
+        values = {field: F(field) + delta for field, delta in deltas.items()}
+        if not rows.update(**values):
+            cls.objects.get_or_create(role=role, user_id=user_id)
+            rows.update(**values)
+
+    @classmethod
+    def track(cls, old, new, pk=None):
+        """
+        Cập nhật bộ đếm khi một lịch hẹn đổi từ `old` sang `new` (counter_key, None khi lịch mới tạo / vừa bị xóa).
+        Gọi sau khi đã ghi lịch hẹn: số bệnh nhân khác nhau được tính bằng một EXISTS trên cặp (bác sĩ, bệnh nhân).
+        """
+        if old == new:
+            return
+        for role, index in ((cls.DOCTOR, 0), (cls.PATIENT, 1)):
+            deltas = defaultdict(lambda: defaultdict(int))
+            for key, sign in ((old, -1), (new, 1)):
+                if key:
+                    deltas[key[index]]['total'] += sign
+                    deltas[key[index]][key[2].lower()] += sign
+            for user_id, fields in deltas.items():
+                cls.add(role, user_id, **fields)
+
+        old_pair = old[:2] if old else None
+        new_pair = new[:2] if new else None
+        if old_pair == new_pair:
+            return
+        if old_pair and not Appointment.objects.filter(doctor_id=old_pair[0], patient_id=old_pair[1]).exists():
+            cls.add(cls.DOCTOR, old_pair[0], patients=-1)
+        if new_pair and not Appointment.objects.filter(
+            doctor_id=new_pair[0], patient_id=new_pair[1],
+        ).exclude(pk=pk).exists():
+            cls.add(cls.DOCTOR, new_pair[0], patients=1)
+
+    @classmethod
+    def rebuild(cls):
+        """Tính lại toàn bộ bảng từ Appointment: một GROUP BY cho bác sĩ, một cho bệnh nhân"""
+        statuses = {status.lower(): Count('id', filter=Q(status=status)) for status, _ in Appointment.STATUS_CHOICES}
+        objs = []
+        for role, field in ((cls.DOCTOR, 'doctor_id'), (cls.PATIENT, 'patient_id')):
+            extra = {'patients': Count('patient_id', distinct=True)} if role == cls.DOCTOR else {}
+            for row in Appointment.objects.values(field).annotate(total=Count('id'), **statuses, **extra).order_by():
+                user_id = row.pop(field)
+                objs.append(cls(role=role, user_id=user_id, **row))
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(objs, batch_size=1000)
+        return len(objs)
 
 
 class DoctorSchedule(models.Model):
@@ -126,4 +303,170 @@ class DoctorSchedule(models.Model):
         unique_together = ('doctor_id', 'weekday', 'start_time')
     
     def __str__(self):
-        return f"Dr.{self.doctor_id} schedule on {self.get_weekday_display()} ({self.start_time}-{self.end_time})"
\ No newline at end of file
+        return f"Dr.{self.doctor_id} schedule on {self.get_weekday_display()} ({self.start_time}-{self.end_time})"
+
+    @property
+    def half_day(self):
+        return DailyOccupancy.half_day_of(self.start_time)
+
+    @property
+    def slot_capacity(self):
+        """
+        Số bệnh nhân tối đa của mỗi slot theo lịch này (max_appointments của AppointmentSlot); dùng chung cho
+        mọi nơi tạo slot hoặc tính chỗ trống
+        """
+        return max(1, self.max_patients_per_hour // max(1, 60 // self.appointment_duration))
+
+    @property
+    def capacity(self):
+        """Tổng số lượt khám của một ngày theo lịch này: số slot x slot_capacity"""
+        start = datetime.combine(datetime.min, self.start_time)
+        end = datetime.combine(datetime.min, self.end_time)
+        slots = max(0, int((end - start).total_seconds()) // 60 // self.appointment_duration)
+        return slots * self.slot_capacity
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            DailyOccupancy.refresh_capacity(self.doctor_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            DailyOccupancy.refresh_capacity(self.doctor_id)
+            return result
+
+
+class DailyOccupancy(models.Model):
+    """
+    Bảng tổng hợp theo bác sĩ, ngày và buổi (sáng/chiều):
+        capacity  tổng số lượt khám theo lịch làm việc (DoctorSchedule.capacity)
+        booked    tổng booked_count của các AppointmentSlot trong buổi
+    booked được cập nhật trong cùng transaction mỗi khi booked_count của slot đổi (AppointmentSlot.add_booked),
+    capacity khi lịch làm việc của bác sĩ đổi. Dòng chỉ được tạo khi buổi đó có lượt đặt đầu tiên.
+    Dữ liệu có trước bảng này hoặc được ghi bằng bulk_create/update(): chạy `manage.py rebuild_occupancy`.
+    """
+    MORNING = 'AM'
+    AFTERNOON = 'PM'
+    HALF_DAYS = [
+        (MORNING, 'Sáng'),
+        (AFTERNOON, 'Chiều'),
+    ]
+
+    doctor_id = models.IntegerField()
+    date = models.DateField()
+    half_day = models.CharField(max_length=2, choices=HALF_DAYS)
+    capacity = models.IntegerField(default=0)
+    booked = models.IntegerField(default=0)
+
+    class Meta:
+        # Index của unique_together phục vụ luôn range scan theo (doctor_id, date)
+        unique_together = ('doctor_id', 'date', 'half_day')
+
+    def __str__(self):
+        return f"Dr.{self.doctor_id} on {self.date} {self.half_day}: {self.booked}/{self.capacity}"
+
+    @classmethod
+    def half_day_of(cls, start_time):
+        return cls.MORNING if start_time.hour < 12 else cls.AFTERNOON
+
+    @staticmethod
+    def weekday_capacity(doctor_id):
+        """{weekday: {half_day: capacity}} từ các lịch làm việc đang hoạt động của bác sĩ (một query)"""
+        capacity = {}
+        for schedule in DoctorSchedule.objects.filter(doctor_id=doctor_id, is_active=True):
+            halves = capacity.setdefault(schedule.weekday, {DailyOccupancy.MORNING: 0, DailyOccupancy.AFTERNOON: 0})
+            halves[schedule.half_day] += schedule.capacity
+        return capacity
+
+    @classmethod
+    def add_booked(cls, doctor_id, date, start_time, delta):
+        half_day = cls.half_day_of(start_time)
+        versioning.bump(doctor_id)
+        rows = cls.objects.filter(doctor_id=doctor_id, date=date, half_day=half_day)
+        if rows.update(booked=F('booked') + delta):
+            return
+        capacity = cls.weekday_capacity(doctor_id).get(date.weekday(), {}).get(half_day, 0)
+        cls.objects.get_or_create(doctor_id=doctor_id, date=date, half_day=half_day, defaults={'capacity': capacity})
+        rows.update(booked=F('booked') + delta)
+
+    @classmethod
+    def refresh_capacity(cls, doctor_id):
+        """Tính lại capacity của các ngày từ hôm nay trở đi sau khi lịch làm việc của bác sĩ đổi"""
+        versioning.bump(doctor_id)
+        capacity = cls.weekday_capacity(doctor_id)
+        rows = cls.objects.filter(doctor_id=doctor_id, date__gte=timezone.now().date())
+        for weekday in range(7):
+            halves = capacity.get(weekday, {})
+            for half_day, _ in cls.HALF_DAYS:
+                # __week_day: 1 = Chủ nhật ... 7 = Thứ bảy, còn DoctorSchedule.weekday: 0 = Thứ hai
+                rows.filter(date__week_day=(weekday + 1) % 7 + 1, half_day=half_day).exclude(
+                    capacity=halves.get(half_day, 0),
+                ).update(capacity=halves.get(half_day, 0))
+
+    @classmethod
+    def rebuild(cls, doctor_ids=None, start_date=None, end_date=None):
+        """
+        Tính lại toàn bộ bảng (hoặc các bác sĩ / khoảng ngày được chọn) từ AppointmentSlot và DoctorSchedule:
+        booked lấy bằng một GROUP BY trên slot. Trả về số dòng được ghi.
+        """
+        slots = AppointmentSlot.objects.all()
+        rows = cls.objects.all()
+        if doctor_ids:
+            slots = slots.filter(doctor_id__in=doctor_ids)
+            rows = rows.filter(doctor_id__in=doctor_ids)
+        if start_date:
+            slots = slots.filter(date__gte=start_date)
+            rows = rows.filter(date__gte=start_date)
+        if end_date:
+            slots = slots.filter(date__lte=end_date)
+            rows = rows.filter(date__lte=end_date)
+
+        booked = slots.annotate(
+            half=Case(When(start_time__lt=time(12), then=Value(cls.MORNING)), default=Value(cls.AFTERNOON)),
+        ).values('doctor_id', 'date', 'half').annotate(total=Sum('booked_count')).filter(total__gt=0)
+
+        capacities = {}
+        objs = []
+        for row in booked:
+            if row['doctor_id'] not in capacities:
+                capacities[row['doctor_id']] = cls.weekday_capacity(row['doctor_id'])
+            capacity = capacities[row['doctor_id']].get(row['date'].weekday(), {}).get(row['half'], 0)
+            objs.append(cls(
+                doctor_id=row['doctor_id'], date=row['date'], half_day=row['half'],
+                capacity=capacity, booked=row['total'],
+            ))
+        with transaction.atomic():
+            rows.delete()
+            cls.objects.bulk_create(objs, batch_size=1000)
+            for doctor_id in doctor_ids or [None]:
+                versioning.bump(doctor_id)
+        return len(objs)
+
+class UserDirectoryEntry(models.Model):
+    """
+    Bản sao tên bác sĩ/bệnh nhân của user_service để hiển thị, không phải nguồn dữ liệu gốc.
+    Được làm mới theo lô (directory.py, `manage.py refresh_user_directory`); người dùng đã bị xóa bên
+    user_service vẫn được giữ để các lịch hẹn cũ còn hiện tên.
+    """
+    user_id = models.IntegerField(unique=True)
+    role = models.CharField(max_length=20)
+    full_name = models.CharField(max_length=255)
+    department = models.CharField(max_length=100, blank=True, db_index=True)  # Chuyên khoa của bác sĩ
+    refreshed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.role} {self.user_id}: {self.full_name}"
+
+    @classmethod
+    def store(cls, users):
+        """Ghi đè (upsert) danh sách (user_id, role, full_name, department) lấy từ user_service"""
+        now = timezone.now()
+        cls.objects.bulk_create(
+            [
+                cls(user_id=user_id, role=role, full_name=full_name, department=department, refreshed_at=now)
+                for user_id, role, full_name, department in users
+            ],
+            batch_size=500, update_conflicts=True, unique_fields=['user_id'],
+            update_fields=['role', 'full_name', 'department', 'refreshed_at'],
+        )
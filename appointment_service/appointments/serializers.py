@@ -1,9 +1,12 @@
 from rest_framework import serializers
+from .directory import user_directory
 from .models import Appointment, AppointmentSlot, DoctorSchedule
 from django.utils import timezone
 from datetime import datetime, timedelta
 import pytz
 
+SLOT_FULL_MESSAGE = "Khung giờ này đã đầy, vui lòng chọn thời gian khác"
+
 class AppointmentSlotSerializer(serializers.ModelSerializer):
     availability_status = serializers.ReadOnlyField()
     is_available = serializers.ReadOnlyField()
@@ -119,12 +122,16 @@ class AppointmentSerializer(serializers.ModelSerializer):
             start_time=time_only,
             defaults={
                 'end_time': (datetime.combine(date_only, time_only) + timedelta(minutes=45)).time(),  # 45 minute slots
-                'max_appointments': schedule.max_patients_per_hour // 1  # Adjust based on your needs
+                # Cùng sức chứa với slot_grid (AvailableSlotsView, earliest-slots)
+                'max_appointments': schedule.slot_capacity,
             }
         )
         
-        if not slot.is_available:
-            raise serializers.ValidationError("Khung giờ này đã đầy, vui lòng chọn thời gian khác")
+        # Chỉ là kiểm tra sớm; chỗ được giữ thật sự bằng UPDATE có điều kiện trong Appointment.save()
+        # (lịch đổi giờ trong cùng slot thì không cần thêm chỗ)
+        same_slot = self.instance is not None and self.instance.appointment_slot_id == slot.pk
+        if not slot.is_available and not same_slot:
+            raise serializers.ValidationError(SLOT_FULL_MESSAGE)
         
         # Lưu slot để sử dụng trong create/update
         self.context['appointment_slot'] = slot
@@ -146,22 +153,15 @@ class AppointmentSerializer(serializers.ModelSerializer):
         if appointment_slot:
             appointment.appointment_slot = appointment_slot
         
-        # Thêm thông tin bổ sung từ các service khác nếu có
-        try:
-            appointment.patient_name = self.get_user_name(appointment.patient_id) or ""
-            appointment.doctor_name = self.get_user_name(appointment.doctor_id) or ""
-        except Exception as e:
-            # Nếu không lấy được thì bỏ qua, đây chỉ là cache
-            print(f"Warning: Could not fetch user names: {e}")
-            pass
+        # Tên lưu kèm lịch hẹn lấy từ danh bạ cục bộ (directory.py), không gọi user_service
+        names = user_directory.names([appointment.patient_id, appointment.doctor_id])
+        appointment.patient_name = names.get(appointment.patient_id, "")
+        appointment.doctor_name = names.get(appointment.doctor_id, "")
         
+        # Appointment.save() giữ chỗ trong slot bằng một UPDATE có điều kiện cùng transaction với INSERT,
+        # slot bị đặt hết sau validate() thì raise SlotFullError
         appointment.save()
         
-        # Update slot booking count if slot exists
-        if appointment_slot:
-            appointment_slot.booked_count += 1
-            appointment_slot.save()
-        
         return appointment
     
     def update(self, instance, validated_data):
@@ -171,25 +171,17 @@ class AppointmentSerializer(serializers.ModelSerializer):
             if scheduled_time.tzinfo is None:
                 scheduled_time = timezone.make_aware(scheduled_time, timezone.get_current_timezone())
                 validated_data['scheduled_time'] = scheduled_time
+
+        # Đổi giờ/bác sĩ thì chuyển sang slot mới; Appointment.save() chiếm chỗ slot mới và trả chỗ slot cũ
+        appointment_slot = self.context.get('appointment_slot')
+        if appointment_slot:
+            instance.appointment_slot = appointment_slot
         
         return super().update(instance, validated_data)
     
     def get_user_name(self, user_id):
-        """Gọi API user service để lấy tên người dùng"""
-        import requests
-        from django.conf import settings
-        
-        try:
-            # Use USER_SERVICE setting if available, otherwise fallback
-            user_service_url = getattr(settings, 'USER_SERVICE', 'http://localhost:8001')
-            response = requests.get(f"{user_service_url}/api/users/{user_id}/", timeout=2)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('full_name') or f"{data.get('first_name', '')} {data.get('last_name', '')}".strip()
-        except Exception as e:
-            print(f"Warning: Could not fetch user {user_id}: {e}")
-            pass
-        return None
+        """Tên người dùng từ danh bạ cục bộ (directory.py)"""
+        return user_directory.name(user_id)
 
 
 class DailyAvailabilitySerializer(serializers.Serializer):
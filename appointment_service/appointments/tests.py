@@ -0,0 +1,351 @@
+import datetime
+from unittest import mock, skipUnless
+
+import jwt
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .directory import UNKNOWN_SPECIALTY, UserDirectory, fetch_users, user_directory
+from .management.commands.check_query_plans import collect_plans, full_scans, plan_cases
+from .models import (
+    Appointment, AppointmentCounter, AppointmentSlot, DailyOccupancy, DoctorSchedule, SlotFullError, UserDirectoryEntry,
+)
+from .serializers import AppointmentSerializer
+from .views import (
+    AppointmentRows, decode_cursor, doctor_stats, doctor_stats_from_counters, encode_cursor, materialize_slots,
+    patient_stats, patient_stats_from_counters, slot_grid,
+)
+
+# Thứ hai
+MONDAY = datetime.date(2030, 1, 7)
+
+
+def make_schedule(doctor_id=1, start=(8, 0), end=(10, 0), weekday=0, **fields):
+    return DoctorSchedule.objects.create(
+        doctor_id=doctor_id, weekday=weekday, start_time=datetime.time(*start), end_time=datetime.time(*end), **fields,
+    )
+
+
+def make_slot(doctor_id=1, date=MONDAY, start=(8, 0), max_appointments=2, **fields):
+    start_time = datetime.time(*start)
+    end_time = (datetime.datetime.combine(date, start_time) + datetime.timedelta(minutes=30)).time()
+    return AppointmentSlot.objects.create(
+        doctor_id=doctor_id, date=date, start_time=start_time, end_time=end_time,
+        max_appointments=max_appointments, **fields,
+    )
+
+
+def book(slot, patient_id=10, **fields):
+    scheduled = timezone.make_aware(datetime.datetime.combine(slot.date, slot.start_time))
+    return Appointment.objects.create(
+        patient_id=patient_id, doctor_id=slot.doctor_id, scheduled_time=scheduled, appointment_slot=slot, **fields,
+    )
+
+
+def client_for(user_id, role='PATIENT'):
+    client = APIClient()
+    token = jwt.encode({'user_id': user_id, 'role': role}, settings.SECRET_KEY, algorithm='HS256')
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+# Danh bạ tên không tự làm mới từ user_service trong test (không có thread nền, không gọi HTTP)
+@mock.patch.object(user_directory, 'ttl', 0)
+class QueryPlanTests(TestCase):
+    """Các access path của app phải dùng index: không query nào có dòng `SCAN appointments_<bảng>`"""
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN của SQLite')
+    def test_no_full_table_scans(self):
+        failures = [
+            f"{name}: {', '.join(full_scans(plan))} ({sql})"
+            for name, plans in collect_plans(plan_cases())
+            for sql, plan in plans
+            if full_scans(plan)
+        ]
+        self.assertEqual(failures, [])
+
+
+class MaterializeSlotsTests(TestCase):
+    def test_missing_slots_inserted_in_one_query(self):
+        grid = slot_grid([make_schedule(max_patients_per_hour=4)], MONDAY, timezone.get_current_timezone())
+        self.assertEqual([(start.time(), capacity) for start, _, capacity in grid], [
+            (datetime.time(8, 0), 2), (datetime.time(8, 30), 2), (datetime.time(9, 0), 2), (datetime.time(9, 30), 2),
+        ])
+        AppointmentSlot.objects.create(
+            doctor_id=1, date=MONDAY, start_time=datetime.time(9, 0), end_time=datetime.time(9, 30),
+            max_appointments=2, booked_count=1,
+        )
+
+        with self.assertNumQueries(2):
+            slots = materialize_slots(1, MONDAY, grid)
+        self.assertEqual(len(slots), 4)
+        self.assertEqual(slots[datetime.time(9, 0)].booked_count, 1)
+        self.assertEqual(AppointmentSlot.objects.filter(doctor_id=1, date=MONDAY).count(), 4)
+
+        # Các slot đã có đủ: chỉ một SELECT
+        with self.assertNumQueries(1):
+            self.assertEqual(len(materialize_slots(1, MONDAY, grid)), 4)
+
+
+class DailyOccupancyTests(TestCase):
+    def occupancy(self):
+        return sorted(DailyOccupancy.objects.values_list('doctor_id', 'date', 'half_day', 'capacity', 'booked'))
+
+    def test_incremental_updates_match_rebuild(self):
+        make_schedule(start=(8, 0), end=(10, 0))
+        make_schedule(start=(13, 0), end=(14, 0))
+        morning, afternoon = make_slot(start=(8, 0)), make_slot(start=(13, 0))
+        book(morning, patient_id=10)
+        cancelled = book(morning, patient_id=11)
+        book(afternoon, patient_id=12)
+        cancelled.status = 'CANCELLED'
+        cancelled.save()
+
+        self.assertEqual(self.occupancy(), [(1, MONDAY, 'AM', 8, 1), (1, MONDAY, 'PM', 4, 1)])
+        incremental = self.occupancy()
+        self.assertEqual(DailyOccupancy.rebuild(), 2)
+        self.assertEqual(self.occupancy(), incremental)
+
+    def test_schedule_change_refreshes_capacity(self):
+        schedule = make_schedule(start=(8, 0), end=(10, 0))
+        # Ngày trong tương lai: refresh_capacity chỉ sửa các ngày từ hôm nay
+        book(make_slot(start=(8, 0)))
+        schedule.end_time = datetime.time(11, 0)
+        schedule.save()
+        self.assertEqual(DailyOccupancy.objects.get().capacity, 12)
+
+
+class CalendarDensityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def density(self):
+        response = APIClient().get('/api/appointments/calendar-density/', {'doctor_id': 1, 'year': 2030, 'month': 1})
+        self.assertEqual(response.status_code, 200)
+        return {day['date']: day for day in response.json()['days']}
+
+    def test_month_density_and_invalidation(self):
+        make_schedule(start=(8, 0), end=(10, 0))
+        slot = make_slot()
+        book(slot, patient_id=10)
+
+        days = self.density()
+        self.assertEqual(len(days), 31)
+        self.assertEqual(
+            {key: days['2030-01-07'][key] for key in ('booked', 'capacity', 'available', 'status')},
+            {'booked': 1, 'capacity': 8, 'available': 7, 'status': 'VACANT'},
+        )
+        self.assertEqual(days['2030-01-08']['status'], 'CLOSED')
+        self.assertEqual((days['2030-01-14']['booked'], days['2030-01-14']['capacity']), (0, 8))
+
+        # Lượt đặt mới đổi version của bác sĩ (khi commit) nên kết quả đã cache không được dùng lại
+        with self.captureOnCommitCallbacks(execute=True):
+            book(slot, patient_id=11)
+        self.assertEqual(self.density()['2030-01-07']['booked'], 2)
+
+
+class SlotBookingTests(TestCase):
+    def test_conditional_increment_never_overbooks(self):
+        slot = make_slot(max_appointments=1)
+        # Bản đọc trước đó (booked_count=0), giống hai request validate cùng lúc
+        stale = AppointmentSlot.objects.get(pk=slot.pk)
+
+        self.assertTrue(slot.add_booked(1))
+        self.assertFalse(stale.add_booked(1))
+        slot.refresh_from_db()
+        self.assertEqual(slot.booked_count, 1)
+        self.assertEqual(DailyOccupancy.objects.get().booked, 1)
+
+    def test_decrement_stops_at_zero(self):
+        slot = make_slot()
+        self.assertTrue(slot.add_booked(-1))
+        slot.refresh_from_db()
+        self.assertEqual(slot.booked_count, 0)
+        self.assertFalse(DailyOccupancy.objects.exists())
+
+    def test_full_slot_rejects_appointment(self):
+        slot = make_slot(max_appointments=1)
+        book(slot, patient_id=10)
+
+        with self.assertRaises(SlotFullError):
+            book(AppointmentSlot.objects.get(pk=slot.pk), patient_id=11)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+        # Hủy lịch trả chỗ cho slot
+        appointment = Appointment.objects.get()
+        appointment.status = 'CANCELLED'
+        appointment.save()
+        book(AppointmentSlot.objects.get(pk=slot.pk), patient_id=11)
+        self.assertEqual(AppointmentSlot.objects.get(pk=slot.pk).booked_count, 1)
+
+
+@override_settings(APPOINTMENT_STATS_COUNTERS=True)
+class StatsTests(TestCase):
+    def test_counters_match_aggregate(self):
+        today = timezone.localdate()
+        now = timezone.now()
+        appointments = ((10, 'PENDING', 0), (10, 'COMPLETED', -3), (11, 'CONFIRMED', 2), (12, 'CANCELLED', 5))
+        for patient_id, status, days in appointments:
+            Appointment.objects.create(
+                patient_id=patient_id, doctor_id=1, status=status, scheduled_time=now + datetime.timedelta(days=days),
+            )
+        moved = Appointment.objects.get(patient_id=11)
+        moved.status = 'COMPLETED'
+        moved.save()
+        Appointment.objects.get(patient_id=12).delete()
+
+        with self.assertNumQueries(1):
+            stats = doctor_stats(1, today)
+        self.assertEqual(stats, {
+            'total_appointments': 3, 'total_patients': 2, 'completed_appointments': 2,
+            'pending_reports': 1, 'todays_appointments': 1,
+        })
+        self.assertEqual(doctor_stats_from_counters(1, today), stats)
+        self.assertEqual(patient_stats_from_counters(10, now), patient_stats(10, now))
+
+        def counters():
+            # Bộ đếm về 0 (lịch đã bị xóa) vẫn còn dòng, rebuild thì không tạo
+            return sorted(AppointmentCounter.objects.exclude(total=0).values_list(
+                'role', 'user_id', 'total', 'pending', 'confirmed', 'cancelled', 'completed', 'patients',
+            ))
+
+        incremental = counters()
+        AppointmentCounter.rebuild()
+        self.assertEqual(counters(), incremental)
+
+
+@mock.patch.object(user_directory, 'ttl', 0)
+class AppointmentListPaginationTests(TestCase):
+    def test_cursor_round_trip(self):
+        scheduled = timezone.make_aware(datetime.datetime(2030, 1, 7, 8, 30))
+        self.assertEqual(decode_cursor(encode_cursor(scheduled, 42)), (scheduled, 42))
+        # Cursor không phải base64, bị cắt, hoặc có thời gian không kèm timezone
+        naive = encode_cursor(scheduled.replace(tzinfo=None), 42)
+        for cursor in ('not-base64!', encode_cursor(scheduled, 42)[:-4], naive):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_keyset_pages_cover_every_appointment_once(self):
+        start = timezone.make_aware(datetime.datetime(2030, 1, 7, 8, 0))
+        # Nhiều lịch cùng scheduled_time: thứ tự trong trang do id quyết định
+        for i in range(7):
+            Appointment.objects.create(
+                patient_id=10, doctor_id=1, scheduled_time=start + datetime.timedelta(hours=i // 3),
+            )
+        client = client_for(10)
+
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 3, **({'cursor': cursor} if cursor else {})}
+            page = client.get('/api/appointments/', params).json()
+            seen += [row['id'] for row in page['results']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(Appointment.objects.order_by('scheduled_time', 'id').values_list('id', flat=True)))
+        self.assertEqual(client.get('/api/appointments/', {'limit': 3, 'cursor': 'bad'}).status_code, 400)
+
+    def test_values_rows_match_serializer(self):
+        appointment = Appointment.objects.create(
+            patient_id=10, doctor_id=1, scheduled_time=timezone.make_aware(datetime.datetime(2030, 1, 7, 8, 0)),
+            reason='Khám định kỳ',
+        )
+        rows = AppointmentRows()
+        row = rows.values(Appointment.objects.filter(pk=appointment.pk)).get()
+        self.assertEqual(rows.serialize(row), dict(AppointmentSerializer(appointment).data))
+
+        with self.assertRaises(ValueError):
+            AppointmentRows(['id', 'password'])
+
+
+def user_service_response(users):
+    response = mock.Mock()
+    response.json.return_value = users
+    return response
+
+
+class UserDirectoryTests(TestCase):
+    doctors = [
+        {'id': 1, 'full_name': 'BS. An', 'specialty': 'Tim mạch'},
+        {'id': 2, 'first_name': 'Bình', 'last_name': 'Trần', 'specialty': UNKNOWN_SPECIALTY},
+    ]
+    patients = [{'id': 10, 'username': 'patient10'}, {'id': None, 'full_name': 'Không có id'}]
+
+    def fetch(self, url, timeout):
+        return user_service_response(self.doctors if 'doctors' in url else self.patients)
+
+    def test_fetch_users(self):
+        with mock.patch('appointments.directory.requests.get', side_effect=self.fetch):
+            self.assertEqual(fetch_users(), [
+                (1, 'DOCTOR', 'BS. An', 'Tim mạch'), (2, 'DOCTOR', 'Bình Trần', ''), (10, 'PATIENT', 'patient10', ''),
+            ])
+
+    def test_names_served_without_calling_user_service(self):
+        directory = UserDirectory(ttl=0)
+        with mock.patch('appointments.directory.requests.get', side_effect=self.fetch):
+            self.assertEqual(directory.refresh(), 3)
+        self.assertEqual(directory.doctor_ids('Tim mạch'), [1])
+
+        with mock.patch('appointments.directory.requests.get') as get, self.assertNumQueries(0):
+            self.assertEqual(directory.names([1, 10]), {1: 'BS. An', 10: 'patient10'})
+        get.assert_not_called()
+
+        # Process khác đã làm mới bảng: id chưa có trong dict được đọc từ bảng bằng một query
+        UserDirectoryEntry.store([(3, 'DOCTOR', 'BS. Cường', 'Nhi')])
+        with self.assertNumQueries(1):
+            self.assertEqual(directory.names([1, 3, 99]), {1: 'BS. An', 3: 'BS. Cường'})
+
+    def test_refresh_failure_keeps_stored_names(self):
+        UserDirectoryEntry.store([(1, 'DOCTOR', 'BS. An', '')])
+        directory = UserDirectory(ttl=0)
+        with mock.patch('appointments.directory.requests.get', side_effect=requests.ConnectionError):
+            with self.assertRaises(requests.ConnectionError):
+                directory.refresh()
+        directory.reload()
+        self.assertEqual(directory.name(1), 'BS. An')
+
+
+@mock.patch.object(user_directory, 'ttl', 0)
+class EarliestSlotsTests(TestCase):
+    def setUp(self):
+        # 2 bệnh nhân mỗi giờ, slot 30 phút: mỗi slot một bệnh nhân
+        make_schedule(doctor_id=1, start=(8, 0), end=(10, 0), max_patients_per_hour=2)
+        make_schedule(doctor_id=2, start=(8, 30), end=(9, 30), max_patients_per_hour=2)
+        book(make_slot(doctor_id=1, start=(8, 0), max_appointments=1))
+        UserDirectoryEntry.store([(1, 'DOCTOR', 'BS. An', 'Nội'), (2, 'DOCTOR', 'BS. Bình', 'Tim mạch')])
+
+    def earliest(self, **params):
+        response = client_for(10).get('/api/appointments/earliest-slots/', {
+            'start_date': '2030-01-07', 'end_date': '2030-01-08', **params,
+        })
+        self.assertEqual(response.status_code, 200)
+        return [
+            (slot['start_time'][11:16], slot['doctor_id'], slot['booked_count']) for slot in response.json()['slots']
+        ]
+
+    def test_merges_doctors_in_time_order_and_skips_full_slots(self):
+        self.assertEqual(self.earliest(doctor_ids='1,2', limit=4), [
+            ('08:30', 1, 0), ('08:30', 2, 0), ('09:00', 1, 0), ('09:00', 2, 0),
+        ])
+        # Slot 08:00 của bác sĩ 1 đã đầy; buổi sáng vẫn còn chỗ nên các slot khác vẫn được trả
+        self.assertEqual(self.earliest(doctor_ids='1', limit=1), [('08:30', 1, 0)])
+
+    def test_department_filter_uses_directory(self):
+        response = client_for(10).get('/api/appointments/earliest-slots/', {
+            'department': 'Tim mạch', 'start_date': '2030-01-07', 'limit': 1,
+        })
+        self.assertEqual(response.json()['doctor_ids'], [2])
+        self.assertEqual(response.json()['slots'][0]['doctor_name'], 'BS. Bình')
+
+    def test_invalid_parameters(self):
+        client = client_for(10)
+        for params in ({}, {'doctor_ids': '1,x'}, {'doctor_ids': '1', 'limit': 0},
+                       {'doctor_ids': '1', 'start_date': '2030-01-01', 'end_date': '2030-06-01'}):
+            with self.subTest(params=params):
+                self.assertEqual(client.get('/api/appointments/earliest-slots/', params).status_code, 400)
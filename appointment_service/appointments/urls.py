@@ -7,7 +7,9 @@ urlpatterns = [
     path('<int:pk>/', AppointmentDetailView.as_view()),
     path('schedules/', DoctorScheduleView.as_view()),
     path('available-slots/', AvailableSlotsView.as_view()),
+    path('earliest-slots/', EarliestAvailableSlotsView.as_view()),
     path('daily-availability/', DailyAvailabilityView.as_view()),
+    path('calendar-density/', CalendarDensityView.as_view()),
     path('patient-calendar/', PatientAppointmentCalendarView.as_view()),
     # Dashboard statistics endpoints
     path('stats/doctor/<int:doctor_id>/', DoctorStatsView.as_view(), name='doctor-stats'),
@@ -0,0 +1,45 @@
+"""
+Version của dữ liệu lịch theo bác sĩ, dùng làm một phần của cache key cho các API chỉ đọc (calendar-density).
+
+Mỗi khi số lượt đặt hoặc lịch làm việc của bác sĩ đổi, version được tăng sau khi transaction commit, nên
+các entry cũ không bao giờ được đọc lại và tự hết hạn theo timeout, không cần xóa từng key.
+Version nằm trong cache của Django (settings.CACHES): với cache dùng chung (REDIS_URL) việc invalidate có hiệu lực
+cho mọi process; cache mặc định LocMem là riêng của từng process.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+GLOBAL_KEY = 'occupancy_version'
+
+
+def _key(doctor_id):
+    return f'{GLOBAL_KEY}:{doctor_id}'
+
+
+def _get(key):
+    version = cache.get(key)
+    if version is None:
+        # Version mới khởi tạo (hoặc bị cache đẩy ra) lấy theo thời gian để không trùng version cũ
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def get_version(doctor_id):
+    """Version hiện tại của bác sĩ, gồm cả version chung (đổi khi rebuild toàn bộ)"""
+    return f'{_get(GLOBAL_KEY)}.{_get(_key(doctor_id))}'
+
+
+def bump(doctor_id=None):
+    """Tăng version của bác sĩ (None: của mọi bác sĩ) khi transaction hiện tại commit"""
+    key = GLOBAL_KEY if doctor_id is None else _key(doctor_id)
+    transaction.on_commit(lambda: _bump(key))
@@ -2,16 +2,32 @@
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import ISO_8601, serializers, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.settings import api_settings
 from .authentication import MicroserviceJWTAuthentication
-from .models import Appointment, AppointmentSlot, DoctorSchedule
-from .serializers import AppointmentSerializer, AppointmentSlotSerializer, DoctorScheduleSerializer, DailyAvailabilitySerializer
+from .models import Appointment, AppointmentCounter, AppointmentSlot, DailyOccupancy, DoctorSchedule, SlotFullError
+from . import versioning
+from .directory import user_directory
+from .serializers import (
+    SLOT_FULL_MESSAGE, AppointmentSerializer, AppointmentSlotSerializer, DoctorScheduleSerializer,
+    DailyAvailabilitySerializer,
+)
 import jwt
 from django.conf import settings
-from django.db.models import Count, Q, Sum, F, FloatField
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum, F, FloatField, Max
 from django.db.models.functions import Cast
+from django.utils import timezone as django_timezone
+from django.utils.http import parse_etags
+import base64
+import binascii
+import calendar
 import datetime
+import hashlib
+import heapq
+import itertools
+import json
 import requests
 from collections import defaultdict
 
@@ -32,6 +48,103 @@ def send_notification(user_id, message):
         print(f"⚠️ Không thể gửi notify: {e}")
 
 
+def appointment_list_etag(qs, *key):
+    """
+    ETag của một danh sách lịch hẹn tính từ version của dữ liệu: số lịch và updated_at mới nhất
+    (một query aggregate), không cần load các bản ghi.
+    Thêm/xóa lịch làm đổi số lượng, sửa lịch làm đổi updated_at (auto_now).
+    """
+    version = qs.aggregate(count=Count('id'), last_updated=Max('updated_at'))
+    last_updated = version['last_updated'].isoformat() if version['last_updated'] else ''
+    raw = '|'.join(str(part) for part in key + (version['count'], last_updated))
+    return '"%s"' % hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def etag_matches(request, etag):
+    candidates = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in candidates or any(c.removeprefix('W/') == etag for c in candidates)
+
+
+def day_range(day):
+    """[đầu ngày, đầu ngày hôm sau) theo timezone hiện tại: tương đương __date=day nhưng dùng được index"""
+    start = django_timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    return start, start + datetime.timedelta(days=1)
+
+
+def encode_cursor(scheduled_time, pk):
+    raw = json.dumps([scheduled_time.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(scheduled_time, id) của lịch cuối trang trước, ValueError nếu cursor không hợp lệ"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        scheduled_time, pk = json.loads(raw)
+        scheduled_time = datetime.datetime.fromisoformat(scheduled_time)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f'cursor không hợp lệ: {cursor}') from e
+    if scheduled_time.tzinfo is None or not isinstance(pk, int):
+        raise ValueError(f'cursor không hợp lệ: {cursor}')
+    return scheduled_time, pk
+
+
+class AppointmentRows:
+    """
+    Serialize lịch hẹn từ .values() thay vì model instance + AppointmentSerializer: cùng tên field và cùng
+    định dạng output (datetime được format bằng chính field của serializer), nhưng không dựng object nào.
+    """
+    def __init__(self, fields=None):
+        serializer_fields = AppointmentSerializer().fields
+        names = list(serializer_fields)
+        if fields:
+            unknown = [name for name in fields if name not in serializer_fields]
+            if unknown:
+                raise ValueError(f"field không hợp lệ: {', '.join(unknown)}")
+            names = [name for name in names if name in fields]
+        self.names = names
+        # Tên cột trong .values(): FK được lấy theo id, không join
+        self.columns = [
+            name + '_id' if isinstance(serializer_fields[name], serializers.RelatedField) else name
+            for name in names
+        ]
+        self.datetimes = {
+            column: self.datetime_formatter(serializer_fields[name])
+            for name, column in zip(names, self.columns)
+            if isinstance(serializer_fields[name], serializers.DateTimeField)
+        }
+
+    @staticmethod
+    def datetime_formatter(field):
+        """
+        Định dạng ISO 8601 giống DateTimeField.to_representation của DRF (đổi sang timezone hiện tại, '+00:00' -> 'Z')
+        nhưng không tra settings cho từng giá trị; format khác thì dùng luôn field của serializer
+        """
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if output_format is None or output_format.lower() != ISO_8601:
+            return field.to_representation
+        tz = django_timezone.get_current_timezone() if settings.USE_TZ else None
+
+        def to_iso(value):
+            if tz is not None and django_timezone.is_aware(value):
+                value = value.astimezone(tz)
+            value = value.isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return to_iso
+
+    def values(self, qs, *extra):
+        return qs.values(*dict.fromkeys(self.columns + list(extra)))
+
+    def serialize(self, row):
+        data = {}
+        for name, column in zip(self.names, self.columns):
+            value = row[column]
+            if value is not None and column in self.datetimes:
+                value = self.datetimes[column](value)
+            data[name] = value
+        return data
+
+
 class AppointmentCreateView(APIView):
     """
     POST /api/appointments/create/
@@ -91,7 +204,11 @@ class AppointmentCreateView(APIView):
 
             serializer = AppointmentSerializer(data=data, context={'request': request})
             if serializer.is_valid():
-                appointment = serializer.save()
+                try:
+                    appointment = serializer.save()
+                except SlotFullError:
+                    # Slot bị request khác đặt hết giữa validate() và lúc ghi
+                    return Response({"non_field_errors": [SLOT_FULL_MESSAGE]}, status=400)
                 
                 print(f"✅ Appointment created successfully: {appointment.id}")
                 
@@ -189,6 +306,12 @@ class AppointmentListView(APIView):
     GET /api/appointments/?role=DOCTOR
     
     Header: Authorization: Bearer <your_token>
+
+    Tham số thêm (không bắt buộc):
+        status, date    lọc theo trạng thái / ngày (YYYY-MM-DD)
+        fields          chỉ trả các field này, vd fields=id,scheduled_time,status
+        limit, cursor   phân trang keyset theo (scheduled_time, id): trả {"results": [...], "next_cursor": ...},
+                        gửi lại next_cursor để lấy trang tiếp. Không có limit/cursor thì trả cả danh sách như cũ
     """
     authentication_classes = [MicroserviceJWTAuthentication]  # Sử dụng custom auth
     permission_classes = [IsAuthenticated]
@@ -198,68 +321,89 @@ class AppointmentListView(APIView):
             user = request.user
             user_id = user.id
             
-            print(f"🔍 Debug - Authenticated user_id: {user_id}")
-            print(f"🔍 Debug - User role: {getattr(user, 'role', 'N/A')}")
-            print(f"🔍 Debug - User email: {getattr(user, 'email', 'N/A')}")
-            print(f"🔍 Debug - Request params: {request.query_params}")
-            print(f"🔍 Debug - Auth header: {request.headers.get('Authorization', 'No auth header')}")
-            
             # Lấy role từ query params hoặc từ user object
             role = request.query_params.get('role')
             if not role:
                 # Fallback to user role from token
                 role = getattr(user, 'role', 'PATIENT')
             
-            print(f"🔍 Debug - Using role: {role}")
-            
             # Lọc theo trạng thái nếu có
             status_filter = request.query_params.get('status')
             date_filter = request.query_params.get('date')
-            
-            # Base queryset
-            qs = Appointment.objects.all()
-            print(f"🔍 Debug - Total appointments in DB: {qs.count()}")
+            fields_param = request.query_params.get('fields')
+            limit_param = request.query_params.get('limit')
+            cursor = request.query_params.get('cursor')
             
             # Lọc lịch hẹn dựa trên role và user_id từ token
             if role.upper() == 'PATIENT':
-                qs = qs.filter(patient_id=user_id)
-                print(f"🔍 Debug - Filtering by patient_id={user_id}")
+                qs = Appointment.objects.filter(patient_id=user_id)
             elif role.upper() == 'DOCTOR':
-                qs = qs.filter(doctor_id=user_id)
-                print(f"🔍 Debug - Filtering by doctor_id={user_id}")
+                qs = Appointment.objects.filter(doctor_id=user_id)
             else:
                 return Response(
                     {"error": "Role phải là PATIENT hoặc DOCTOR"},
                     status=400
                 )
             
-            print(f"🔍 Debug - After role filtering: {qs.count()}")
-            
             # Lọc theo status nếu có
             if status_filter:
                 qs = qs.filter(status=status_filter.upper())
-                print(f"🔍 Debug - After status filtering: {qs.count()}")
             
             # Lọc theo ngày nếu có
             if date_filter:
                 try:
                     date_obj = datetime.datetime.strptime(date_filter, '%Y-%m-%d').date()
-                    qs = qs.filter(scheduled_time__date=date_obj)
-                    print(f"🔍 Debug - After date filtering: {qs.count()}")
                 except ValueError:
                     return Response({"error": "Định dạng ngày không hợp lệ (YYYY-MM-DD)"}, status=400)
-            
-            # Sắp xếp theo thời gian
-            qs = qs.order_by('scheduled_time')
-            
-            print(f"🔍 Debug - Final queryset count: {qs.count()}")
-            
-            # Debug: In ra vài appointment đầu tiên
-            for apt in qs[:3]:
-                print(f"🔍 Debug - Appointment {apt.id}: patient_id={apt.patient_id}, doctor_id={apt.doctor_id}")
-            
-            serializer = AppointmentSerializer(qs, many=True)
-            return Response(serializer.data)
+                start, end = day_range(date_obj)
+                qs = qs.filter(scheduled_time__gte=start, scheduled_time__lt=end)
+
+            try:
+                rows = AppointmentRows([f for f in fields_param.split(',') if f] if fields_param else None)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+
+            paginate = limit_param is not None or cursor is not None
+            limit = None
+            if paginate:
+                try:
+                    limit = int(limit_param) if limit_param is not None else settings.APPOINTMENT_LIST_PAGE_SIZE
+                    if limit < 1:
+                        raise ValueError
+                except ValueError:
+                    return Response({"error": "limit không hợp lệ"}, status=400)
+                limit = min(limit, settings.APPOINTMENT_LIST_MAX_PAGE_SIZE)
+            
+            # Danh sách không đổi so với bản client đang có: trả 304, không query và serialize lại
+            etag = appointment_list_etag(
+                qs, user_id, role.upper(), status_filter, date_filter, fields_param, limit, cursor,
+            )
+            if etag_matches(request, etag):
+                return Response(status=304, headers={'ETag': etag})
+
+            # Sắp xếp theo thời gian, id để thứ tự ổn định cho phân trang keyset
+            qs = qs.order_by('scheduled_time', 'id')
+            if not paginate:
+                data = [rows.serialize(row) for row in rows.values(qs)]
+                return Response(data, headers={'ETag': etag})
+
+            if cursor:
+                try:
+                    after_time, after_id = decode_cursor(cursor)
+                except ValueError as e:
+                    return Response({"error": str(e)}, status=400)
+                qs = qs.filter(
+                    Q(scheduled_time__gt=after_time) | Q(scheduled_time=after_time, id__gt=after_id)
+                )
+            page = list(rows.values(qs, 'scheduled_time', 'id')[:limit + 1])
+            next_cursor = None
+            if len(page) > limit:
+                page = page[:limit]
+                next_cursor = encode_cursor(page[-1]['scheduled_time'], page[-1]['id'])
+            return Response({
+                'results': [rows.serialize(row) for row in page],
+                'next_cursor': next_cursor,
+            }, headers={'ETag': etag})
             
         except Exception as e:
             print(f"Error in AppointmentListView: {str(e)}")
@@ -290,18 +434,13 @@ class AppointmentDetailView(APIView):
         except Appointment.DoesNotExist:
             return Response({'error': 'Không tìm thấy lịch'}, status=404)
 
-        # Nếu thay đổi slot thì giải phóng slot cũ
-        old_slot = appt.appointment_slot
-        
         serializer = AppointmentSerializer(appt, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
-            # Nếu đổi scheduled_time thì cần cập nhật slot
-            if 'scheduled_time' in request.data and old_slot:
-                # Giảm đếm slot cũ
-                old_slot.booked_count = max(0, old_slot.booked_count - 1)
-                old_slot.save()
-            
-            updated_appt = serializer.save()
+            # Đổi giờ thì Appointment.save() chuyển lượt đặt từ slot cũ sang slot mới trong một transaction
+            try:
+                updated_appt = serializer.save()
+            except SlotFullError:
+                return Response({"non_field_errors": [SLOT_FULL_MESSAGE]}, status=400)
             
             # Thông báo thay đổi lịch nếu cần
             if 'scheduled_time' in request.data or 'status' in request.data:
@@ -357,6 +496,47 @@ class DoctorScheduleView(APIView):
         return Response(serializer.errors, status=400)
 
 
+def slot_grid(schedules, date_obj, tz):
+    """
+    Các slot trong ngày tính từ lịch làm việc, không cần query:
+    [(giờ bắt đầu, giờ kết thúc, số bệnh nhân tối đa)] theo thứ tự của schedules
+    """
+    grid = []
+    for schedule in schedules:
+        duration = datetime.timedelta(minutes=schedule.appointment_duration)
+        max_appointments = schedule.slot_capacity
+        current = django_timezone.make_aware(datetime.datetime.combine(date_obj, schedule.start_time), tz)
+        end = django_timezone.make_aware(datetime.datetime.combine(date_obj, schedule.end_time), tz)
+        while current + duration <= end:
+            grid.append((current, current + duration, max_appointments))
+            current += duration
+    return grid
+
+
+def materialize_slots(doctor_id, date_obj, grid):
+    """
+    AppointmentSlot cho mọi slot trong grid, theo giờ bắt đầu.
+    Một query lấy các slot đã có, các slot còn thiếu được insert bằng một bulk_create;
+    ignore_conflicts để request chạy đồng thời tạo trùng slot không bị lỗi unique.
+    """
+    slots = {
+        slot.start_time: slot
+        for slot in AppointmentSlot.objects.filter(doctor_id=doctor_id, date=date_obj)
+    }
+    missing = {}
+    for start, end, max_appointments in grid:
+        start_time = start.time()
+        if start_time not in slots and start_time not in missing:
+            missing[start_time] = AppointmentSlot(
+                doctor_id=doctor_id, date=date_obj, start_time=start_time, end_time=end.time(),
+                max_appointments=max_appointments,
+            )
+    if missing:
+        AppointmentSlot.objects.bulk_create(missing.values(), ignore_conflicts=True)
+        slots.update(missing)
+    return slots
+
+
 class AvailableSlotsView(APIView):
     """
     API lấy các slot còn trống cho bác sĩ
@@ -367,101 +547,60 @@ class AvailableSlotsView(APIView):
     permission_classes = [IsAuthenticated]  # Thêm dòng này
     
     def get(self, request):
+        doctor_id = request.query_params.get('doctor_id')
+        date_str = request.query_params.get('date')
+
+        if not doctor_id:
+            return Response({"error": "Thiếu doctor_id"}, status=400)
+        if not doctor_id.isdigit():
+            return Response({"error": "doctor_id không hợp lệ"}, status=400)
+
+        if not date_str:
+            date_obj = django_timezone.now().date()
+        else:
+            try:
+                date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+            except ValueError:
+                return Response({"error": "Định dạng ngày không hợp lệ (YYYY-MM-DD)"}, status=400)
+
         try:
-            from django.utils import timezone as django_timezone
-            from datetime import timedelta
-            
-            print(f"🔍 AvailableSlotsView - Request params: {dict(request.query_params)}")
-            print(f"🔍 AvailableSlotsView - User: {request.user}")
-            
-            doctor_id = request.query_params.get('doctor_id')
-            date_str = request.query_params.get('date')
-            
-            if not doctor_id:
-                return Response({"error": "Thiếu doctor_id"}, status=400)
-                
-            if not date_str:
-                date_obj = django_timezone.now().date()
-            else:
-                try:
-                    date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-                except ValueError:
-                    return Response({"error": "Định dạng ngày không hợp lệ (YYYY-MM-DD)"}, status=400)
-            
-            print(f"🔍 Looking for schedules for doctor_id: {doctor_id}, date: {date_obj}")
-            
-            # Lấy lịch làm việc của bác sĩ vào ngày đó
-            weekday = date_obj.weekday()
-            schedules = DoctorSchedule.objects.filter(
+            # Lịch làm việc của bác sĩ vào thứ đó trong tuần
+            schedules = list(DoctorSchedule.objects.filter(
                 doctor_id=doctor_id,
-                weekday=weekday,
+                weekday=date_obj.weekday(),
                 is_active=True
-            ).order_by('start_time')
-            
-            print(f"🔍 Found {schedules.count()} schedules for weekday {weekday}")
-            
-            if not schedules.exists():
+            ).order_by('start_time'))
+
+            if not schedules:
                 return Response({
                     "doctor_id": doctor_id,
                     "date": date_str or date_obj.strftime('%Y-%m-%d'),
                     "message": f"Bác sĩ không có lịch làm việc vào ngày {date_str}",
                     "slots": []
                 })
-            
-            # Tạo các slot từ lịch làm việc
+
+            # Số query cố định: lịch làm việc, các slot đã có, một bulk insert cho slot còn thiếu
+            grid = slot_grid(schedules, date_obj, django_timezone.get_current_timezone())
+            slots = materialize_slots(int(doctor_id), date_obj, grid)
+
             all_slots = []
-            current_tz = django_timezone.get_current_timezone()
-            
-            for schedule in schedules:
-                print(f"🔍 Processing schedule: {schedule.start_time} - {schedule.end_time}")
-                
-                # Create timezone-aware datetime objects
-                start_datetime = datetime.datetime.combine(date_obj, schedule.start_time)
-                end_datetime = datetime.datetime.combine(date_obj, schedule.end_time)
-                
-                # Make timezone-aware
-                start_datetime = django_timezone.make_aware(start_datetime, current_tz)
-                end_datetime = django_timezone.make_aware(end_datetime, current_tz)
-                
-                duration = schedule.appointment_duration  # phút
-                
-                current = start_datetime
-                while current + timedelta(minutes=duration) <= end_datetime:
-                    slot_end = current + timedelta(minutes=duration)
-                    
-                    # Kiểm tra slot này có đặt được không
-                    slot, created = AppointmentSlot.objects.get_or_create(
-                        doctor_id=doctor_id,
-                        date=date_obj,
-                        start_time=current.time(),
-                        defaults={
-                            'end_time': slot_end.time(),
-                            'max_appointments': max(1, schedule.max_patients_per_hour // (60 // duration))
-                        }
-                    )
-                    
-                    if created:
-                        print(f"🔍 Created new slot: {current.time()} - {slot_end.time()}")
-                    
-                    all_slots.append({
-                        'start_time': current.isoformat(),  # ISO format with timezone
-                        'end_time': slot_end.isoformat(),   # ISO format with timezone
-                        'is_available': slot.is_available,
-                        'availability_status': slot.availability_status,
-                        'booked_count': slot.booked_count,
-                        'max_appointments': slot.max_appointments
-                    })
-                    
-                    current += timedelta(minutes=duration)
-            
-            print(f"🔍 Generated {len(all_slots)} slots")
-            
+            for start, end, _ in grid:
+                slot = slots[start.time()]
+                all_slots.append({
+                    'start_time': start.isoformat(),  # ISO format with timezone
+                    'end_time': end.isoformat(),      # ISO format with timezone
+                    'is_available': slot.is_available,
+                    'availability_status': slot.availability_status,
+                    'booked_count': slot.booked_count,
+                    'max_appointments': slot.max_appointments
+                })
+
             return Response({
                 "doctor_id": doctor_id,
                 "date": date_str or date_obj.strftime('%Y-%m-%d'),
                 "slots": all_slots
             })
-            
+
         except Exception as e:
             print(f"❌ Error in AvailableSlotsView: {str(e)}")
             import traceback
@@ -471,6 +610,175 @@ class AvailableSlotsView(APIView):
             }, status=500)
 
 
+def booked_slots_loader(doctor_ids):
+    """
+    Hàm (doctor_id, date) -> {start_time: (booked_count, max_appointments)} của các slot đã có lượt đặt.
+    Mỗi ngày chỉ một query cho mọi bác sĩ trong doctor_ids (các stream của heap merge đi qua cùng các ngày).
+    """
+    loaded = {}
+
+    def load(doctor_id, date_obj):
+        if date_obj not in loaded:
+            by_doctor = loaded[date_obj] = defaultdict(dict)
+            for doctor, start_time, count, maximum in AppointmentSlot.objects.filter(
+                doctor_id__in=doctor_ids, date=date_obj, booked_count__gt=0,
+            ).values_list('doctor_id', 'start_time', 'booked_count', 'max_appointments'):
+                by_doctor[doctor][start_time] = (count, maximum)
+        return loaded[date_obj].get(doctor_id, {})
+    return load
+
+
+def open_slots(doctor_id, schedules, occupancy, booked_slots, start_date, end_date, now, tz):
+    """
+    Các slot còn chỗ của một bác sĩ theo thứ tự thời gian, sinh dần từng ngày:
+    (giờ bắt đầu, doctor_id, giờ kết thúc, booked_count, max_appointments).
+    schedules: {weekday: [DoctorSchedule]}, occupancy: {(date, half_day): (booked, capacity)} từ DailyOccupancy.
+    Buổi chưa có lượt đặt thì mọi slot đều trống, buổi đã kín thì bỏ qua, không cần query; chỉ buổi đã có lượt
+    đặt mới phải xem booked_count của từng slot (booked_slots_loader).
+    """
+    current = start_date
+    while current <= end_date:
+        day_schedules = schedules.get(current.weekday())
+        for start, end, max_appointments in sorted(slot_grid(day_schedules or [], current, tz)):
+            if start <= now:
+                continue
+            booked_in_half, capacity = occupancy.get((current, DailyOccupancy.half_day_of(start.time())), (0, 0))
+            if not booked_in_half:
+                yield start, doctor_id, end, 0, max_appointments
+                continue
+            if capacity and booked_in_half >= capacity:
+                continue
+            count, max_appointments = booked_slots(doctor_id, current).get(start.time(), (0, max_appointments))
+            if count < max_appointments:
+                yield start, doctor_id, end, count, max_appointments
+        current += datetime.timedelta(days=1)
+
+
+class EarliestAvailableSlotsView(APIView):
+    """
+    API tìm N slot còn trống sớm nhất trên nhiều bác sĩ, theo chuyên khoa hoặc danh sách bác sĩ
+
+    GET /api/appointments/earliest-slots/?department=Tim mạch&limit=5
+    GET /api/appointments/earliest-slots/?doctor_ids=12,15,20&start_date=2025-05-01&end_date=2025-05-31&limit=3
+
+    Mỗi bác sĩ là một stream slot còn chỗ theo thời gian (open_slots), các stream được trộn bằng heap
+    (heapq.merge) và dừng sau N slot: chi phí theo số slot phải đi qua để có N kết quả, không theo cả lưới
+    bác sĩ x ngày. Số query: danh sách bác sĩ (khi lọc theo chuyên khoa), lịch làm việc, DailyOccupancy,
+    cộng một query cho mỗi ngày có buổi đã có lượt đặt mà các stream đi qua.
+    """
+    authentication_classes = [MicroserviceJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    DEFAULT_LIMIT = 5
+    MAX_LIMIT = 50
+
+    def get(self, request):
+        department = request.query_params.get('department')
+        doctor_ids_param = request.query_params.get('doctor_ids')
+        start_date_str = request.query_params.get('start_date')
+        end_date_str = request.query_params.get('end_date')
+
+        today = django_timezone.localdate()
+        start_date = today
+        end_date = today + datetime.timedelta(days=30)
+
+        if start_date_str:
+            try:
+                start_date = datetime.datetime.strptime(start_date_str, '%Y-%m-%d').date()
+            except ValueError:
+                return Response({"error": "Định dạng start_date không hợp lệ (YYYY-MM-DD)"}, status=400)
+            if not end_date_str:
+                end_date = start_date + datetime.timedelta(days=30)
+
+        if end_date_str:
+            try:
+                end_date = datetime.datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            except ValueError:
+                return Response({"error": "Định dạng end_date không hợp lệ (YYYY-MM-DD)"}, status=400)
+
+        if (end_date - start_date).days > 60:
+            return Response({"error": "Khoảng thời gian không được vượt quá 60 ngày"}, status=400)
+
+        try:
+            limit = int(request.query_params.get('limit', self.DEFAULT_LIMIT))
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "limit không hợp lệ"}, status=400)
+        limit = min(limit, self.MAX_LIMIT)
+
+        if doctor_ids_param:
+            parts = [part.strip() for part in doctor_ids_param.split(',') if part.strip()]
+            if not parts or not all(part.isdigit() for part in parts):
+                return Response({"error": "doctor_ids không hợp lệ"}, status=400)
+            doctor_ids = sorted({int(part) for part in parts})
+        elif department:
+            # Chuyên khoa của bác sĩ lấy từ danh bạ cục bộ (directory.py), không gọi user_service
+            doctor_ids = user_directory.doctor_ids(department)
+        else:
+            return Response({"error": "Thiếu department hoặc doctor_ids"}, status=400)
+
+        schedules = defaultdict(lambda: defaultdict(list))
+        occupancy = {}
+        if doctor_ids:
+            for schedule in DoctorSchedule.objects.filter(
+                doctor_id__in=doctor_ids, is_active=True,
+            ).order_by('doctor_id', 'weekday', 'start_time'):
+                schedules[schedule.doctor_id][schedule.weekday].append(schedule)
+            occupancy = defaultdict(dict)
+            for row in DailyOccupancy.objects.filter(
+                doctor_id__in=list(schedules), date__gte=start_date, date__lte=end_date, booked__gt=0,
+            ).values_list('doctor_id', 'date', 'half_day', 'booked', 'capacity'):
+                occupancy[row[0]][(row[1], row[2])] = row[3:]
+
+        now = django_timezone.now()
+        tz = django_timezone.get_current_timezone()
+        booked_slots = booked_slots_loader(list(schedules))
+        streams = [
+            open_slots(
+                doctor_id, by_weekday, occupancy.get(doctor_id, {}), booked_slots, start_date, end_date, now, tz,
+            )
+            for doctor_id, by_weekday in schedules.items()
+        ]
+        earliest = list(itertools.islice(heapq.merge(*streams), limit))
+        doctor_names = user_directory.names({doctor_id for _, doctor_id, _, _, _ in earliest})
+
+        slots = []
+        for start, doctor_id, end, booked_count, max_appointments in earliest:
+            slots.append({
+                'doctor_id': doctor_id,
+                'doctor_name': doctor_names.get(doctor_id) or f"Bác sĩ {doctor_id}",
+                'date': start.date().isoformat(),
+                'start_time': start.isoformat(),
+                'end_time': end.isoformat(),
+                'booked_count': booked_count,
+                'max_appointments': max_appointments,
+                'availability_status': AppointmentSlot(
+                    booked_count=booked_count, max_appointments=max_appointments,
+                ).availability_status,
+            })
+
+        return Response({
+            'department': department if not doctor_ids_param else None,
+            'doctor_ids': doctor_ids,
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d'),
+            'slots': slots,
+        })
+
+
+def occupancy_status(booked, total):
+    """Trạng thái theo tỉ lệ đã đặt: 'VACANT' (< 30%), 'MODERATE' (< 70%), 'BUSY'"""
+    if total <= 0:
+        return 'VACANT'
+    percent = booked / total * 100
+    if percent >= 70:
+        return 'BUSY'
+    if percent >= 30:
+        return 'MODERATE'
+    return 'VACANT'
+
+
 class DailyAvailabilityView(APIView):
     """
     API lấy thông tin trạng thái đặt lịch theo ngày (vắng, trung bình, đông)
@@ -502,106 +810,38 @@ class DailyAvailabilityView(APIView):
         if (end_date - start_date).days > 60:
             return Response({"error": "Khoảng thời gian không được vượt quá 60 ngày"}, status=400)
         
-        # Chuẩn bị query các lịch làm việc của bác sĩ
-        doctor_schedules = {}
-        for schedule in DoctorSchedule.objects.filter(doctor_id=doctor_id, is_active=True):
-            if schedule.weekday not in doctor_schedules:
-                doctor_schedules[schedule.weekday] = []
-            doctor_schedules[schedule.weekday].append(schedule)
-        
-        # Lấy các slot đã đặt trong khoảng thời gian
-        booked_slots = AppointmentSlot.objects.filter(
-            doctor_id=doctor_id,
-            date__gte=start_date,
-            date__lte=end_date
-        )
-        
-        # Tổ chức dữ liệu theo ngày
-        slot_by_date = defaultdict(list)
-        for slot in booked_slots:
-            slot_by_date[slot.date].append(slot)
-        
-        # Tạo dữ liệu cho từng ngày
+        # Sức chứa theo thứ trong tuần từ lịch làm việc (một query nhỏ), số lượt đặt từ DailyOccupancy
+        # (một range scan trên index (doctor_id, date, half_day)), không load từng slot
+        capacity_by_weekday = DailyOccupancy.weekday_capacity(doctor_id)
+        occupancy = {
+            (row['date'], row['half_day']): row
+            for row in DailyOccupancy.objects.filter(
+                doctor_id=doctor_id, date__gte=start_date, date__lte=end_date,
+            ).values('date', 'half_day', 'capacity', 'booked')
+        }
+
+        # Tạo dữ liệu cho từng ngày bác sĩ có lịch làm việc
         result = []
         current = start_date
         while current <= end_date:
-            weekday = current.weekday()
-            
-            # Kiểm tra xem bác sĩ có lịch làm việc không
-            if weekday in doctor_schedules:
-                schedules = doctor_schedules[weekday]
-                
-                # Tính toán tổng slot và slot còn trống
-                total_slots = 0
-                max_slots = 0
-                morning_booked = 0
-                morning_total = 0
-                afternoon_booked = 0
-                afternoon_total = 0
-                
-                for schedule in schedules:
-                    start_time = datetime.datetime.combine(current, schedule.start_time)
-                    end_time = datetime.datetime.combine(current, schedule.end_time)
-                    duration = schedule.appointment_duration  # phút
-                    slots_per_period = (end_time - start_time).seconds // 60 // duration
-                    max_per_slot = schedule.max_patients_per_hour // (60 // duration)
-                    
-                    max_slots += slots_per_period * max_per_slot
-                    
-                    # Phân loại sáng/chiều
-                    is_morning = schedule.start_time.hour < 12
-                    if is_morning:
-                        morning_total += slots_per_period * max_per_slot
-                    else:
-                        afternoon_total += slots_per_period * max_per_slot
-                
-                # Đếm slot đã đặt trong ngày
-                booked_count = 0
-                for slot in slot_by_date.get(current, []):
-                    booked_count += slot.booked_count
-                    
-                    # Phân loại sáng/chiều
-                    is_morning = slot.start_time.hour < 12
-                    if is_morning:
-                        morning_booked += slot.booked_count
-                    else:
-                        afternoon_booked += slot.booked_count
-                
-                # Tính trạng thái
-                status = 'VACANT'
-                percent = 0
-                if max_slots > 0:
-                    percent = booked_count / max_slots * 100
-                    if percent >= 70:
-                        status = 'BUSY'
-                    elif percent >= 30:
-                        status = 'MODERATE'
-                
-                # Trạng thái buổi sáng
-                morning_status = 'VACANT'
-                if morning_total > 0:
-                    morning_percent = morning_booked / morning_total * 100
-                    if morning_percent >= 70:
-                        morning_status = 'BUSY'
-                    elif morning_percent >= 30:
-                        morning_status = 'MODERATE'
-                
-                # Trạng thái buổi chiều
-                afternoon_status = 'VACANT'
-                if afternoon_total > 0:
-                    afternoon_percent = afternoon_booked / afternoon_total * 100
-                    if afternoon_percent >= 70:
-                        afternoon_status = 'BUSY'
-                    elif afternoon_percent >= 30:
-                        afternoon_status = 'MODERATE'
-                
+            halves = capacity_by_weekday.get(current.weekday())
+            if halves:
+                totals = {}
+                for half_day, _ in DailyOccupancy.HALF_DAYS:
+                    row = occupancy.get((current, half_day))
+                    totals[half_day] = (row['booked'], row['capacity']) if row else (0, halves[half_day])
+
+                booked_count = sum(booked for booked, _ in totals.values())
+                max_slots = sum(capacity for _, capacity in totals.values())
+                percent = booked_count / max_slots * 100 if max_slots > 0 else 0
+
                 result.append({
                     'date': current,
-                    'status': status,
+                    'status': occupancy_status(booked_count, max_slots),
                     'total_slots': max_slots,
                     'available_slots': max_slots - booked_count,
-                    'morning_status': morning_status,
-                    'afternoon_status': afternoon_status,
+                    'morning_status': occupancy_status(*totals[DailyOccupancy.MORNING]),
+                    'afternoon_status': occupancy_status(*totals[DailyOccupancy.AFTERNOON]),
                     'percent_booked': round(percent, 1)
                 })
             
@@ -615,6 +855,81 @@ class DailyAvailabilityView(APIView):
         })
 
 
+class CalendarDensityView(APIView):
+    """
+    Mật độ đặt lịch của một bác sĩ cho từng ngày trong tháng, một request cho cả tháng
+    
+    GET /api/appointments/calendar-density/?doctor_id=123&year=2025&month=5
+
+    Kết quả được cache theo version dữ liệu của bác sĩ (versioning.py). Với cache mặc định (LocMem, riêng từng
+    process) việc invalidate chỉ có hiệu lực trong process ghi; chạy nhiều worker thì cấu hình REDIS_URL.
+    """
+    authentication_classes = [MicroserviceJWTAuthentication]
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        doctor_id = request.query_params.get('doctor_id')
+        if not doctor_id:
+            return Response({"error": "Thiếu doctor_id"}, status=400)
+        if not doctor_id.isdigit():
+            return Response({"error": "doctor_id không hợp lệ"}, status=400)
+        doctor_id = int(doctor_id)
+
+        today = datetime.date.today()
+        try:
+            year = int(request.query_params.get('year', today.year))
+            month = int(request.query_params.get('month', today.month))
+            first_day = datetime.date(year, month, 1)
+        except ValueError:
+            return Response({"error": "year/month không hợp lệ"}, status=400)
+
+        # Version đổi mỗi khi lượt đặt hoặc lịch làm việc của bác sĩ đổi: entry cũ không bao giờ được đọc lại
+        cache_key = f'calendar_density:{doctor_id}:{year}-{month}:{versioning.get_version(doctor_id)}'
+        data = cache.get(cache_key)
+        if data is None:
+            data = self.density(doctor_id, first_day)
+            cache.set(cache_key, data, settings.CALENDAR_DENSITY_CACHE_TIMEOUT)
+        return Response(data)
+
+    def density(self, doctor_id, first_day):
+        last_day = first_day.replace(day=calendar.monthrange(first_day.year, first_day.month)[1])
+
+        # Một GROUP BY theo ngày trên DailyOccupancy; ngày chưa có lượt đặt lấy sức chứa theo lịch làm việc
+        totals = {
+            row['date']: row
+            for row in DailyOccupancy.objects.filter(
+                doctor_id=doctor_id, date__gte=first_day, date__lte=last_day,
+            ).values('date').annotate(booked=Sum('booked'), capacity=Sum('capacity'))
+        }
+        capacity_by_weekday = DailyOccupancy.weekday_capacity(doctor_id)
+
+        days = []
+        current = first_day
+        while current <= last_day:
+            row = totals.get(current)
+            if row:
+                booked, capacity = row['booked'], row['capacity']
+            else:
+                booked, capacity = 0, sum(capacity_by_weekday.get(current.weekday(), {}).values())
+            days.append({
+                'date': current.strftime('%Y-%m-%d'),
+                'booked': booked,
+                'capacity': capacity,
+                'available': max(0, capacity - booked),
+                'percent_booked': round(booked / capacity * 100, 1) if capacity > 0 else 0,
+                # CLOSED: bác sĩ không làm việc ngày này
+                'status': occupancy_status(booked, capacity) if capacity > 0 else 'CLOSED',
+            })
+            current += datetime.timedelta(days=1)
+
+        return {
+            'doctor_id': doctor_id,
+            'year': first_day.year,
+            'month': first_day.month,
+            'days': days,
+        }
+
+
 class PatientAppointmentCalendarView(APIView):
     """
     API lấy lịch hẹn của patient theo tháng
@@ -625,127 +940,34 @@ class PatientAppointmentCalendarView(APIView):
     
     def get_doctor_names(self, doctor_ids):
         """
-        Gọi user service để lấy tên bác sĩ
+        Tên bác sĩ từ danh bạ cục bộ (directory.py), không chờ user_service; bác sĩ chưa có trong danh bạ
+        hiện là "Bác sĩ <id>"
         """
-        doctor_names = {}
-        
-        if not doctor_ids:
-            return doctor_names
-            
-        try:
-            import requests
-            
-            # Gọi user service để lấy thông tin nhiều bác sĩ cùng lúc
-            try:
-                # Thử gọi endpoint để lấy nhiều users cùng lúc
-                params = {'ids': ','.join(map(str, doctor_ids)), 'role': 'DOCTOR'}
-                response = requests.get(
-                    'http://user_service:8000/api/users/',
-                    params=params,
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    users_data = response.json()
-                    
-                    # Nếu response là dict với key 'results'
-                    if isinstance(users_data, dict) and 'results' in users_data:
-                        users_list = users_data['results']
-                    elif isinstance(users_data, list):
-                        users_list = users_data
-                    else:
-                        users_list = []
-                    
-                    for user_data in users_list:
-                        user_id = user_data.get('id')
-                        first_name = user_data.get('first_name', '')
-                        last_name = user_data.get('last_name', '')
-                        
-                        if first_name or last_name:
-                            full_name = f"{first_name} {last_name}".strip()
-                            doctor_names[user_id] = full_name
-                        else:
-                            doctor_names[user_id] = user_data.get('username', f"Bác sĩ {user_id}")
-                    
-                    print(f"✅ Successfully fetched {len(doctor_names)} doctor names")
-                    
-                else:
-                    print(f"⚠️ Failed to get doctors info: {response.status_code}")
-                    raise Exception("Batch request failed")
-                    
-            except Exception as batch_error:
-                print(f"⚠️ Batch request failed: {batch_error}, trying individual requests...")
-                
-                # Fallback: gọi từng bác sĩ riêng lẻ
-                for doctor_id in doctor_ids:
-                    try:
-                        response = requests.get(
-                            f'http://user_service:8000/api/users/{doctor_id}/',
-                            timeout=5
-                        )
-                        
-                        if response.status_code == 200:
-                            user_data = response.json()
-                            first_name = user_data.get('first_name', '')
-                            last_name = user_data.get('last_name', '')
-                            
-                            if first_name or last_name:
-                                full_name = f"{first_name} {last_name}".strip()
-                                doctor_names[doctor_id] = full_name
-                            else:
-                                doctor_names[doctor_id] = user_data.get('username', f"Bác sĩ {doctor_id}")
-                        else:
-                            print(f"⚠️ Failed to get doctor {doctor_id} info: {response.status_code}")
-                            doctor_names[doctor_id] = f"Bác sĩ {doctor_id}"
-                            
-                    except requests.exceptions.RequestException as e:
-                        print(f"⚠️ Error calling user service for doctor {doctor_id}: {e}")
-                        doctor_names[doctor_id] = f"Bác sĩ {doctor_id}"
-                        
-        except Exception as e:
-            print(f"⚠️ Error in get_doctor_names: {e}")
-            # Fallback: use doctor IDs
-            for doctor_id in doctor_ids:
-                doctor_names[doctor_id] = f"Bác sĩ {doctor_id}"
-        
-        # Đảm bảo tất cả doctor_ids đều có tên
-        for doctor_id in doctor_ids:
-            if doctor_id not in doctor_names:
-                doctor_names[doctor_id] = f"Bác sĩ {doctor_id}"
-        
-        return doctor_names
+        doctor_names = user_directory.names(doctor_ids)
+        return {doctor_id: doctor_names.get(doctor_id) or f"Bác sĩ {doctor_id}" for doctor_id in doctor_ids}
     
     def get(self, request):
         try:
             from django.utils import timezone as django_timezone
-            from datetime import datetime, timedelta
-            from calendar import monthrange
+            from datetime import datetime
             
             # Get parameters
             year = int(request.query_params.get('year', django_timezone.now().year))
             month = int(request.query_params.get('month', django_timezone.now().month))
             patient_id = request.user.id
             
-            print(f"🔍 PatientAppointmentCalendarView - patient_id: {patient_id}, year: {year}, month: {month}")
-            
-            # Get start and end of month
-            first_day = datetime(year, month, 1)
-            last_day_of_month = monthrange(year, month)[1]
-            last_day = datetime(year, month, last_day_of_month)
-            
-            # Make timezone-aware
-            first_day = django_timezone.make_aware(first_day, django_timezone.get_current_timezone())
-            last_day = django_timezone.make_aware(last_day, django_timezone.get_current_timezone())
-            last_day = last_day.replace(hour=23, minute=59, second=59)
+            # [ngày đầu tháng, ngày đầu tháng sau)
+            first_day = django_timezone.make_aware(datetime(year, month, 1), django_timezone.get_current_timezone())
+            next_month = django_timezone.make_aware(
+                datetime(year + month // 12, month % 12 + 1, 1), django_timezone.get_current_timezone(),
+            )
             
             # Get appointments for the month
-            appointments = Appointment.objects.filter(
+            appointments = list(Appointment.objects.filter(
                 patient_id=patient_id,
                 scheduled_time__gte=first_day,
-                scheduled_time__lte=last_day
-            ).order_by('scheduled_time')
-            
-            print(f"🔍 Found {appointments.count()} appointments for patient {patient_id}")
+                scheduled_time__lt=next_month
+            ).order_by('scheduled_time'))
             
             # Group appointments by date
             calendar_data = {}
@@ -764,14 +986,11 @@ class PatientAppointmentCalendarView(APIView):
                         'count': 0
                     }
                 
-                # Get doctor name from user service
-                doctor_name = doctor_names.get(appointment.doctor_id, f"Doctor {appointment.doctor_id}")
-                
                 calendar_data[date_str]['appointments'].append({
                     'id': appointment.id,
                     'time': appointment.scheduled_time.strftime('%H:%M'),
                     'doctor_id': appointment.doctor_id,
-                    'doctor_name': doctor_name,
+                    'doctor_name': doctor_names[appointment.doctor_id],
                     'reason': appointment.reason,
                     'status': appointment.status,
                     'priority': appointment.priority
@@ -786,7 +1005,7 @@ class PatientAppointmentCalendarView(APIView):
                 'month': month,
                 'patient_id': patient_id,
                 'calendar_data': calendar_list,
-                'total_appointments': appointments.count()
+                'total_appointments': len(appointments)
             })
             
         except Exception as e:
@@ -798,6 +1017,56 @@ class PatientAppointmentCalendarView(APIView):
             }, status=500)
 
 
+def doctor_stats(doctor_id, today):
+    """Số liệu dashboard của bác sĩ bằng một query conditional aggregation trên Appointment"""
+    start, end = day_range(today)
+    return Appointment.objects.filter(doctor_id=doctor_id).aggregate(
+        total_appointments=Count('id'),
+        total_patients=Count('patient_id', distinct=True),
+        completed_appointments=Count('id', filter=Q(status='COMPLETED')),
+        pending_reports=Count('id', filter=Q(status__in=['PENDING', 'CONFIRMED'])),
+        todays_appointments=Count('id', filter=Q(scheduled_time__gte=start, scheduled_time__lt=end)),
+    )
+
+
+def doctor_stats_from_counters(doctor_id, today):
+    """Như doctor_stats nhưng đọc AppointmentCounter; chỉ số lịch hôm nay (phụ thuộc thời gian) còn phải đếm"""
+    counter = AppointmentCounter.objects.filter(role=AppointmentCounter.DOCTOR, user_id=doctor_id).first()
+    start, end = day_range(today)
+    return {
+        'total_appointments': counter.total if counter else 0,
+        'total_patients': counter.patients if counter else 0,
+        'completed_appointments': counter.completed if counter else 0,
+        'pending_reports': counter.pending + counter.confirmed if counter else 0,
+        'todays_appointments': Appointment.objects.filter(
+            doctor_id=doctor_id, scheduled_time__gte=start, scheduled_time__lt=end,
+        ).count() if counter else 0,
+    }
+
+
+def patient_stats(patient_id, now):
+    """Số liệu dashboard của bệnh nhân bằng một query conditional aggregation trên Appointment"""
+    return Appointment.objects.filter(patient_id=patient_id).aggregate(
+        upcoming_appointments=Count(
+            'id', filter=Q(scheduled_time__gte=now, status__in=['PENDING', 'CONFIRMED']),
+        ),
+        completed_appointments=Count('id', filter=Q(status='COMPLETED')),
+    )
+
+
+def patient_stats_from_counters(patient_id, now):
+    counter = AppointmentCounter.objects.filter(role=AppointmentCounter.PATIENT, user_id=patient_id).first()
+    if not counter:
+        return {'upcoming_appointments': 0, 'completed_appointments': 0}
+    # Lịch sắp tới phụ thuộc thời gian nên không đếm trước được; chỉ đếm khi bệnh nhân có lịch đang chờ
+    upcoming = 0
+    if counter.pending or counter.confirmed:
+        upcoming = Appointment.objects.filter(
+            patient_id=patient_id, scheduled_time__gte=now, status__in=['PENDING', 'CONFIRMED'],
+        ).count()
+    return {'upcoming_appointments': upcoming, 'completed_appointments': counter.completed}
+
+
 class DoctorStatsView(APIView):
     """Get statistics for doctor dashboard"""
     authentication_classes = [MicroserviceJWTAuthentication]
@@ -805,44 +1074,20 @@ class DoctorStatsView(APIView):
     
     def get(self, request, doctor_id):
         try:
-            from datetime import date, datetime, timedelta
-            from django.utils import timezone
-            
-            today = date.today()
-            
-            # Get today's appointments
-            todays_appointments = Appointment.objects.filter(
-                doctor_id=doctor_id,
-                scheduled_time__date=today
-            ).count()
-            
-            # Get total unique patients
-            total_patients = Appointment.objects.filter(
-                doctor_id=doctor_id
-            ).values('patient_id').distinct().count()
-            
-            # Get completed vs total appointments for success rate
-            completed_appointments = Appointment.objects.filter(
-                doctor_id=doctor_id,
-                status='COMPLETED'
-            ).count()
-            
-            total_appointments = Appointment.objects.filter(
-                doctor_id=doctor_id
-            ).count()
-            
+            today = datetime.date.today()
+            if AppointmentCounter.enabled():
+                stats = doctor_stats_from_counters(doctor_id, today)
+            else:
+                stats = doctor_stats(doctor_id, today)
+
+            total_appointments = stats['total_appointments']
+            completed_appointments = stats['completed_appointments']
             success_rate = (completed_appointments / total_appointments * 100) if total_appointments > 0 else 0
             
-            # Get pending appointments (could be considered as "pending reports")
-            pending_reports = Appointment.objects.filter(
-                doctor_id=doctor_id,
-                status__in=['PENDING', 'CONFIRMED']
-            ).count()
-            
             return Response({
-                'total_patients': total_patients,
-                'todays_appointments': todays_appointments,
-                'pending_reports': pending_reports,
+                'total_patients': stats['total_patients'],
+                'todays_appointments': stats['todays_appointments'],
+                'pending_reports': stats['pending_reports'],
                 'success_rate': round(success_rate, 1),
                 'completed_appointments': completed_appointments,
                 'total_appointments': total_appointments
@@ -861,28 +1106,16 @@ class PatientStatsView(APIView):
     
     def get(self, request, patient_id):
         try:
-            from datetime import date, datetime, timedelta
-            from django.utils import timezone
-            
-            now = timezone.now()
-            
-            # Get upcoming appointments
-            upcoming_appointments = Appointment.objects.filter(
-                patient_id=patient_id,
-                scheduled_time__gte=now,
-                status__in=['PENDING', 'CONFIRMED']
-            ).count()
-            
-            # Get completed appointments
-            completed_appointments = Appointment.objects.filter(
-                patient_id=patient_id,
-                status='COMPLETED'
-            ).count()
+            now = django_timezone.now()
+            if AppointmentCounter.enabled():
+                stats = patient_stats_from_counters(patient_id, now)
+            else:
+                stats = patient_stats(patient_id, now)
             
             return Response({
-                'upcoming_appointments': upcoming_appointments,
-                'completed_appointments': completed_appointments,
-                'total_appointments': upcoming_appointments + completed_appointments
+                'upcoming_appointments': stats['upcoming_appointments'],
+                'completed_appointments': stats['completed_appointments'],
+                'total_appointments': stats['upcoming_appointments'] + stats['completed_appointments']
             })
             
         except Exception as e:
@@ -34,6 +34,103 @@ NOTIFICATION_SERVICE = config('NOTIFICATION_SERVICE')
 VIRTUALROBOT_SERVICE = config('VIRTUALROBOT_SERVICE') 
 CHATBOT_SERVICE = config('CHATBOT_SERVICE')
 
+# Connection pool cho từng upstream (tạo một lần khi gateway khởi động)
+UPSTREAM_POOL_MAXSIZE = config('UPSTREAM_POOL_MAXSIZE', default=50, cast=int)
+UPSTREAM_POOL_BLOCK = config('UPSTREAM_POOL_BLOCK', default=False, cast=bool)
+UPSTREAM_CONNECT_TIMEOUT = config('UPSTREAM_CONNECT_TIMEOUT', default=3.05, cast=float)
+UPSTREAM_READ_TIMEOUT = config('UPSTREAM_READ_TIMEOUT', default=10, cast=float)
+
+# Timeout (connect, read) riêng cho từng service, mặc định dùng giá trị chung ở trên
+UPSTREAM_TIMEOUTS = {
+    'USER_SERVICE': (UPSTREAM_CONNECT_TIMEOUT, config('USER_SERVICE_TIMEOUT', default=UPSTREAM_READ_TIMEOUT, cast=float)),
+    'APPOINTMENT_SERVICE': (UPSTREAM_CONNECT_TIMEOUT, config('APPOINTMENT_SERVICE_TIMEOUT', default=UPSTREAM_READ_TIMEOUT, cast=float)),
+    'CLINICAL_SERVICE': (UPSTREAM_CONNECT_TIMEOUT, config('CLINICAL_SERVICE_TIMEOUT', default=UPSTREAM_READ_TIMEOUT, cast=float)),
+    'PHARMACY_SERVICE': (UPSTREAM_CONNECT_TIMEOUT, config('PHARMACY_SERVICE_TIMEOUT', default=UPSTREAM_READ_TIMEOUT, cast=float)),
+    'LAB_SERVICE': (UPSTREAM_CONNECT_TIMEOUT, config('LAB_SERVICE_TIMEOUT', default=UPSTREAM_READ_TIMEOUT, cast=float)),
+    'INSURANCE_SERVICE': (UPSTREAM_CONNECT_TIMEOUT, config('INSURANCE_SERVICE_TIMEOUT', default=UPSTREAM_READ_TIMEOUT, cast=float)),
+    'NOTIFICATION_SERVICE': (UPSTREAM_CONNECT_TIMEOUT, config('NOTIFICATION_SERVICE_TIMEOUT', default=UPSTREAM_READ_TIMEOUT, cast=float)),
+    'VIRTUALROBOT_SERVICE': (UPSTREAM_CONNECT_TIMEOUT, config('VIRTUALROBOT_SERVICE_TIMEOUT', default=UPSTREAM_READ_TIMEOUT, cast=float)),
+    'CHATBOT_SERVICE': (UPSTREAM_CONNECT_TIMEOUT, config('CHATBOT_SERVICE_TIMEOUT', default=UPSTREAM_READ_TIMEOUT, cast=float)),
+}
+
+# Số JWT đã verify được giữ trong cache (shared/token_cache)
+JWT_CACHE_SIZE = config('JWT_CACHE_SIZE', default=4096, cast=int)
+
+# Chế độ proxy async: chạy gateway qua ASGI (uvicorn gateway.asgi:application)
+GATEWAY_ASYNC = config('GATEWAY_ASYNC', default=False, cast=bool)
+ASYNC_UPSTREAM_MAX_CONNECTIONS = config('ASYNC_UPSTREAM_MAX_CONNECTIONS', default=1000, cast=int)
+
+# Circuit breaker cho từng upstream (router/breaker.py), cửa sổ tính bằng giây
+CIRCUIT_BREAKER_WINDOW = config('CIRCUIT_BREAKER_WINDOW', default=30, cast=float)
+CIRCUIT_BREAKER_MIN_REQUESTS = config('CIRCUIT_BREAKER_MIN_REQUESTS', default=20, cast=int)
+CIRCUIT_BREAKER_ERROR_RATE = config('CIRCUIT_BREAKER_ERROR_RATE', default=0.5, cast=float)
+CIRCUIT_BREAKER_SLOW_CALL = config('CIRCUIT_BREAKER_SLOW_CALL', default=5, cast=float)
+CIRCUIT_BREAKER_SLOW_RATE = config('CIRCUIT_BREAKER_SLOW_RATE', default=0.5, cast=float)
+CIRCUIT_BREAKER_OPEN_SECONDS = config('CIRCUIT_BREAKER_OPEN_SECONDS', default=15, cast=float)
+CIRCUIT_BREAKER_HALF_OPEN_CALLS = config('CIRCUIT_BREAKER_HALF_OPEN_CALLS', default=3, cast=int)
+
+# Kích thước mỗi chunk khi stream body của upstream về client
+GATEWAY_STREAM_CHUNK_SIZE = config('GATEWAY_STREAM_CHUNK_SIZE', default=64 * 1024, cast=int)
+
+# Nén response gửi cho client (router/compression.py): gzip, thêm brotli nếu có package brotli
+GATEWAY_COMPRESS_MIN_SIZE = config('GATEWAY_COMPRESS_MIN_SIZE', default=1024, cast=int)
+GATEWAY_COMPRESS_TYPES = ('application/json', 'text/', 'application/javascript', 'application/xml')
+GATEWAY_GZIP_LEVEL = config('GATEWAY_GZIP_LEVEL', default=6, cast=int)
+GATEWAY_BROTLI_QUALITY = config('GATEWAY_BROTLI_QUALITY', default=4, cast=int)
+
+# Cache response cho các route GET ít thay đổi (TTL tính bằng giây, 0 = tắt)
+GATEWAY_CACHE_MAX_ENTRIES = config('GATEWAY_CACHE_MAX_ENTRIES', default=1000, cast=int)
+GATEWAY_CACHE_MAX_BODY = config('GATEWAY_CACHE_MAX_BODY', default=1024 * 1024, cast=int)
+GATEWAY_CACHE_TTLS = {
+    'lab_tests': config('CACHE_TTL_LAB_TESTS', default=300, cast=int),
+    'departments': config('CACHE_TTL_DEPARTMENTS', default=300, cast=int),
+    'doctors': config('CACHE_TTL_DOCTORS', default=60, cast=int),
+    'doctor_schedule': config('CACHE_TTL_DOCTOR_SCHEDULE', default=60, cast=int),
+}
+
+# Upload avatar qua gateway (stream lên user_service); giới hạn giống AvatarUploadView
+AVATAR_MAX_SIZE = config('AVATAR_MAX_SIZE', default=5 * 1024 * 1024, cast=int)
+AVATAR_CONTENT_TYPES = ('image/jpeg', 'image/jpg', 'image/png', 'image/gif')
+# Phần body multipart ngoài nội dung file (boundary, header của part)
+AVATAR_MULTIPART_OVERHEAD = 64 * 1024
+
+# POST /api/batch/: số sub-request tối đa mỗi batch và số thread chạy song song (chế độ sync)
+BATCH_MAX_REQUESTS = config('BATCH_MAX_REQUESTS', default=20, cast=int)
+BATCH_MAX_WORKERS = config('BATCH_MAX_WORKERS', default=16, cast=int)
+
+# Gộp các request GET giống hệt nhau đang chạy đồng thời thành một lần gọi upstream
+GATEWAY_COALESCE = config('GATEWAY_COALESCE', default=True, cast=bool)
+# Thời gian tối đa (giây) một request chờ kết quả của request đang chạy trước khi tự gọi upstream
+GATEWAY_COALESCE_WAIT = config('GATEWAY_COALESCE_WAIT', default=30, cast=float)
+
+# Admission control bằng token bucket (router/ratelimit.py), giá trị là (request/giây, burst).
+# client: ngân sách của mỗi client (user trong token hoặc IP), route: ngân sách chung của cả nhóm route
+GATEWAY_RATE_LIMIT = config('GATEWAY_RATE_LIMIT', default=True, cast=bool)
+GATEWAY_RATE_LIMITS = {
+    'default': {'client': (20, 40)},
+    'vr_diagnose': {'client': (0.5, 3), 'route': (5, 10)},
+    'chatbot': {'client': (1, 5), 'route': (10, 20)},
+    'daily_availability': {'client': (2, 10), 'route': (30, 60)},
+}
+GATEWAY_RATE_LIMIT_BACKEND = config('GATEWAY_RATE_LIMIT_BACKEND', default='router.ratelimit.LocalRateLimitBackend')
+GATEWAY_RATE_LIMIT_MAX_KEYS = config('GATEWAY_RATE_LIMIT_MAX_KEYS', default=100000, cast=int)
+
+# Retry GET khi lỗi kết nối (exponential backoff có jitter, giây) và hedge GET chậm (router/retry.py)
+GATEWAY_RETRY_ATTEMPTS = config('GATEWAY_RETRY_ATTEMPTS', default=2, cast=int)
+GATEWAY_RETRY_BACKOFF = config('GATEWAY_RETRY_BACKOFF', default=0.05, cast=float)
+GATEWAY_RETRY_BACKOFF_MAX = config('GATEWAY_RETRY_BACKOFF_MAX', default=1.0, cast=float)
+# Retry budget chung: mỗi request nạp RATIO token, mỗi retry/hedge tiêu 1 token, tối đa MAX token
+GATEWAY_RETRY_BUDGET_RATIO = config('GATEWAY_RETRY_BUDGET_RATIO', default=0.1, cast=float)
+GATEWAY_RETRY_BUDGET_MIN_PER_SECOND = config('GATEWAY_RETRY_BUDGET_MIN_PER_SECOND', default=5, cast=float)
+GATEWAY_RETRY_BUDGET_MAX = config('GATEWAY_RETRY_BUDGET_MAX', default=50, cast=float)
+# Hedge khi lần gọi đầu chậm hơn percentile này của HEDGE_WINDOW response gần nhất (cần đủ MIN_SAMPLES)
+GATEWAY_HEDGE_PERCENTILE = config('GATEWAY_HEDGE_PERCENTILE', default=95, cast=float)
+GATEWAY_HEDGE_WINDOW = config('GATEWAY_HEDGE_WINDOW', default=500, cast=int)
+GATEWAY_HEDGE_MIN_SAMPLES = config('GATEWAY_HEDGE_MIN_SAMPLES', default=50, cast=int)
+GATEWAY_HEDGE_MIN_DELAY = config('GATEWAY_HEDGE_MIN_DELAY', default=0.01, cast=float)
+# Số lần hedge chạy đồng thời tối đa (chế độ sync); pool đầy thì request không được hedge
+GATEWAY_HEDGE_MAX_WORKERS = config('GATEWAY_HEDGE_MAX_WORKERS', default=64, cast=int)
+
 
 
 ALLOWED_HOSTS = ['*', '127.0.0.1']
@@ -56,6 +153,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'router.middleware.MetricsMiddleware',
+    'router.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
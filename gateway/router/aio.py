@@ -0,0 +1,210 @@
+import asyncio
+import json
+import time
+import weakref
+from urllib.parse import urlparse
+
+import aiohttp
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+
+from . import metrics, retry
+from .breaker import get_breaker, unavailable_response
+from .upstream import copy_passthrough_headers
+
+
+class AsyncUpstreamPool:
+    """
+    aiohttp.ClientSession cho một upstream service.
+    Một session chỉ dùng được trên event loop đã tạo ra nó.
+    """
+    def __init__(self, name, base_url, timeout):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = self.make_timeout(timeout)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.ASYNC_UPSTREAM_MAX_CONNECTIONS,
+                keepalive_timeout=30,
+            ),
+            timeout=self.timeout,
+            # Không giữ cookie của upstream giữa các request
+            cookie_jar=aiohttp.DummyCookieJar(),
+            # Giữ nguyên Content-Encoding của upstream khi stream về client
+            auto_decompress=False,
+            # Không xin upstream nén, giống UpstreamPool
+            headers={'Accept-Encoding': 'identity'},
+        )
+
+    @staticmethod
+    def make_timeout(timeout):
+        connect, read = timeout
+        return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        if timeout is not None:
+            kwargs['timeout'] = self.make_timeout(timeout)
+        return self.session.request(method, url, **kwargs)
+
+    async def aclose(self):
+        await self.session.close()
+
+
+# {event loop: {netloc: AsyncUpstreamPool}}
+_loop_pools = weakref.WeakKeyDictionary()
+
+
+def _build_pools():
+    pools = {}
+    for name, timeout in settings.UPSTREAM_TIMEOUTS.items():
+        base_url = getattr(settings, name, None)
+        if base_url and urlparse(base_url).netloc not in pools:
+            pools[urlparse(base_url).netloc] = AsyncUpstreamPool(name, base_url, timeout)
+    pools[None] = AsyncUpstreamPool(
+        'DEFAULT', '', (settings.UPSTREAM_CONNECT_TIMEOUT, settings.UPSTREAM_READ_TIMEOUT)
+    )
+    return pools
+
+
+def get_pool(url):
+    loop = asyncio.get_running_loop()
+    pools = _loop_pools.get(loop)
+    if pools is None:
+        pools = _loop_pools[loop] = _build_pools()
+    return pools.get(urlparse(url).netloc, pools[None])
+
+
+async def close_pools():
+    pools = _loop_pools.pop(asyncio.get_running_loop(), {})
+    for pool in pools.values():
+        await pool.aclose()
+
+
+async def aiter_upstream(response):
+    """Stream byte thô của upstream, trả kết nối về pool khi xong"""
+    try:
+        async for chunk in response.content.iter_chunked(settings.GATEWAY_STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        response.release()
+
+
+def passthrough_response(response):
+    proxied = StreamingHttpResponse(
+        aiter_upstream(response),
+        status=response.status,
+        content_type=response.headers.get('Content-Type'),
+    )
+    return copy_passthrough_headers(response.headers, proxied)
+
+
+async def send_upstream(breaker, method, url, route=None, **kwargs):
+    """Bản async của views.send_upstream"""
+    metrics.upstream_in_flight.inc(breaker.name)
+    start = time.monotonic()
+    try:
+        response = await get_pool(url).request(method, url, **kwargs)
+    except asyncio.CancelledError:
+        breaker.cancel()
+        raise
+    except Exception:
+        elapsed = time.monotonic() - start
+        breaker.record(False, elapsed)
+        metrics.observe_upstream(breaker.name, 'error', elapsed)
+        raise
+    finally:
+        metrics.upstream_in_flight.dec(breaker.name)
+    elapsed = time.monotonic() - start
+    breaker.record(response.status < 500, elapsed)
+    metrics.observe_upstream(breaker.name, response.status, elapsed)
+    if route is not None and response.status < 500:
+        retry.get_tracker(route).observe(elapsed)
+    return response
+
+
+def release_loser(task):
+    if task.done():
+        if not task.cancelled() and task.exception() is None:
+            task.result().release()
+    else:
+        task.cancel()
+
+
+async def send_hedged(breaker, method, url, route, **kwargs):
+    """Bản async của views.send_hedged; lần gọi thua bị hủy hoặc trả kết nối về pool"""
+    delay = retry.hedge_delay(route)
+    if delay is None:
+        return await send_upstream(breaker, method, url, route, **kwargs)
+
+    first = asyncio.ensure_future(send_upstream(breaker, method, url, route, **kwargs))
+    attempts = [first]
+    winner = None
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if done or not breaker.allow():
+            winner = first
+            return await first
+        if not retry.allow_extra(breaker, 'hedge'):
+            breaker.cancel()
+            winner = first
+            return await first
+
+        attempts.append(asyncio.ensure_future(send_upstream(breaker, method, url, route, **kwargs)))
+        pending = set(attempts)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in attempts if task in done and task.exception() is None), None)
+        if winner is None:
+            winner = first
+            return first.result()
+        if winner is not first:
+            metrics.hedge_wins_total.inc(route)
+        return winner.result()
+    finally:
+        # Gồm cả khi request bị hủy (client ngắt kết nối): không để lại lần gọi nào đang chạy
+        for task in attempts:
+            if task is not winner:
+                release_loser(task)
+        if winner is not None and not winner.done():
+            winner.cancel()
+
+
+async def forward_request_async(method, url, data=None, headers=None, params=None, timeout=None, retries=0,
+                                hedge=None, body=None):
+    """Bản async của views.forward_request"""
+    headers = {k: v for k, v in (headers or {}).items() if v is not None}
+    headers['Host'] = urlparse(url).hostname
+
+    breaker = get_breaker(url)
+    kwargs = {'headers': headers, 'params': params, 'timeout': timeout}
+    if body is not None:
+        kwargs['data'] = body
+    else:
+        kwargs['json'] = data
+    retry.get_budget().deposit()
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            return unavailable_response(breaker)
+        try:
+            if hedge is not None:
+                response = await send_hedged(breaker, method, url, hedge, **kwargs)
+            else:
+                response = await send_upstream(breaker, method, url, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if attempt < retries and retry.is_connection_error(e) and retry.allow_extra(breaker, 'retry'):
+                await asyncio.sleep(retry.backoff(attempt))
+                attempt += 1
+                continue
+            print(f"❌ ERROR: {e}")
+            return JsonResponse({"error": str(e)}, status=500)
+        return passthrough_response(response)
+
+
+def parse_body(request):
+    """Đọc body JSON của request; body dạng khác được chuyển tiếp nguyên (dispatch.build_forward)"""
+    if not request.body:
+        return None
+    return json.loads(request.body)
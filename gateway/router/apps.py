@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RouterConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'router'
+
+    def ready(self):
+        from . import upstream
+        upstream.build_pools()
@@ -0,0 +1,228 @@
+"""
+POST /api/batch/ — chạy nhiều request tới các route trong router/routes.py song song, trả kết quả trong một response.
+
+    {
+        "on_error": "continue",            // hoặc "abort"
+        "requests": [
+            {"id": "appointments", "method": "GET", "path": "/api/appointments/?status=PENDING"},
+            {"id": "notify", "path": "/api/notify/"},
+            {"id": "vitals", "method": "POST", "path": "/api/records/vitals/", "body": {...}}
+        ]
+    }
+
+Mỗi sub-request dùng Authorization của request batch và có status riêng trong kết quả.
+on_error=continue: luôn trả 200, sub-request lỗi chỉ ảnh hưởng phần tử của nó.
+on_error=abort: khi có sub-request lỗi (status >= 400) cả batch trả 424 ngay, các sub-request chưa xong
+được trả status 424. Ở chế độ sync chỉ các sub-request chưa bắt đầu chạy mới thật sự bị hủy; sub-request đang
+chạy trên thread pool vẫn chạy tới khi xong (kể cả request ghi), chỉ kết quả của nó bị bỏ. Chế độ async hủy
+cả các task đang chờ upstream.
+"""
+import asyncio
+import json
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.http import HttpRequest, JsonResponse, QueryDict
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .compression import brotli
+from .dispatch import async_proxy, proxy
+
+
+ON_ERROR = ('continue', 'abort')
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.BATCH_MAX_WORKERS, thread_name_prefix='batch')
+    return _executor
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_batch(request):
+    """Trả về (on_error, [sub-request spec]) hoặc raise BatchError"""
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        raise BatchError('Invalid JSON body')
+    if not isinstance(payload, dict) or not isinstance(payload.get('requests'), list):
+        raise BatchError('Body phải có dạng {"requests": [...]}')
+
+    on_error = payload.get('on_error', 'continue')
+    if on_error not in ON_ERROR:
+        raise BatchError(f"on_error phải là một trong {', '.join(ON_ERROR)}")
+
+    items = payload['requests']
+    if not items:
+        raise BatchError('Danh sách requests rỗng')
+    if len(items) > settings.BATCH_MAX_REQUESTS:
+        raise BatchError(f'Tối đa {settings.BATCH_MAX_REQUESTS} request trong một batch')
+
+    specs = []
+    seen = set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise BatchError(f'requests[{index}] thiếu path')
+        spec_id = str(item.get('id', index))
+        if spec_id in seen:
+            raise BatchError(f'id bị trùng: {spec_id}')
+        seen.add(spec_id)
+        method = str(item.get('method', 'GET')).upper()
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+            raise BatchError(f'requests[{index}] có method không hợp lệ: {method}')
+        params = item.get('params') or {}
+        if not isinstance(params, dict):
+            raise BatchError(f'requests[{index}].params phải là object')
+        specs.append({'id': spec_id, 'method': method, 'path': item['path'], 'params': params, 'body': item.get('body')})
+    return on_error, specs
+
+
+def build_subrequest(parent, spec):
+    """Tạo HttpRequest cho một sub-request; trả về (request, path tương đối sau /api/)"""
+    parts = urlsplit(spec['path'])
+    path = parts.path
+    if path.startswith('/api/'):
+        path = path[len('/api/'):]
+    path = path.lstrip('/')
+    query = parts.query
+    if spec['params']:
+        extra = urlencode(spec['params'], doseq=True)
+        query = f'{query}&{extra}' if query else extra
+
+    request = HttpRequest()
+    request.method = spec['method']
+    request.path = request.path_info = f'/api/{path}'
+    request.META = {
+        'REQUEST_METHOD': spec['method'],
+        'QUERY_STRING': query,
+        'SERVER_NAME': parent.META.get('SERVER_NAME', 'gateway'),
+        'SERVER_PORT': parent.META.get('SERVER_PORT', '80'),
+        'REMOTE_ADDR': parent.META.get('REMOTE_ADDR', ''),
+        'CONTENT_TYPE': 'application/json',
+    }
+    auth = parent.headers.get('Authorization')
+    if auth:
+        request.META['HTTP_AUTHORIZATION'] = auth
+    request.GET = QueryDict(query)
+    request.content_type = 'application/json'
+    request._body = json.dumps(spec['body']).encode() if spec['body'] is not None else b''
+    return request, path
+
+
+def decode_body(response, body):
+    encoding = response.get('Content-Encoding')
+    if encoding in ('gzip', 'deflate'):
+        body = zlib.decompress(body, 47)
+    elif encoding == 'br' and brotli is not None:
+        # Gateway gửi Accept-Encoding: identity nhưng upstream vẫn có thể trả body nén
+        body = brotli.decompress(body)
+    if not body:
+        return None
+    content_type = response.get('Content-Type') or ''
+    if 'json' in content_type:
+        try:
+            return json.loads(body)
+        except ValueError:
+            pass
+    return body.decode('utf-8', errors='replace')
+
+
+def result(spec, response, body):
+    return {'id': spec['id'], 'status': response.status_code, 'body': decode_body(response, body)}
+
+
+def cancelled(spec):
+    return {'id': spec['id'], 'status': 424, 'body': {'error': 'Bị hủy do request khác trong batch lỗi'}}
+
+
+def error_result(spec, error):
+    return {'id': spec['id'], 'status': 500, 'body': {'error': str(error)}}
+
+
+def batch_response(on_error, results):
+    failed = sum(1 for item in results if item['status'] >= 400)
+    status = 424 if on_error == 'abort' and failed else 200
+    return JsonResponse({'results': results, 'failed': failed}, status=status)
+
+
+def run_one(parent, spec):
+    request, path = build_subrequest(parent, spec)
+    try:
+        response = proxy(request, path)
+        try:
+            body = b''.join(response) if response.streaming else response.content
+        finally:
+            response.close()
+    except Exception as e:
+        return error_result(spec, e)
+    return result(spec, response, body)
+
+
+async def arun_one(parent, spec):
+    request, path = build_subrequest(parent, spec)
+    try:
+        response = await async_proxy(request, path)
+        if response.streaming:
+            body = b''.join([chunk async for chunk in response])
+        else:
+            body = response.content
+    except Exception as e:
+        return error_result(spec, e)
+    return result(spec, response, body)
+
+
+@csrf_exempt
+@require_POST
+def batch(request):
+    try:
+        on_error, specs = parse_batch(request)
+    except BatchError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    futures = {get_executor().submit(run_one, request, spec): spec['id'] for spec in specs}
+    results = {}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[futures[future]] = future.result()
+        if on_error == 'abort' and any(item['status'] >= 400 for item in results.values()):
+            for future in pending:
+                future.cancel()
+            break
+
+    return batch_response(on_error, [results.get(spec['id']) or cancelled(spec) for spec in specs])
+
+
+@csrf_exempt
+@require_POST
+async def async_batch(request):
+    try:
+        on_error, specs = parse_batch(request)
+    except BatchError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    tasks = {asyncio.ensure_future(arun_one(request, spec)): spec['id'] for spec in specs}
+    results = {}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                results[tasks[task]] = task.result()
+            if on_error == 'abort' and any(item['status'] >= 400 for item in results.values()):
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return batch_response(on_error, [results.get(spec['id']) or cancelled(spec) for spec in specs])
@@ -0,0 +1,187 @@
+import math
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.http import JsonResponse
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker cho một upstream, dựa trên cửa sổ trượt theo thời gian:
+
+    closed     request đi qua bình thường; mở mạch khi trong cửa sổ có ít nhất min_requests
+               và tỉ lệ lỗi (exception, 5xx) hoặc tỉ lệ request chậm vượt ngưỡng
+    open       trả 503 ngay, không gọi upstream, trong open_seconds
+    half_open  cho tối đa half_open_calls request thử; tất cả thành công thì đóng mạch,
+               một request lỗi/chậm thì mở lại
+    """
+    def __init__(self, name, window, min_requests, error_rate, slow_call, slow_rate, open_seconds,
+                 half_open_calls, max_samples=1000):
+        self.name = name
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self.rejected = 0
+        self._samples = deque(maxlen=max_samples)     # (thời điểm, lỗi, chậm, thời gian xử lý)
+        self._failures = 0
+        self._slow = 0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True nếu request được gọi upstream; khi đó bắt buộc phải gọi record() sau đó"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, success, duration):
+        now = time.monotonic()
+        slow = duration >= self.slow_call
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if success and not slow:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._close()
+                else:
+                    self._open(now)
+                return
+            if self.state == OPEN:
+                # Request bắt đầu trước khi mạch mở
+                return
+
+            if len(self._samples) == self._samples.maxlen:
+                self._forget(self._samples[0])
+            self._samples.append((now, not success, slow, duration))
+            self._failures += not success
+            self._slow += slow
+            self._prune(now)
+
+            total = len(self._samples)
+            if total >= self.min_requests and (
+                self._failures / total >= self.error_rate or self._slow / total >= self.slow_rate
+            ):
+                self._open(now)
+
+    def cancel(self):
+        """Request đã được allow() nhưng bị hủy trước khi có kết quả"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != OPEN:
+                return 0
+            return max(1, math.ceil(self.open_seconds - (time.monotonic() - self.opened_at)))
+
+    def snapshot(self):
+        with self._lock:
+            self._prune(time.monotonic())
+            total = len(self._samples)
+            durations = sorted(sample[3] for sample in self._samples)
+            return {
+                'state': self.state,
+                'requests': total,
+                'error_rate': round(self._failures / total, 3) if total else 0.0,
+                'slow_rate': round(self._slow / total, 3) if total else 0.0,
+                'latency_p50_ms': round(durations[total // 2] * 1000, 1) if total else None,
+                'latency_p95_ms': round(durations[min(total - 1, int(total * 0.95))] * 1000, 1) if total else None,
+                'opened_count': self.opened_count,
+                'rejected': self.rejected,
+            }
+
+    def _prune(self, now):
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._forget(self._samples.popleft())
+
+    def _forget(self, sample):
+        self._failures -= sample[1]
+        self._slow -= sample[2]
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.opened_count += 1
+
+    def _close(self):
+        self.state = CLOSED
+        self._samples.clear()
+        self._failures = 0
+        self._slow = 0
+
+
+# {netloc: CircuitBreaker}, dùng chung cho forward_request và forward_request_async
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def upstream_names():
+    return {
+        urlparse(getattr(settings, name)).netloc: name
+        for name in settings.UPSTREAM_TIMEOUTS
+        if getattr(settings, name, None)
+    }
+
+
+def get_breaker(url):
+    netloc = urlparse(url).netloc
+    breaker = _breakers.get(netloc)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(netloc)
+            if breaker is None:
+                breaker = _breakers[netloc] = CircuitBreaker(
+                    upstream_names().get(netloc, netloc),
+                    window=settings.CIRCUIT_BREAKER_WINDOW,
+                    min_requests=settings.CIRCUIT_BREAKER_MIN_REQUESTS,
+                    error_rate=settings.CIRCUIT_BREAKER_ERROR_RATE,
+                    slow_call=settings.CIRCUIT_BREAKER_SLOW_CALL,
+                    slow_rate=settings.CIRCUIT_BREAKER_SLOW_RATE,
+                    open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+                    half_open_calls=settings.CIRCUIT_BREAKER_HALF_OPEN_CALLS,
+                )
+    return breaker
+
+
+def unavailable_response(breaker):
+    response = JsonResponse(
+        {'error': f'{breaker.name} tạm thời không khả dụng', 'circuit': breaker.state},
+        status=503,
+    )
+    response['Retry-After'] = str(breaker.retry_after() or 1)
+    return response
+
+
+def breaker_stats():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
@@ -0,0 +1,236 @@
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+from .upstream import PASSTHROUGH_HEADERS
+
+
+class CachedResponse:
+    __slots__ = ('status', 'content_type', 'headers', 'body', 'expires', 'tags')
+
+    def __init__(self, status, content_type, headers, body, expires, tags):
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+        self.tags = tags
+
+    def to_response(self, cache_status='HIT'):
+        response = HttpResponse(self.body, status=self.status, content_type=self.content_type)
+        for name, value in self.headers:
+            response[name] = value
+        if cache_status:
+            response['X-Cache'] = cache_status
+        return response
+
+
+class ResponseCache:
+    """
+    Cache in-process (LRU + TTL) cho response GET của gateway.
+    Mỗi entry gắn các tag để xóa khi route ghi tương ứng thành công,
+    vd POST /appointments/schedules/ xóa tag 'doctor_schedule:<doctor_id>'.
+    """
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = defaultdict(set)
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0})
+
+    def get(self, key, route):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= now:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._stats[route]['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats[route]['hits'] += 1
+            return entry
+
+    def set(self, key, route, entry):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            for tag in entry.tags:
+                self._tags[tag].add(key)
+            self._stats[route]['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, *tags):
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if key in self._entries:
+                        self._stats[key[0]]['invalidations'] += 1
+                        self._remove(key)
+                        removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._stats.clear()
+
+    def stats(self):
+        with self._lock:
+            routes = {}
+            for route, counters in self._stats.items():
+                lookups = counters['hits'] + counters['misses']
+                routes[route] = dict(counters, hit_ratio=round(counters['hits'] / lookups, 3) if lookups else None)
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'routes': routes}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+response_cache = ResponseCache(max_entries=settings.GATEWAY_CACHE_MAX_ENTRIES)
+
+
+def route_ttl(route):
+    return settings.GATEWAY_CACHE_TTLS.get(route, 0)
+
+
+def cache_key(request, route, public=False):
+    """Key gồm route, path, query đã sắp xếp và phạm vi auth (hash của Authorization header)"""
+    if public:
+        scope = 'public'
+    else:
+        auth = request.headers.get('Authorization') or ''
+        scope = hashlib.blake2b(auth.encode(), digest_size=16).hexdigest() if auth else 'anonymous'
+    query = tuple(sorted((k, v) for k, values in request.GET.lists() for v in values))
+    return (route, request.path, query, scope)
+
+
+def cache_tags(request, route, tag=None):
+    tags = [route]
+    if tag:
+        try:
+            tags.append(tag.format(**request.GET.dict()))
+        except KeyError:
+            pass
+    return tuple(tags)
+
+
+def is_cacheable(response):
+    if response.status_code != 200:
+        return False
+    if isinstance(response, Response):
+        # DRF Response chưa render (lỗi do gateway tự trả về), không phải body của upstream
+        return False
+    length = response.get('Content-Length')
+    return length is None or int(length) <= settings.GATEWAY_CACHE_MAX_BODY
+
+
+def make_entry(response, body, ttl, tags):
+    headers = tuple(
+        (name, response[name]) for name in PASSTHROUGH_HEADERS
+        if name != 'Content-Length' and response.has_header(name)
+    )
+    return CachedResponse(
+        response.status_code,
+        response.get('Content-Type'),
+        headers,
+        body,
+        time.monotonic() + ttl,
+        tags,
+    )
+
+
+def buffer_body(response):
+    """
+    Đọc body của response vào bộ nhớ, tối đa GATEWAY_CACHE_MAX_BODY byte (chunked thì không biết trước độ dài).
+    Body lớn hơn thì trả về None; response vẫn stream được: phần đã đọc rồi tới phần còn lại của upstream.
+    """
+    limit = settings.GATEWAY_CACHE_MAX_BODY
+    if not response.streaming:
+        return response.content if len(response.content) <= limit else None
+    chunks = []
+    size = 0
+    iterator = iter(response.streaming_content)
+    try:
+        for chunk in iterator:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > limit:
+                response.streaming_content = itertools.chain(chunks, iterator)
+                return None
+    except BaseException:
+        response.close()
+        raise
+    response.close()
+    return b''.join(chunks)
+
+
+async def achain(chunks, iterator):
+    for chunk in chunks:
+        yield chunk
+    async for chunk in iterator:
+        yield chunk
+
+
+async def abuffer_body(response):
+    """Bản async của buffer_body"""
+    limit = settings.GATEWAY_CACHE_MAX_BODY
+    if not response.streaming:
+        return response.content if len(response.content) <= limit else None
+    chunks = []
+    size = 0
+    iterator = response.streaming_content
+    async for chunk in iterator:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            response.streaming_content = achain(chunks, iterator)
+            return None
+    return b''.join(chunks)
+
+
+def store_response(key, route, response, ttl, tags):
+    if not is_cacheable(response):
+        return response
+    body = buffer_body(response)
+    if body is None:
+        # Quá lớn để cache: stream thẳng về client
+        return response
+    entry = make_entry(response, body, ttl, tags)
+    response_cache.set(key, route, entry)
+    return entry.to_response('MISS')
+
+
+async def astore_response(key, route, response, ttl, tags):
+    if not is_cacheable(response):
+        return response
+    body = await abuffer_body(response)
+    if body is None:
+        return response
+    entry = make_entry(response, body, ttl, tags)
+    response_cache.set(key, route, entry)
+    return entry.to_response('MISS')
+
+
+def invalidate_on_success(response, *tags):
+    """Xóa cache theo tag khi request ghi tới upstream thành công"""
+    if 200 <= response.status_code < 300:
+        response_cache.invalidate(*tags)
+    return response
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import weakref
+from collections import defaultdict
+
+from django.conf import settings
+from rest_framework.response import Response
+
+from .cache import abuffer_body, buffer_body, make_entry
+
+
+class Flight:
+    __slots__ = ('event', 'entry')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+
+
+def is_shareable(response):
+    if isinstance(response, Response):
+        return False
+    length = response.get('Content-Length')
+    return length is None or int(length) <= settings.GATEWAY_CACHE_MAX_BODY
+
+
+class SingleFlight:
+    """
+    Gộp các request GET giống hệt nhau (cùng path, query và phạm vi auth) đang chạy đồng thời:
+    request đầu tiên (leader) gọi upstream, các request đến sau chờ và dùng chung body của leader.
+    Response quá lớn để đọc vào bộ nhớ (Content-Length, hoặc đếm byte khi upstream trả chunked)
+    thì không chia sẻ: leader stream thẳng về client, các request chờ tự gọi upstream.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._loop_calls = weakref.WeakKeyDictionary()     # {event loop: {key: Future}}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'leaders': 0, 'coalesced': 0, 'fallbacks': 0})
+
+    def do(self, key, route, fn):
+        """fn() trả về response của upstream; dùng cho view sync (mỗi request một thread)"""
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = Flight()
+                self._stats[route]['leaders'] += 1
+
+        if leader:
+            response = None
+            try:
+                response = fn()
+                body = buffer_body(response) if is_shareable(response) else None
+                if body is not None:
+                    flight.entry = make_entry(response, body, 0, ())
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                flight.event.set()
+            return flight.entry.to_response(None) if flight.entry is not None else response
+
+        if flight.event.wait(settings.GATEWAY_COALESCE_WAIT) and flight.entry is not None:
+            self._count(route, 'coalesced')
+            return flight.entry.to_response(None)
+        self._count(route, 'fallbacks')
+        return fn()
+
+    async def ado(self, key, route, fn):
+        """Bản async của do(); fn là coroutine function"""
+        loop = asyncio.get_running_loop()
+        calls = self._loop_calls.get(loop)
+        if calls is None:
+            calls = self._loop_calls[loop] = {}
+
+        future = calls.get(key)
+        if future is None:
+            future = calls[key] = loop.create_future()
+            self._count(route, 'leaders')
+            entry = None
+            response = None
+            try:
+                response = await fn()
+                body = await abuffer_body(response) if is_shareable(response) else None
+                if body is not None:
+                    entry = make_entry(response, body, 0, ())
+            finally:
+                del calls[key]
+                # Leader bị hủy (client ngắt kết nối) thì các request chờ nhận None và tự gọi upstream
+                future.set_result(entry)
+            return entry.to_response(None) if entry is not None else response
+
+        try:
+            entry = await asyncio.wait_for(asyncio.shield(future), settings.GATEWAY_COALESCE_WAIT)
+        except asyncio.TimeoutError:
+            entry = None
+        if entry is not None:
+            self._count(route, 'coalesced')
+            return entry.to_response(None)
+        self._count(route, 'fallbacks')
+        return await fn()
+
+    def _count(self, route, name):
+        with self._lock:
+            self._stats[route][name] += 1
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls) + sum(len(calls) for calls in self._loop_calls.values())
+            return {'in_flight': in_flight, 'routes': {route: dict(counters) for route, counters in self._stats.items()}}
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,160 @@
+"""
+Nén response (gzip, brotli) theo Accept-Encoding của client, dùng trong CompressionMiddleware.
+
+Chỉ nén body kiểu text/JSON từ GATEWAY_COMPRESS_MIN_SIZE byte trở lên. Response stream từ upstream
+(không có Content-Length hoặc đủ lớn) được nén theo từng chunk nên gateway không giữ cả body trong bộ nhớ.
+Brotli là tùy chọn: thiếu package brotli thì chỉ dùng gzip.
+"""
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+_no_transform = re.compile(r'\bno-transform\b', re.IGNORECASE)
+
+
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level=None):
+        # wbits=31: định dạng gzip (header + CRC) thay vì zlib thô
+        self._compressor = zlib.compressobj(
+            settings.GATEWAY_GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31,
+        )
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, quality=None):
+        self._compressor = brotli.Compressor(
+            mode=brotli.MODE_TEXT,
+            quality=settings.GATEWAY_BROTLI_QUALITY if quality is None else quality,
+        )
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+# Thứ tự ưu tiên khi client chấp nhận nhiều encoding với cùng q
+ENCODERS = {'br': BrotliEncoder, 'gzip': GzipEncoder} if brotli is not None else {'gzip': GzipEncoder}
+
+
+def parse_accept_encoding(header):
+    """{encoding: q} từ header Accept-Encoding"""
+    weights = {}
+    for item in (header or '').split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    return weights
+
+
+def negotiate(header):
+    """Encoding dùng để nén response, hoặc None nếu client không nhận encoding nào gateway hỗ trợ"""
+    weights = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for name in ENCODERS:
+        q = weights.get(name, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compressible(response):
+    """Response có thể nén (chưa xét Accept-Encoding và kích thước)"""
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.has_header('Content-Encoding') or response.has_header('Content-Range'):
+        return False
+    if _no_transform.search(response.get('Cache-Control', '')):
+        return False
+    content_type = response.get('Content-Type', '').split(';', 1)[0].strip().lower()
+    return content_type.startswith(settings.GATEWAY_COMPRESS_TYPES)
+
+
+def body_length(response):
+    length = response.get('Content-Length')
+    if length is not None:
+        return int(length)
+    if not response.streaming:
+        return len(response.content)
+    return None
+
+
+def compress_iter(iterator, encoder):
+    for chunk in iterator:
+        data = encoder.compress(chunk)
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+async def acompress_iter(iterator, encoder):
+    async for chunk in iterator:
+        data = encoder.compress(chunk)
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+def compress_response(request, response):
+    if not compressible(response):
+        return response
+    length = body_length(response)
+    if length is not None and length < settings.GATEWAY_COMPRESS_MIN_SIZE:
+        return response
+
+    # Cùng URL có thể trả body nén hoặc không tùy Accept-Encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    encoder = ENCODERS[encoding]()
+
+    if response.streaming:
+        if response.is_async:
+            response.streaming_content = acompress_iter(response.streaming_content, encoder)
+        else:
+            response.streaming_content = compress_iter(response.streaming_content, encoder)
+        del response['Content-Length']
+    else:
+        body = encoder.compress(response.content) + encoder.finish()
+        if len(body) >= length:
+            return response
+        response.content = body
+        response['Content-Length'] = str(len(body))
+
+    # Body đã khác từng byte so với bản gốc nên ETag chỉ còn là weak (giống GZipMiddleware của Django);
+    # router/etag.py so sánh weak nên If-None-Match vẫn khớp
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    response['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,265 @@
+import jwt
+from django.conf import settings
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from token_cache import decode_token
+
+from . import cache, etag, ratelimit
+from .aio import forward_request_async, parse_body
+from .coalesce import single_flight
+from .routes import ROUTES
+from .views import forward_request
+
+
+CONVERTERS = {
+    'int': lambda value: int(value) if value.isdigit() else None,
+    'str': lambda value: value or None,
+}
+
+
+class TrieNode:
+    __slots__ = ('children', 'params', 'route')
+
+    def __init__(self):
+        self.children = {}      # segment tĩnh -> node
+        self.params = []        # [(tên tham số, converter, node)]
+        self.route = None
+
+
+class RouteTrie:
+    """Prefix-trie theo từng segment của path; segment tĩnh được ưu tiên hơn tham số"""
+
+    def __init__(self, routes=()):
+        self.root = TrieNode()
+        for route in routes:
+            self.add(route)
+
+    def add(self, route):
+        node = self.root
+        for segment in route.pattern.strip('/').split('/'):
+            if segment.startswith('<') and segment.endswith('>'):
+                converter, _, name = segment[1:-1].rpartition(':')
+                converter = converter or 'str'
+                for param_name, param_converter, child in node.params:
+                    if param_name == name and param_converter is CONVERTERS[converter]:
+                        node = child
+                        break
+                else:
+                    child = TrieNode()
+                    node.params.append((name, CONVERTERS[converter], child))
+                    node = child
+            else:
+                node = node.children.setdefault(segment, TrieNode())
+        if node.route is not None:
+            raise ValueError(f"Route trùng lặp: {route.pattern}")
+        node.route = route
+
+    def match(self, path):
+        """Trả về (route, kwargs) hoặc (None, None)"""
+        if not path.endswith('/'):
+            return None, None
+        segments = path.strip('/').split('/')
+        kwargs = {}
+        route = self._match(self.root, segments, 0, kwargs)
+        return (route, kwargs) if route is not None else (None, None)
+
+    def _match(self, node, segments, index, kwargs):
+        if index == len(segments):
+            return node.route
+        segment = segments[index]
+        child = node.children.get(segment)
+        if child is not None:
+            route = self._match(child, segments, index + 1, kwargs)
+            if route is not None:
+                return route
+        for name, converter, child in node.params:
+            value = converter(segment)
+            if value is None:
+                continue
+            kwargs[name] = value
+            route = self._match(child, segments, index + 1, kwargs)
+            if route is not None:
+                return route
+            del kwargs[name]
+        return None
+
+
+router = RouteTrie(ROUTES)
+
+
+def build_forward(route, request, kwargs):
+    """
+    Chuẩn bị tham số cho forward_request từ route và request.
+    Trả về dict tham số, hoặc JsonResponse nếu request không hợp lệ.
+    """
+    for name in route.required_params:
+        if not request.GET.get(name):
+            return JsonResponse({"error": f"Thiếu {name}"}, status=400)
+
+    auth = request.headers.get('Authorization', '')
+    payload = None
+    if route.needs_token(request.method):
+        if not auth.startswith('Bearer '):
+            return JsonResponse({'error': 'Missing Bearer token'}, status=401)
+        try:
+            payload = decode_token(auth.split(' ', 1)[1])
+        except jwt.PyJWTError as e:
+            return JsonResponse({'error': 'Invalid token', 'detail': str(e)}, status=401)
+
+    data = None
+    body = None
+    if route.forward_body and request.method in ('POST', 'PUT'):
+        if request.body and request.content_type != 'application/json':
+            # Không sửa được body dạng form/multipart để gán patient_id
+            if route.inject_patient_id:
+                return JsonResponse({'error': 'Content-Type phải là application/json'}, status=415)
+            # Form, multipart...: chuyển tiếp nguyên body và Content-Type (giữ file và key lặp lại)
+            body = request.body
+        else:
+            try:
+                data = parse_body(request)
+            except ValueError:
+                return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+            if route.inject_patient_id:
+                data = data or {}
+                if not isinstance(data, dict):
+                    return JsonResponse({'error': 'JSON body must be an object'}, status=400)
+                data = dict(data)
+                data['patient_id'] = payload.get('user_id')
+
+    params = None
+    if route.forward_query:
+        params = [(k, v) for k, values in request.GET.lists() for v in values]
+        if route.default_role and 'role' not in request.GET:
+            params.append(('role', payload.get('role', 'PATIENT')))
+
+    headers = {'Authorization': auth} if auth and route.forward_auth else {}
+    if body is not None:
+        headers['Content-Type'] = request.headers['Content-Type']
+    if route.etag and request.method == 'GET' and 'If-None-Match' in request.headers:
+        headers['If-None-Match'] = request.headers['If-None-Match']
+
+    return {
+        'method': request.method,
+        'url': f"{getattr(settings, route.service)}{route.path_for(request.method, **kwargs)}",
+        'data': data,
+        'body': body,
+        'headers': headers,
+        'params': params,
+        'timeout': route.timeout,
+        # Chỉ GET mới được gửi lại (retry khi lỗi kết nối, hedge khi chậm)
+        'retries': settings.GATEWAY_RETRY_ATTEMPTS if request.method == 'GET' else 0,
+        'hedge': route.name if route.hedge and request.method == 'GET' else None,
+    }
+
+
+def invalidate(route, request, forward, response):
+    if not route.invalidates or request.method == 'GET':
+        return
+    # Body form/multipart được chuyển tiếp nguyên vẹn, đọc field của tag từ request.POST
+    fields = forward['data'] if isinstance(forward['data'], dict) else request.POST.dict()
+    tags = []
+    for tag in route.invalidates:
+        try:
+            tags.append(tag.format(**fields))
+        except KeyError:
+            pass
+    cache.invalidate_on_success(response, *tags)
+
+
+def resolve(request, path):
+    route, kwargs = router.match(path)
+    request.route_name = route.name if route is not None else 'unmatched'
+    if route is None:
+        return None, None, JsonResponse({'error': 'Không tìm thấy route'}, status=404)
+    if request.method not in route.methods:
+        return None, None, HttpResponseNotAllowed(route.methods)
+    return route, kwargs, None
+
+
+def conditional(route, request, response):
+    if route.etag and request.method == 'GET':
+        return etag.conditional(request, response)
+    return response
+
+
+async def aconditional(route, request, response):
+    if route.etag and request.method == 'GET':
+        return await etag.aconditional(request, response)
+    return response
+
+
+def coalesce_key(route, request):
+    if not (route.coalesce and request.method == 'GET' and settings.GATEWAY_COALESCE):
+        return None
+    key = cache.cache_key(request, route.name, route.cache_public)
+    if route.etag:
+        # If-None-Match được chuyển tiếp lên upstream nên response (200 hoặc 304) phụ thuộc vào nó
+        key += (request.headers.get('If-None-Match'),)
+    return key
+
+
+@csrf_exempt
+def proxy(request, path):
+    """View duy nhất xử lý mọi route trong ROUTES (WSGI)"""
+    route, kwargs, error = resolve(request, path)
+    if error is not None:
+        return error
+
+    ttl = cache.route_ttl(route.cache) if route.cache and request.method == 'GET' else 0
+    if ttl:
+        key = cache.cache_key(request, route.cache, route.cache_public)
+        entry = cache.response_cache.get(key, route.cache)
+        if entry is not None:
+            return conditional(route, request, entry.to_response())
+
+    rejected = ratelimit.admit(route, request)
+    if rejected is not None:
+        return rejected
+    forward = build_forward(route, request, kwargs)
+    if isinstance(forward, JsonResponse):
+        return forward
+    flight_key = coalesce_key(route, request)
+    if flight_key is not None:
+        response = single_flight.do(flight_key, route.name, lambda: forward_request(**forward))
+    else:
+        response = forward_request(**forward)
+    invalidate(route, request, forward, response)
+
+    if ttl:
+        tags = cache.cache_tags(request, route.cache, route.cache_tag)
+        response = cache.store_response(key, route.cache, response, ttl, tags)
+    return conditional(route, request, response)
+
+
+@csrf_exempt
+async def async_proxy(request, path):
+    """Bản async của proxy(), dùng khi GATEWAY_ASYNC=True (ASGI)"""
+    route, kwargs, error = resolve(request, path)
+    if error is not None:
+        return error
+
+    ttl = cache.route_ttl(route.cache) if route.cache and request.method == 'GET' else 0
+    if ttl:
+        key = cache.cache_key(request, route.cache, route.cache_public)
+        entry = cache.response_cache.get(key, route.cache)
+        if entry is not None:
+            return await aconditional(route, request, entry.to_response())
+
+    rejected = ratelimit.admit(route, request)
+    if rejected is not None:
+        return rejected
+    forward = build_forward(route, request, kwargs)
+    if isinstance(forward, JsonResponse):
+        return forward
+    flight_key = coalesce_key(route, request)
+    if flight_key is not None:
+        response = await single_flight.ado(flight_key, route.name, lambda: forward_request_async(**forward))
+    else:
+        response = await forward_request_async(**forward)
+    invalidate(route, request, forward, response)
+
+    if ttl:
+        tags = cache.cache_tags(request, route.cache, route.cache_tag)
+        response = await cache.astore_response(key, route.cache, response, ttl, tags)
+    return await aconditional(route, request, response)
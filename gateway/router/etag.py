@@ -0,0 +1,90 @@
+"""
+Conditional GET (ETag / If-None-Match) cho các route có Route(etag=True).
+
+If-None-Match của client được chuyển tiếp lên upstream; upstream có version của dữ liệu
+(vd appointment_service) trả 304 mà không cần query danh sách. Upstream không gửi ETag thì gateway
+tự tính strong ETag từ body và trả 304 khi khớp, client không phải tải và render lại danh sách.
+"""
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+from .cache import abuffer_body, buffer_body, make_entry
+
+
+def make_etag(body):
+    return '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def matches(if_none_match, etag):
+    """So sánh weak theo RFC 9110: bỏ tiền tố W/ ở cả hai phía"""
+    if not if_none_match or not etag:
+        return False
+    candidates = parse_etags(if_none_match)
+    if '*' in candidates:
+        return True
+    etag = etag.removeprefix('W/')
+    return any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def needs_body(response):
+    """
+    True nếu phải đọc body để tự tính ETag. Body chunked được đọc tối đa GATEWAY_CACHE_MAX_BODY byte
+    (cache.buffer_body), lớn hơn thì stream về client không có ETag.
+    """
+    if response.has_header('ETag'):
+        return False
+    length = response.get('Content-Length')
+    return length is None or int(length) <= settings.GATEWAY_CACHE_MAX_BODY
+
+
+def eligible(response):
+    return response.status_code == 200 and not isinstance(response, Response)
+
+
+def finish(request, response, body=None):
+    if body is not None:
+        # Body stream của upstream đã được đọc hết, dựng lại response từ body
+        rebuilt = make_entry(response, body, 0, ()).to_response(response.get('X-Cache'))
+        rebuilt['ETag'] = make_etag(body)
+        response = rebuilt
+    elif not response.has_header('ETag'):
+        if response.streaming:
+            return response
+        response['ETag'] = make_etag(response.content)
+
+    if not response.has_header('Cache-Control'):
+        # Trình duyệt luôn hỏi lại gateway (gửi If-None-Match) trước khi dùng bản đã lưu
+        response['Cache-Control'] = 'private, no-cache'
+    if matches(request.headers.get('If-None-Match'), response['ETag']):
+        response.close()
+        return not_modified(response['ETag'])
+    return response
+
+
+def conditional(request, response):
+    if not eligible(response):
+        return response
+    body = None
+    if response.streaming and needs_body(response):
+        body = buffer_body(response)
+    return finish(request, response, body)
+
+
+async def aconditional(request, response):
+    if not eligible(response):
+        return response
+    body = None
+    if response.streaming and needs_body(response):
+        body = await abuffer_body(response)
+    return finish(request, response, body)
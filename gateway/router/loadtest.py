@@ -0,0 +1,360 @@
+"""
+Load test gateway qua HTTP thật, dùng bởi `manage.py loadtest`.
+
+Gateway chạy ở process riêng (runserver, hoặc uvicorn khi GATEWAY_ASYNC), các upstream là StubUpstream
+hoặc appointment_service/user_service thật trên DB SQLite tạm. Mỗi virtual user gửi liên tục các request
+theo tỉ lệ của mix; kết quả (RPS, p50/p95/p99 theo từng kịch bản) ghi ra JSON để so sánh giữa các commit.
+"""
+import asyncio
+import datetime
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+import jwt
+import requests
+
+
+PASSWORD = 'loadtest-Passw0rd'
+
+DEFAULT_MIX = 'login=1,list_appointments=5,available_slots=3,create_appointment=1'
+
+# Giờ làm việc của bác sĩ được tạo khi seed dữ liệu cho service thật
+WORK_START = datetime.time(8, 0)
+WORK_END = datetime.time(17, 0)
+
+
+class LoadTestError(RuntimeError):
+    pass
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def clean_env(**overrides):
+    """Môi trường cho process con: bỏ DJANGO_SETTINGS_MODULE của gateway để service dùng settings của nó"""
+    env = {key: value for key, value in os.environ.items() if key != 'DJANGO_SETTINGS_MODULE'}
+    env.update({key: str(value) for key, value in overrides.items()})
+    return env
+
+
+class ServiceProcess:
+    """Một server Django (runserver/uvicorn) chạy ở process con, log ghi ra file"""
+    def __init__(self, name, cwd, args, env, log_path, port):
+        self.name = name
+        self.cwd = cwd
+        self.args = args
+        self.env = env
+        self.log_path = log_path
+        self.port = port
+        self.process = None
+        self._log = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def start(self, timeout=60):
+        self._log = open(self.log_path, 'ab')
+        self.process = subprocess.Popen(
+            [sys.executable, *self.args], cwd=self.cwd, env=self.env, stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise LoadTestError(f'{self.name} dừng khi khởi động, xem {self.log_path}')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.5).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        raise LoadTestError(f'{self.name} không mở cổng {self.port} sau {timeout}s, xem {self.log_path}')
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+def gateway_process(gateway_dir, upstreams, log_dir, asgi=False, rate_limit=False):
+    port = free_port()
+    env = clean_env(GATEWAY_ASYNC=asgi, GATEWAY_RATE_LIMIT=rate_limit, **upstreams)
+    if asgi:
+        args = ['-m', 'uvicorn', 'gateway.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+                '--log-level', 'warning', '--no-access-log']
+    else:
+        args = ['manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+    return ServiceProcess('gateway', gateway_dir, args, env, log_dir / 'gateway.log', port)
+
+
+def django_service(name, service_dir, log_dir, db_dir):
+    """Service thật chạy runserver trên DB SQLite tạm (SQLITE_PATH), đã migrate"""
+    port = free_port()
+    env = clean_env(SQLITE_PATH=db_dir / f'{name}.sqlite3')
+    log_path = log_dir / f'{name}.log'
+    with open(log_path, 'ab') as log:
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'migrate', '--noinput'],
+            cwd=service_dir, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    if result.returncode != 0:
+        raise LoadTestError(f'migrate {name} lỗi, xem {log_path}')
+    return ServiceProcess(name, service_dir, ['manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload'],
+                          env, log_path, port)
+
+
+class Account:
+    __slots__ = ('username', 'user_id', 'token')
+
+    def __init__(self, username, user_id, token):
+        self.username = username
+        self.user_id = user_id
+        self.token = token
+
+
+class Fixture:
+    """Tài khoản, bác sĩ và các thời điểm có thể đặt lịch mà các kịch bản dùng"""
+    def __init__(self, patients, doctors, days=30):
+        self.patients = patients
+        self.doctors = doctors
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        self.dates = [tomorrow + datetime.timedelta(days=offset) for offset in range(days)]
+        start = datetime.datetime.combine(tomorrow, WORK_START)
+        slots = int((datetime.datetime.combine(tomorrow, WORK_END) - start).total_seconds() // 900)
+        self.times = [(start + datetime.timedelta(minutes=15 * index)).time() for index in range(slots)]
+
+
+def stub_fixture(secret_key, patients, doctors):
+    """Với StubUpstream, token được ký trực tiếp bằng SECRET_KEY của gateway"""
+    expires = int(time.time()) + 24 * 3600
+
+    def account(user_id, role):
+        token = jwt.encode({'user_id': user_id, 'role': role, 'exp': expires}, secret_key, algorithm='HS256')
+        return Account(f'{role.lower()}{user_id}', user_id, token)
+
+    return Fixture(
+        [account(index + 1, 'PATIENT') for index in range(patients)],
+        [account(1000 + index, 'DOCTOR') for index in range(doctors)],
+    )
+
+
+def seed_fixture(gateway_url, patients, doctors):
+    """Tạo tài khoản và lịch làm việc qua API của gateway (service thật, DB trống)"""
+    session = requests.Session()
+
+    def register(username, role):
+        response = session.post(f'{gateway_url}/api/users/register/', json={
+            'username': username, 'email': f'{username}@loadtest.local', 'password': PASSWORD,
+            'role': role, 'first_name': 'Load', 'last_name': username,
+        })
+        if response.status_code != 201:
+            raise LoadTestError(f'Không tạo được {username}: {response.status_code} {response.text[:200]}')
+        response = session.post(f'{gateway_url}/api/users/login/', json={'username': username, 'password': PASSWORD})
+        if response.status_code != 200:
+            raise LoadTestError(f'Không đăng nhập được {username}: {response.status_code} {response.text[:200]}')
+        token = response.json()['token']['access']
+        payload = jwt.decode(token, options={'verify_signature': False})
+        return Account(username, payload['user_id'], token)
+
+    doctor_accounts = [register(f'lt_doctor{index}', 'DOCTOR') for index in range(doctors)]
+    patient_accounts = [register(f'lt_patient{index}', 'PATIENT') for index in range(patients)]
+    for doctor in doctor_accounts:
+        for weekday in range(7):
+            response = session.post(
+                f'{gateway_url}/api/appointments/schedules/',
+                headers={'Authorization': f'Bearer {doctor.token}'},
+                json={
+                    'doctor_id': doctor.user_id, 'weekday': weekday,
+                    'start_time': WORK_START.isoformat(), 'end_time': WORK_END.isoformat(),
+                    'max_patients_per_hour': 4, 'appointment_duration': 30,
+                },
+            )
+            if response.status_code != 201:
+                raise LoadTestError(f'Không tạo được lịch làm việc: {response.status_code} {response.text[:200]}')
+    return Fixture(patient_accounts, doctor_accounts)
+
+
+# Mỗi kịch bản trả về (method, path, kwargs của aiohttp) cho một request
+
+def login(fixture, rng):
+    patient = rng.choice(fixture.patients)
+    return 'POST', '/api/users/login/', {'json': {'username': patient.username, 'password': PASSWORD}}
+
+
+def list_appointments(fixture, rng):
+    patient = rng.choice(fixture.patients)
+    return 'GET', '/api/appointments/', {'headers': {'Authorization': f'Bearer {patient.token}'}}
+
+
+def available_slots(fixture, rng):
+    patient = rng.choice(fixture.patients)
+    params = {'doctor_id': rng.choice(fixture.doctors).user_id, 'date': rng.choice(fixture.dates).isoformat()}
+    return 'GET', '/api/appointments/available-slots/', {
+        'headers': {'Authorization': f'Bearer {patient.token}'}, 'params': params,
+    }
+
+
+def create_appointment(fixture, rng):
+    patient = rng.choice(fixture.patients)
+    scheduled = datetime.datetime.combine(rng.choice(fixture.dates), rng.choice(fixture.times))
+    return 'POST', '/api/appointments/create/', {
+        'headers': {'Authorization': f'Bearer {patient.token}'},
+        'json': {
+            'doctor_id': rng.choice(fixture.doctors).user_id,
+            'scheduled_time': scheduled.isoformat(),
+            'reason': 'Khám định kỳ (load test)',
+        },
+    }
+
+
+SCENARIOS = {
+    'login': login,
+    'list_appointments': list_appointments,
+    'available_slots': available_slots,
+    'create_appointment': create_appointment,
+}
+
+
+def parse_mix(value):
+    """'login=1,list_appointments=5' -> {'login': 1.0, 'list_appointments': 5.0}"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise LoadTestError(f"Kịch bản không tồn tại: {name} (có: {', '.join(SCENARIOS)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise LoadTestError(f'Tỉ lệ không hợp lệ: {item}')
+    if not any(weight > 0 for weight in mix.values()):
+        raise LoadTestError('Mix phải có ít nhất một kịch bản với tỉ lệ > 0')
+    return mix
+
+
+async def run_load(base_url, fixture, mix, concurrency, duration, warmup=0.0, seed=0, timeout=30):
+    """
+    Closed loop: `concurrency` virtual user, mỗi user gửi request tiếp theo ngay khi có response.
+    Trả về ([(kịch bản, status, latency)], thời gian đo); request bắt đầu trong warmup không được tính,
+    status 0 là lỗi kết nối/timeout.
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = []
+    loop_start = time.perf_counter()
+    measure_from = loop_start + warmup
+    stop_at = measure_from + duration
+    last_finish = measure_from
+
+    async def user(index, session):
+        nonlocal last_finish
+        rng = random.Random(seed * 100003 + index)
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, weights)[0]
+            method, path, kwargs = SCENARIOS[name](fixture, rng)
+            start = time.perf_counter()
+            try:
+                async with session.request(method, base_url + path, **kwargs) as response:
+                    await response.read()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status = 0
+            finished = time.perf_counter()
+            if start >= measure_from:
+                samples.append((name, status, finished - start))
+                last_finish = max(last_finish, finished)
+
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=timeout), cookie_jar=aiohttp.DummyCookieJar(),
+    ) as session:
+        await asyncio.gather(*(user(index, session) for index in range(concurrency)))
+    return samples, max(last_finish - measure_from, 1e-9)
+
+
+def percentile(values, pct):
+    """Nearest-rank trên danh sách đã sắp xếp"""
+    if not values:
+        return None
+    return values[max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))]
+
+
+def summarize_samples(samples, elapsed):
+    latencies = sorted(latency * 1000 for _, _, latency in samples)
+    statuses = Counter(status for _, status, _ in samples)
+    errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+
+    def ms(value):
+        return round(value, 2) if value is not None else None
+
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / elapsed, 1),
+        'errors': errors,
+        'client_errors': sum(count for status, count in statuses.items() if 400 <= status < 500),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+    }
+
+
+def summarize(samples, elapsed):
+    by_scenario = {}
+    for sample in samples:
+        by_scenario.setdefault(sample[0], []).append(sample)
+    return {
+        'total': summarize_samples(samples, elapsed),
+        'scenarios': {name: summarize_samples(items, elapsed) for name, items in sorted(by_scenario.items())},
+    }
+
+
+def git_revision(directory):
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=directory, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(baseline, current):
+    """
+    [(tên, metric, baseline, hiện tại, % thay đổi theo hướng xấu đi)] cho RPS, p95 và p99
+    của tổng và từng kịch bản có trong cả hai kết quả.
+    """
+    rows = []
+    sections = [('total', baseline.get('total'), current.get('total'))]
+    sections += [
+        (name, baseline.get('scenarios', {}).get(name), stats)
+        for name, stats in current.get('scenarios', {}).items()
+    ]
+    for name, before, after in sections:
+        if not before or not after:
+            continue
+        for metric, higher_is_better in (('rps', True), ('p95_ms', False), ('p99_ms', False)):
+            old, new = before.get(metric), after.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            rows.append((name, metric, old, new, -change if higher_is_better else change))
+    return rows
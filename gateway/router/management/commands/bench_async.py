@@ -0,0 +1,76 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory, RequestFactory
+
+from router import aio
+from router.dispatch import async_proxy, proxy
+from router.stub_upstream import StubUpstream
+
+
+class Command(BaseCommand):
+    help = 'Load test proxy sync (giới hạn bởi số worker) và proxy async với một upstream chậm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Số request cho mỗi chế độ')
+        parser.add_argument('--workers', type=int, default=16, help='Số worker thread của chế độ sync')
+        parser.add_argument('--concurrency', type=int, default=1000, help='Số request đồng thời của chế độ async')
+        parser.add_argument('--latency', type=float, default=0.2, help='Độ trễ của stub upstream (giây)')
+        parser.add_argument('--payload-size', type=int, default=1024, help='Kích thước body trả về (bytes)')
+
+    def handle(self, *args, **options):
+        total = options['requests']
+
+        with StubUpstream(latency=options['latency'], payload_size=options['payload_size']) as stub:
+            settings.LAB_SERVICE = stub.url
+            # Đo throughput của proxy, không gộp các request giống nhau và không giới hạn request
+            settings.GATEWAY_COALESCE = False
+            settings.GATEWAY_RATE_LIMIT = False
+
+            elapsed, errors = self.run_sync(total, options['workers'])
+            self.report(f"sync ({options['workers']} workers)", total, elapsed, errors)
+
+            elapsed, errors = asyncio.run(self.run_async(total, options['concurrency']))
+            self.report(f"async ({options['concurrency']} in-flight)", total, elapsed, errors)
+
+    def report(self, name, total, elapsed, errors):
+        self.stdout.write(
+            f"{name:<28} {total / elapsed:10.1f} req/s  ({total} requests, {errors} errors, {elapsed:.2f}s)"
+        )
+
+    def run_sync(self, total, workers):
+        factory = RequestFactory()
+
+        def call(_):
+            response = proxy(factory.get('/api/lab/orders/'), 'lab/orders/')
+            b''.join(response)
+            response.close()
+            return response.status_code
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            statuses = list(executor.map(call, range(total)))
+            elapsed = time.perf_counter() - start
+        return elapsed, sum(1 for code in statuses if code != 200)
+
+    async def run_async(self, total, concurrency):
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call():
+            async with semaphore:
+                response = await async_proxy(factory.get('/api/lab/orders/'), 'lab/orders/')
+                async for _ in response:
+                    pass
+                return response.status_code
+
+        try:
+            start = time.perf_counter()
+            statuses = await asyncio.gather(*(call() for _ in range(total)))
+            elapsed = time.perf_counter() - start
+        finally:
+            await aio.close_pools()
+        return elapsed, sum(1 for code in statuses if code != 200)
@@ -0,0 +1,93 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from router.compression import ENCODERS, BrotliEncoder, GzipEncoder
+
+
+def user_item(pk):
+    """Một phần tử giống UserSerializer của /api/users/all/ (có profile_data lồng bên trong)"""
+    return {
+        'id': pk, 'username': f'patient{pk}', 'first_name': 'Nguyễn', 'last_name': f'Văn {pk}',
+        'email': f'patient{pk}@example.com', 'phone_number': f'09{pk:08d}', 'gender': 'MALE', 'role': 'PATIENT',
+        'avatar_url': f'/media/avatars/patient{pk}.png',
+        'profile_data': {
+            'date_of_birth': '1990-01-01', 'address': f'{pk} Lê Lợi, Quận 1, TP.HCM',
+            'emergency_contact': f'09{pk + 1:08d}', 'blood_type': 'O+', 'allergies': 'Không',
+            'medical_conditions': 'Không', 'insurance_number': f'BH{pk:010d}',
+        },
+        'date_joined': '2025-01-01T08:00:00Z', 'last_updated': '2025-06-01T08:00:00Z',
+        'phone': f'09{pk:08d}', 'date_of_birth': '1990-01-01', 'address': f'{pk} Lê Lợi, Quận 1, TP.HCM',
+        'emergency_contact': f'09{pk + 1:08d}', 'blood_type': 'O+', 'allergies': 'Không',
+        'medical_conditions': 'Không', 'insurance_number': f'BH{pk:010d}',
+    }
+
+
+def make_payload(size):
+    items = []
+    body = b'[]'
+    while len(body) < size:
+        items.append(user_item(len(items) + 1))
+        body = json.dumps(items, ensure_ascii=False).encode()
+    return body
+
+
+def chunks(body, chunk_size):
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+def encode(factory, parts):
+    encoder = factory()
+    out = 0
+    for part in parts:
+        out += len(encoder.compress(part))
+    return out + len(encoder.finish())
+
+
+class Command(BaseCommand):
+    help = 'Đo số byte gửi cho client và CPU cho mỗi response khi nén gzip/brotli theo kích thước payload'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='512,2048,16384,131072,1048576', help='Kích thước payload JSON (byte), cách nhau bởi dấu phẩy',
+        )
+        parser.add_argument('--min-time', type=float, default=0.2, help='Thời gian đo tối thiểu cho mỗi ô (giây)')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        encoders = [
+            (f'gzip-{level}', lambda level=level: GzipEncoder(level)) for level in (1, settings.GATEWAY_GZIP_LEVEL, 9)
+        ]
+        if 'br' in ENCODERS:
+            encoders += [
+                (f'br-{quality}', lambda quality=quality: BrotliEncoder(quality))
+                for quality in (settings.GATEWAY_BROTLI_QUALITY, 11)
+            ]
+        else:
+            self.stdout.write('brotli chưa được cài, chỉ đo gzip')
+
+        self.stdout.write(
+            f"{'payload':>10} {'encoding':<9} {'bytes':>10} {'ratio':>7} {'cpu µs/resp':>12} {'MB/s':>8}"
+        )
+        for size in sizes:
+            body = make_payload(size)
+            # Nén theo từng chunk như khi stream response của upstream qua CompressionMiddleware
+            parts = chunks(body, settings.GATEWAY_STREAM_CHUNK_SIZE)
+            self.stdout.write(f"{len(body):>10} {'identity':<9} {len(body):>10} {1:>7.2f} {0:>12.1f} {'-':>8}")
+            for name, factory in encoders:
+                out = encode(factory, parts)
+                rounds = 0
+                start = time.process_time()
+                while True:
+                    encode(factory, parts)
+                    rounds += 1
+                    elapsed = time.process_time() - start
+                    if elapsed >= options['min_time']:
+                        break
+                per_response = elapsed / rounds
+                self.stdout.write(
+                    f"{len(body):>10} {name:<9} {out:>10} {out / len(body):>7.2f} "
+                    f"{per_response * 1e6:>12.1f} {len(body) / per_response / 1e6:>8.1f}"
+                )
@@ -0,0 +1,96 @@
+import time
+
+import jwt
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import path
+from django.urls.resolvers import RegexPattern, URLResolver
+from rest_framework.views import APIView
+from token_cache import decode_token
+
+from router import dispatch
+from router.routes import ROUTES
+
+
+def fake_forward(method, url, data=None, headers=None, params=None, timeout=None, retries=0, hedge=None):
+    return HttpResponse(b'{}', content_type='application/json')
+
+
+def legacy_view(route):
+    """APIView tương đương một class Proxy* cũ: mỗi request tự dựng URL và header"""
+    def handler(self, request, **kwargs):
+        if route.needs_token(request.method):
+            decode_token(request.headers['Authorization'].split(' ', 1)[1])
+        return fake_forward(
+            request.method,
+            f"{getattr(settings, route.service)}{route.path_for(request.method, **kwargs)}",
+            data=request.data if request.method in ('POST', 'PUT') else None,
+            headers={'Authorization': request.headers.get('Authorization')},
+            params=request.query_params if route.forward_query else None,
+        )
+    handlers = {method.lower(): handler for method in route.methods}
+    return type('LegacyProxy', (APIView,), handlers).as_view()
+
+
+class Command(BaseCommand):
+    help = 'So sánh chi phí dispatch mỗi request: URLconf + APIView (cũ) và prefix-trie trong router/dispatch.py'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=2000, help='Số lần lặp qua toàn bộ các route GET')
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        # Tắt response cache, admission control và upstream thật, chỉ đo phần dispatch của gateway
+        settings.GATEWAY_CACHE_TTLS = {}
+        settings.GATEWAY_RATE_LIMIT = False
+        original_forward = dispatch.forward_request
+        dispatch.forward_request = fake_forward
+
+        resolver = URLResolver(RegexPattern(r'^/api/'), [path(route.pattern, legacy_view(route)) for route in ROUTES])
+        token = jwt.encode(
+            {'user_id': 1, 'role': 'PATIENT', 'exp': int(time.time()) + 3600}, settings.SECRET_KEY, algorithm='HS256'
+        )
+        factory = RequestFactory(headers={'Authorization': f'Bearer {token}'})
+        cases = []
+        for route in ROUTES:
+            if 'GET' not in route.methods:
+                continue
+            route_path = route.pattern.replace('<int:pk>', '42')
+            request = factory.get(f'/api/{route_path}', {'doctor_id': 1, 'user_id': 1, 'role': 'PATIENT'})
+            cases.append((request, route_path))
+        total = rounds * len(cases)
+
+        def legacy_resolve():
+            for request, _ in cases:
+                resolver.resolve(request.path)
+
+        def trie_match():
+            for _, route_path in cases:
+                dispatch.router.match(route_path)
+
+        def legacy_full():
+            for request, _ in cases:
+                match = resolver.resolve(request.path)
+                match.func(request, *match.args, **match.kwargs)
+
+        def trie_full():
+            for request, route_path in cases:
+                dispatch.proxy(request, route_path)
+
+        try:
+            for name, func in (
+                ('URLconf resolve', legacy_resolve),
+                ('trie match', trie_match),
+                ('URLconf + APIView', legacy_full),
+                ('trie + dispatch.proxy', trie_full),
+            ):
+                func()
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    func()
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"{name:<24} {elapsed / total * 1e6:8.2f} µs/request  ({total} requests)")
+        finally:
+            dispatch.forward_request = original_forward
@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from router.stub_upstream import StubUpstream
+from router.upstream import UpstreamPool
+
+
+class Command(BaseCommand):
+    help = 'So sánh requests/sec giữa requests.request (kết nối mới mỗi lần) và connection pool của gateway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Số request cho mỗi chế độ')
+        parser.add_argument('--threads', type=int, default=16, help='Số thread gửi request song song')
+        parser.add_argument('--latency', type=float, default=0.0, help='Độ trễ của stub upstream (giây)')
+        parser.add_argument('--payload-size', type=int, default=1024, help='Kích thước body trả về (bytes)')
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        threads = options['threads']
+
+        with StubUpstream(latency=options['latency'], payload_size=options['payload_size']) as stub:
+            url = f"{stub.url}/api/appointments/"
+            timeout = (settings.UPSTREAM_CONNECT_TIMEOUT, settings.UPSTREAM_READ_TIMEOUT)
+            pool = UpstreamPool('STUB', stub.url, maxsize=threads, block=False, timeout=timeout)
+
+            def fresh(_):
+                return requests.request('GET', url, timeout=10).status_code
+
+            def pooled(_):
+                return pool.request('GET', url).status_code
+
+            try:
+                for name, func in (('fresh connection', fresh), ('pooled keep-alive', pooled)):
+                    elapsed, errors = self.run(func, total, threads)
+                    self.stdout.write(
+                        f"{name:<20} {total / elapsed:10.1f} req/s  "
+                        f"({total} requests, {threads} threads, {errors} errors, {elapsed:.2f}s)"
+                    )
+            finally:
+                pool.close()
+
+    def run(self, func, total, threads):
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            start = time.perf_counter()
+            statuses = list(executor.map(func, range(total)))
+            elapsed = time.perf_counter() - start
+        return elapsed, sum(1 for code in statuses if code != 200)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from router import loadtest
+from router.stub_upstream import StubUpstream
+
+
+# Service thật có thể chạy thay stub với --real-services: tên trong settings -> thư mục trong repo
+REAL_SERVICES = {'USER_SERVICE': 'user_service', 'APPOINTMENT_SERVICE': 'appointment_service'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test gateway (process riêng) với stub upstream hoặc appointment_service/user_service thật, '
+        'báo cáo RPS và p50/p95/p99 theo từng kịch bản, ghi kết quả ra JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', default=loadtest.DEFAULT_MIX,
+                            help=f"Tỉ lệ các kịch bản, vd {loadtest.DEFAULT_MIX}")
+        parser.add_argument('--concurrency', type=int, default=16, help='Số virtual user chạy đồng thời')
+        parser.add_argument('--duration', type=float, default=20, help='Thời gian đo (giây)')
+        parser.add_argument('--warmup', type=float, default=3, help='Thời gian chạy trước khi bắt đầu đo (giây)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed của bộ chọn kịch bản')
+        parser.add_argument('--asgi', action='store_true', help='Chạy gateway bằng uvicorn với GATEWAY_ASYNC')
+        parser.add_argument('--rate-limit', action='store_true',
+                            help='Bật admission control của gateway (mặc định tắt để đo throughput)')
+        parser.add_argument('--latency', type=float, default=0.01, help='Độ trễ của stub upstream (giây)')
+        parser.add_argument('--payload-size', type=int, default=2048, help='Kích thước body của stub upstream (bytes)')
+        parser.add_argument('--real-services', action='store_true',
+                            help='Chạy user_service và appointment_service thật trên DB SQLite tạm thay cho stub')
+        parser.add_argument('--patients', type=int, default=20, help='Số tài khoản bệnh nhân')
+        parser.add_argument('--doctors', type=int, default=3, help='Số bác sĩ')
+        parser.add_argument('--output', help='Ghi kết quả JSON ra file ("-" để in JSON thay cho bảng)')
+        parser.add_argument('--compare', help='File JSON của lần chạy trước để so sánh')
+        parser.add_argument('--max-regression', type=float,
+                            help='Lỗi (exit 1) nếu RPS/p95/p99 của --compare xấu đi quá số phần trăm này')
+        parser.add_argument('--keep-logs', action='store_true', help='Giữ thư mục log và DB tạm sau khi chạy')
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+        except loadtest.LoadTestError as e:
+            raise CommandError(e)
+
+        workdir = Path(tempfile.mkdtemp(prefix='gateway-loadtest-'))
+        stubs = []
+        processes = []
+        try:
+            upstreams = {}
+            for name in settings.UPSTREAM_TIMEOUTS:
+                if options['real_services'] and name in REAL_SERVICES:
+                    service = loadtest.django_service(
+                        REAL_SERVICES[name], settings.BASE_DIR.parent / REAL_SERVICES[name], workdir, workdir,
+                    )
+                    processes.append(service.start())
+                    upstreams[name] = service.url
+                else:
+                    stub = StubUpstream(latency=options['latency'], payload_size=options['payload_size']).start()
+                    stubs.append(stub)
+                    upstreams[name] = stub.url
+
+            gateway = loadtest.gateway_process(
+                settings.BASE_DIR, upstreams, workdir, asgi=options['asgi'], rate_limit=options['rate_limit'],
+            )
+            processes.append(gateway.start())
+
+            if options['real_services']:
+                fixture = loadtest.seed_fixture(gateway.url, options['patients'], options['doctors'])
+            else:
+                fixture = loadtest.stub_fixture(settings.SECRET_KEY, options['patients'], options['doctors'])
+
+            samples, elapsed = asyncio.run(loadtest.run_load(
+                gateway.url, fixture, mix, options['concurrency'], options['duration'],
+                warmup=options['warmup'], seed=options['seed'],
+            ))
+        except loadtest.LoadTestError as e:
+            options['keep_logs'] = True
+            raise CommandError(f'{e} (log: {workdir})')
+        finally:
+            for process in reversed(processes):
+                process.stop()
+            for stub in stubs:
+                stub.stop()
+            if not options['keep_logs']:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        result = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'revision': loadtest.git_revision(settings.BASE_DIR),
+                'python': platform.python_version(),
+                'cpu_count': os.cpu_count(),
+                'gateway': 'uvicorn (GATEWAY_ASYNC)' if options['asgi'] else 'runserver',
+                'upstreams': 'real' if options['real_services'] else 'stub',
+                'rate_limit': options['rate_limit'],
+                'mix': mix,
+                'concurrency': options['concurrency'],
+                'duration': options['duration'],
+                'warmup': options['warmup'],
+                'stub_latency': options['latency'],
+                'stub_payload_size': options['payload_size'],
+            },
+            **loadtest.summarize(samples, elapsed),
+        }
+        if options['keep_logs']:
+            result['meta']['logs'] = str(workdir)
+
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(result, indent=2, ensure_ascii=False))
+        else:
+            self.print_table(result)
+            if options['output']:
+                with open(options['output'], 'w') as f:
+                    json.dump(result, f, indent=2, ensure_ascii=False)
+
+        if options['compare']:
+            self.compare(options['compare'], result, options['max_regression'])
+
+    def print_table(self, result):
+        meta = result['meta']
+        self.stdout.write(
+            f"gateway={meta['gateway']} upstreams={meta['upstreams']} concurrency={meta['concurrency']} "
+            f"duration={meta['duration']}s revision={meta['revision']}"
+        )
+        self.stdout.write(
+            f"{'scenario':<20} {'requests':>9} {'rps':>8} {'errors':>7} {'4xx':>6} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+        )
+        rows = list(result['scenarios'].items()) + [('total', result['total'])]
+        for name, stats in rows:
+            self.stdout.write(
+                f"{name:<20} {stats['requests']:>9} {stats['rps']:>8} {stats['errors']:>7} "
+                f"{stats['client_errors']:>6} {stats['p50_ms']!s:>8} {stats['p95_ms']!s:>8} "
+                f"{stats['p99_ms']!s:>8} {stats['max_ms']!s:>8}"
+            )
+
+    def compare(self, path, result, max_regression):
+        with open(path) as f:
+            baseline = json.load(f)
+        self.stderr.write(
+            f"So với {path} (revision {baseline.get('meta', {}).get('revision')}), số dương = xấu đi:"
+        )
+        regressions = []
+        for name, metric, old, new, worse in loadtest.compare(baseline, result):
+            self.stderr.write(f"  {name:<20} {metric:<7} {old:>10} -> {new:<10} {worse:+.1f}%")
+            if max_regression is not None and worse > max_regression:
+                regressions.append(f'{name} {metric} xấu đi {worse:.1f}%')
+        if regressions:
+            raise CommandError('; '.join(regressions))
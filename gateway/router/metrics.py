@@ -0,0 +1,196 @@
+"""
+Metrics của gateway ở định dạng text của Prometheus, xem GET /metrics.
+Mỗi metric giữ số liệu theo bộ label trong dict, cập nhật dưới một lock nên chi phí mỗi request rất nhỏ.
+"""
+import contextvars
+import threading
+from bisect import bisect_left
+
+from .breaker import CLOSED, HALF_OPEN, OPEN, breaker_stats
+from .cache import response_cache
+from .coalesce import single_flight
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = list(self._values.items())
+        lines = self.header()
+        lines.extend(f'{self.name}{format_labels(self.labels, key)} {format_number(value)}' for key, value in values)
+        return lines
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [số lần rơi vào từng bucket (không cộng dồn) + bucket +Inf, tổng, số lần]
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def collect(self):
+        with self._lock:
+            values = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        lines = self.header()
+        bucket_labels = self.labels + ('le',)
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(
+                    f'{self.name}_bucket{format_labels(bucket_labels, key + (format_number(bound),))} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{format_labels(self.labels, key)} {format_number(total)}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, key)} {count}')
+        return lines
+
+
+request_duration = Histogram(
+    'gateway_request_duration_seconds',
+    'Thời gian gateway xử lý request tới khi có header của response',
+    ('route', 'method'),
+)
+requests_total = Counter('gateway_requests_total', 'Số response theo route và status code', ('route', 'method', 'status'))
+requests_in_flight = Gauge('gateway_requests_in_flight', 'Số request đang được gateway xử lý')
+request_bytes = Histogram('gateway_request_bytes', 'Kích thước body của request', ('route',), SIZE_BUCKETS)
+response_bytes = Histogram('gateway_response_bytes', 'Kích thước body của response', ('route',), SIZE_BUCKETS)
+
+upstream_duration = Histogram(
+    'gateway_upstream_duration_seconds',
+    'Thời gian từ lúc gửi request tới upstream tới khi nhận header của response',
+    ('upstream',),
+)
+upstream_requests_total = Counter(
+    'gateway_upstream_requests_total', 'Số request tới upstream theo status code (error = lỗi kết nối/timeout)',
+    ('upstream', 'status'),
+)
+upstream_in_flight = Gauge('gateway_upstream_in_flight', 'Số request đang chờ upstream', ('upstream',))
+upstream_retries_total = Counter(
+    'gateway_upstream_retries_total', 'Số lần gọi thêm tới upstream: retry khi lỗi kết nối hoặc hedge',
+    ('upstream', 'kind'),
+)
+retry_budget_exhausted_total = Counter(
+    'gateway_retry_budget_exhausted_total', 'Số lần retry/hedge bị bỏ vì hết retry budget', ('upstream', 'kind'),
+)
+hedge_wins_total = Counter('gateway_hedge_wins_total', 'Số GET mà lần gọi hedge về trước lần gọi đầu', ('route',))
+
+rate_limited_total = Counter(
+    'gateway_rate_limited_total', 'Số request bị trả 429 theo route và loại ngân sách (client/route)',
+    ('route', 'scope'),
+)
+
+# Các lần gọi upstream của request hiện tại [(upstream, thời gian)], dùng cho header Server-Timing
+upstream_timings = contextvars.ContextVar('upstream_timings', default=None)
+
+REGISTRY = [
+    request_duration, requests_total, requests_in_flight, request_bytes, response_bytes,
+    upstream_duration, upstream_requests_total, upstream_in_flight, upstream_retries_total,
+    retry_budget_exhausted_total, hedge_wins_total, rate_limited_total,
+]
+
+
+def observe_upstream(name, status, duration):
+    upstream_duration.observe(name, value=duration)
+    upstream_requests_total.inc(name, str(status))
+    timings = upstream_timings.get()
+    if timings is not None:
+        timings.append((name, duration))
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    lines.extend(collect_components())
+    return '\n'.join(lines) + '\n'
+
+
+def collect_components():
+    """Số liệu của circuit breaker, response cache và single-flight, đọc lúc scrape"""
+    states = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    breaker_state = Gauge('gateway_circuit_state', 'Trạng thái circuit breaker: 0 closed, 1 half_open, 2 open', ('upstream',))
+    breaker_rejected = Counter('gateway_circuit_rejected_total', 'Số request bị breaker trả 503 ngay', ('upstream',))
+    for name, snapshot in breaker_stats().items():
+        breaker_state.set(name, value=states[snapshot['state']])
+        breaker_rejected.inc(name, amount=snapshot['rejected'])
+
+    cache_lookups = Counter('gateway_cache_lookups_total', 'Số lần tra response cache', ('route', 'result'))
+    for route, counters in response_cache.stats()['routes'].items():
+        cache_lookups.inc(route, 'hit', amount=counters['hits'])
+        cache_lookups.inc(route, 'miss', amount=counters['misses'])
+
+    coalesced = Counter('gateway_coalesced_requests_total', 'Số GET dùng chung kết quả của request khác', ('route',))
+    for route, counters in single_flight.stats()['routes'].items():
+        coalesced.inc(route, amount=counters['coalesced'])
+
+    lines = []
+    for metric in (breaker_state, breaker_rejected, cache_lookups, coalesced):
+        lines.extend(metric.collect())
+    return lines
@@ -0,0 +1,127 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+from .compression import compress_response
+
+
+class MetricsMiddleware:
+    """
+    Đo thời gian xử lý, status code và kích thước payload của mỗi request (router/metrics.py)
+    và thêm header Server-Timing tách thời gian của gateway với thời gian chờ upstream.
+    Nên đặt đầu tiên trong MIDDLEWARE để tính cả chi phí của các middleware khác.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start, timings = self.before(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.requests_in_flight.dec()
+        return self.after(request, response, start, timings)
+
+    async def __acall__(self, request):
+        start, timings = self.before(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.requests_in_flight.dec()
+        return self.after(request, response, start, timings)
+
+    def before(self, request):
+        metrics.requests_in_flight.inc()
+        timings = []
+        metrics.upstream_timings.set(timings)
+        return time.perf_counter(), timings
+
+    def after(self, request, response, start, timings):
+        elapsed = time.perf_counter() - start
+        route = route_label(request)
+
+        metrics.request_duration.observe(route, request.method, value=elapsed)
+        metrics.requests_total.inc(route, request.method, str(response.status_code))
+        length = request.META.get('CONTENT_LENGTH')
+        if length:
+            metrics.request_bytes.observe(route, value=int(length))
+        observe_response_size(route, response)
+
+        upstream = sum(duration for _, duration in timings)
+        parts = [f'gateway;dur={max(elapsed - upstream, 0) * 1000:.1f}']
+        parts.extend(f'upstream;dur={duration * 1000:.1f};desc="{name}"' for name, duration in timings)
+        response['Server-Timing'] = ', '.join(parts)
+        return response
+
+
+def route_label(request):
+    """Tên route trong router/routes.py, hoặc pattern của URLconf với các view viết tay"""
+    route = getattr(request, 'route_name', None)
+    if route:
+        return route
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def observe_response_size(route, response):
+    length = response.get('Content-Length')
+    if length is not None:
+        metrics.response_bytes.observe(route, value=int(length))
+    elif not response.streaming:
+        metrics.response_bytes.observe(route, value=len(response.content))
+    elif response.is_async:
+        response.streaming_content = acount_bytes(route, response.streaming_content)
+    else:
+        response.streaming_content = count_bytes(route, response.streaming_content)
+
+
+def count_bytes(route, iterator):
+    size = 0
+    try:
+        for chunk in iterator:
+            size += len(chunk)
+            yield chunk
+    finally:
+        metrics.response_bytes.observe(route, value=size)
+
+
+async def acount_bytes(route, iterator):
+    size = 0
+    try:
+        async for chunk in iterator:
+            size += len(chunk)
+            yield chunk
+    finally:
+        metrics.response_bytes.observe(route, value=size)
+
+
+class CompressionMiddleware:
+    """
+    Nén response theo Accept-Encoding (router/compression.py). Đặt ngay sau MetricsMiddleware
+    để gateway_response_bytes đo số byte thực sự gửi cho client.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compress_response(request, await self.get_response(request))
@@ -0,0 +1,113 @@
+"""
+Admission control bằng token bucket: khi quá tải, request vượt ngân sách bị trả 429 + Retry-After ngay tại gateway
+thay vì dồn lên upstream, nên các request được nhận vẫn giữ được latency.
+
+Mỗi route thuộc một nhóm trong settings.GATEWAY_RATE_LIMITS (Route.rate_limit, mặc định 'default'):
+    client  (request/giây, burst) cho mỗi client (user_id trong token, hoặc IP) trong nhóm
+    route   (request/giây, burst) cho tất cả client cộng lại, dành cho các route tốn tài nguyên của upstream
+
+State của bucket nằm trong backend (GATEWAY_RATE_LIMIT_BACKEND). LocalRateLimitBackend giữ trong bộ nhớ
+của process; backend dùng chung giữa nhiều process (vd Redis) chỉ cần cài đặt consume() tương tự.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+from token_cache import decode_token
+
+from . import metrics
+
+
+class LocalRateLimitBackend:
+    """
+    Token bucket trong bộ nhớ, LRU giới hạn số key: key -> [số token, thời điểm cập nhật].
+    Bucket bị đẩy ra khỏi LRU được coi như đầy lại lần sau.
+    """
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst, cost=1):
+        """Lấy `cost` token; trả 0 nếu được nhận, ngược lại số giây cần chờ tới khi đủ token"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(burst), now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.GATEWAY_RATE_LIMIT_BACKEND)(
+                    max_keys=settings.GATEWAY_RATE_LIMIT_MAX_KEYS,
+                )
+    return _backend
+
+
+def client_id(request):
+    """user_id trong Bearer token hợp lệ, nếu không có thì IP của client"""
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        try:
+            user_id = decode_token(auth.split(' ', 1)[1]).get('user_id')
+        except jwt.PyJWTError:
+            user_id = None
+        if user_id is not None:
+            return f'user:{user_id}'
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def too_many_requests(scope, wait):
+    response = JsonResponse({'error': 'Quá nhiều request, vui lòng thử lại sau', 'scope': scope}, status=429)
+    response['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+
+def admit(route, request):
+    """None nếu request được nhận, ngược lại response 429"""
+    if not settings.GATEWAY_RATE_LIMIT:
+        return None
+    limits = settings.GATEWAY_RATE_LIMITS.get(route.rate_limit) or {}
+    backend = get_backend()
+
+    client = limits.get('client')
+    if client:
+        wait = backend.consume(f'client:{route.rate_limit}:{client_id(request)}', *client)
+        if wait:
+            metrics.rate_limited_total.inc(route.name, 'client')
+            return too_many_requests('client', wait)
+
+    shared = limits.get('route')
+    if shared:
+        wait = backend.consume(f'route:{route.rate_limit}', *shared)
+        if wait:
+            metrics.rate_limited_total.inc(route.name, 'route')
+            return too_many_requests('route', wait)
+    return None
@@ -0,0 +1,235 @@
+"""
+Retry và hedge cho GET tới upstream, dùng trong forward_request / forward_request_async.
+
+retry   GET lỗi kết nối được gửi lại tối đa GATEWAY_RETRY_ATTEMPTS lần, chờ theo exponential backoff
+        có jitter (full jitter) để các gateway worker không cùng retry một lúc
+hedge   route có Route(hedge=True): nếu lần gọi đầu chậm hơn percentile latency gần đây của route
+        thì gửi thêm một lần gọi, dùng response nào về trước. Chế độ sync: lần gọi đầu chạy trên thread của
+        request, chỉ lần hedge chạy trên pool GATEWAY_HEDGE_MAX_WORKERS thread, pool đầy thì không hedge
+
+Mọi lần gọi thêm (retry hoặc hedge) đều phải lấy token từ retry budget chung của gateway (get_budget()), nên khi
+upstream sập số request gọi thêm bị giới hạn ở một tỉ lệ nhỏ của traffic thay vì nhân lên theo số lần retry.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import requests
+from django.conf import settings
+
+from . import metrics
+
+
+class LatencyTracker:
+    """Latency của các response thành công gần đây của một route, để tính ngưỡng hedge"""
+    def __init__(self, size, percentile, min_samples):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._threshold = None
+        self._stale = 0
+        self._refresh_every = max(1, size // 16)
+        self._lock = threading.Lock()
+
+    def observe(self, duration):
+        with self._lock:
+            self._samples.append(duration)
+            self._stale += 1
+
+    def threshold(self):
+        """Percentile latency hiện tại, None nếu chưa đủ mẫu; chỉ sắp xếp lại sau mỗi _refresh_every mẫu mới"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            if self._threshold is None or self._stale >= self._refresh_every:
+                ordered = sorted(self._samples)
+                self._threshold = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+                self._stale = 0
+            return self._threshold
+
+
+class RetryBudget:
+    """
+    Token bucket cho các lần gọi thêm: mỗi request gốc nạp `ratio` token, mỗi retry/hedge tiêu 1 token,
+    thêm `min_per_second` token mỗi giây để lúc ít traffic vẫn retry được.
+    """
+    def __init__(self, ratio, min_per_second, max_tokens):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = float(max_tokens)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, amount):
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + amount + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill(self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            self._refill(0)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def tokens(self):
+        with self._lock:
+            self._refill(0)
+            return self._tokens
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+_budget = None
+_executor = None
+_executor_slots = None
+_scheduler = None
+
+
+def get_budget():
+    global _budget
+    if _budget is None:
+        with _trackers_lock:
+            if _budget is None:
+                _budget = RetryBudget(
+                    settings.GATEWAY_RETRY_BUDGET_RATIO,
+                    settings.GATEWAY_RETRY_BUDGET_MIN_PER_SECOND,
+                    settings.GATEWAY_RETRY_BUDGET_MAX,
+                )
+    return _budget
+
+
+def get_executor():
+    """Thread chạy các lần hedge (chế độ sync)"""
+    global _executor, _executor_slots
+    if _executor is None:
+        with _trackers_lock:
+            if _executor is None:
+                _executor_slots = threading.BoundedSemaphore(settings.GATEWAY_HEDGE_MAX_WORKERS)
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.GATEWAY_HEDGE_MAX_WORKERS, thread_name_prefix='hedge',
+                )
+    return _executor
+
+
+def acquire_hedge_slot():
+    """Giữ một thread của pool hedge; False nếu pool đã đầy (khi đó không hedge, không xếp hàng chờ)"""
+    get_executor()
+    return _executor_slots.acquire(blocking=False)
+
+
+def release_hedge_slot(*_):
+    _executor_slots.release()
+
+
+def submit_hedge(fn, *args, **kwargs):
+    """Chạy fn trên pool hedge bằng slot đã giữ bởi acquire_hedge_slot(); slot được trả khi fn xong"""
+    try:
+        future = get_executor().submit(fn, *args, **kwargs)
+    except BaseException:
+        release_hedge_slot()
+        raise
+    future.add_done_callback(release_hedge_slot)
+    return future
+
+
+class HedgeScheduler:
+    """Một thread gọi các callback sau delay giây, thay cho một threading.Timer (một thread) mỗi request"""
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, delay, callback):
+        entry = [time.monotonic() + delay, next(self._counter), callback]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='hedge-timer', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    @staticmethod
+    def cancel(entry):
+        # Entry vẫn nằm trong heap tới hạn nhưng không còn callback
+        entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                remaining = self._heap[0][0] - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                callback = heapq.heappop(self._heap)[2]
+            if callback is not None:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"❌ ERROR: hedge timer: {e}")
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _trackers_lock:
+            if _scheduler is None:
+                _scheduler = HedgeScheduler()
+    return _scheduler
+
+
+def get_tracker(route):
+    tracker = _trackers.get(route)
+    if tracker is None:
+        with _trackers_lock:
+            tracker = _trackers.get(route)
+            if tracker is None:
+                tracker = _trackers[route] = LatencyTracker(
+                    settings.GATEWAY_HEDGE_WINDOW, settings.GATEWAY_HEDGE_PERCENTILE, settings.GATEWAY_HEDGE_MIN_SAMPLES,
+                )
+    return tracker
+
+
+def hedge_delay(route):
+    """Thời gian chờ lần gọi đầu trước khi hedge, None nếu route chưa đủ mẫu latency"""
+    threshold = get_tracker(route).threshold()
+    if threshold is None:
+        return None
+    return max(threshold, settings.GATEWAY_HEDGE_MIN_DELAY)
+
+
+def backoff(attempt):
+    """Full jitter: ngẫu nhiên trong [0, min(max, base * 2^attempt)]"""
+    return random.uniform(0, min(settings.GATEWAY_RETRY_BACKOFF_MAX, settings.GATEWAY_RETRY_BACKOFF * 2 ** attempt))
+
+
+def is_connection_error(error):
+    """Lỗi kết nối (không gồm read timeout: upstream có thể vẫn đang xử lý request)"""
+    if isinstance(error, requests.ConnectionError):
+        return True
+    return isinstance(error, aiohttp.ClientConnectionError) and not isinstance(error, asyncio.TimeoutError)
+
+
+def allow_extra(breaker, kind):
+    """Lấy token của retry budget cho một lần gọi thêm (kind = 'retry' hoặc 'hedge')"""
+    if get_budget().withdraw():
+        metrics.upstream_retries_total.inc(breaker.name, kind)
+        return True
+    metrics.retry_budget_exhausted_total.inc(breaker.name, kind)
+    return False
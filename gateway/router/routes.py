@@ -0,0 +1,147 @@
+"""
+Bảng route của gateway. Mỗi dòng khai báo một endpoint /api/<pattern> được proxy tới upstream;
+router/dispatch.py biên dịch bảng này thành một prefix-trie khi khởi động.
+Thêm upstream/endpoint mới chỉ cần thêm dòng vào ROUTES, không cần viết view mới.
+"""
+
+
+class Route:
+    """
+    pattern          path phía gateway (sau /api/), hỗ trợ <int:pk>, <str:name>
+    service          tên setting của upstream, vd 'USER_SERVICE'
+    upstream_path    path phía upstream (format theo tham số của pattern) hoặc dict {method: path}
+    methods          các HTTP method được phép
+    auth             các method bắt buộc Bearer token hợp lệ (verify tại gateway)
+    forward_auth     chuyển tiếp Authorization header
+    forward_query    chuyển tiếp query string
+    forward_body     chuyển tiếp body của POST/PUT
+    required_params  query param bắt buộc
+    inject_patient_id  gán patient_id = user_id trong token vào body
+    default_role     thêm role từ token vào query nếu chưa có
+    cache            tên route trong settings.GATEWAY_CACHE_TTLS (chỉ áp dụng cho GET)
+    cache_tag        tag của entry, format theo query, vd 'doctor_schedule:{doctor_id}'
+    cache_public     response giống nhau với mọi user
+    invalidates      tag bị xóa khi request ghi thành công, format theo body
+    timeout          (connect, read) riêng cho route, mặc định theo upstream
+    coalesce         gộp các GET giống hệt nhau đang chạy đồng thời (router/coalesce.py)
+    etag             hỗ trợ ETag / If-None-Match cho GET, trả 304 khi dữ liệu không đổi (router/etag.py)
+    rate_limit       nhóm ngân sách request trong settings.GATEWAY_RATE_LIMITS (router/ratelimit.py)
+    hedge            GET chậm hơn percentile latency của route được gửi thêm một lần (router/retry.py)
+    """
+    __slots__ = (
+        'pattern', 'service', 'upstream_path', 'methods', 'auth', 'forward_auth', 'forward_query',
+        'forward_body', 'required_params', 'inject_patient_id', 'default_role', 'cache', 'cache_tag',
+        'cache_public', 'invalidates', 'timeout', 'coalesce', 'etag', 'rate_limit', 'hedge', 'name',
+    )
+
+    def __init__(self, pattern, service, upstream_path, methods=('GET',), auth=(), forward_auth=True,
+                 forward_query=False, forward_body=True, required_params=(), inject_patient_id=False,
+                 default_role=False, cache=None, cache_tag=None, cache_public=False, invalidates=(),
+                 timeout=None, coalesce=True, etag=False, rate_limit='default', hedge=False, name=None):
+        self.pattern = pattern
+        self.service = service
+        self.upstream_path = upstream_path
+        self.methods = tuple(methods)
+        self.auth = tuple(auth)
+        self.forward_auth = forward_auth
+        self.forward_query = forward_query
+        self.forward_body = forward_body
+        self.required_params = tuple(required_params)
+        self.inject_patient_id = inject_patient_id
+        self.default_role = default_role
+        self.cache = cache
+        self.cache_tag = cache_tag
+        self.cache_public = cache_public
+        self.invalidates = tuple(invalidates)
+        self.timeout = timeout
+        self.coalesce = coalesce
+        self.etag = etag
+        self.rate_limit = rate_limit
+        self.hedge = hedge
+        self.name = name or pattern
+
+    def needs_token(self, method):
+        return method in self.auth or self.inject_patient_id or self.default_role
+
+    def path_for(self, method, **kwargs):
+        path = self.upstream_path[method] if isinstance(self.upstream_path, dict) else self.upstream_path
+        return path.format(**kwargs)
+
+    def __repr__(self):
+        return f"<Route {self.pattern} -> {self.service}>"
+
+
+ROUTES = [
+    # User
+    Route('users/register/', 'USER_SERVICE', '/api/users/register/', methods=('POST',), invalidates=('doctors',)),
+    Route('users/login/', 'USER_SERVICE', '/api/users/login/', methods=('POST',)),
+    Route('users/me/', 'USER_SERVICE', {
+        'GET': '/api/users/me/', 'PUT': '/api/users/me/', 'DELETE': '/api/users/delete/',
+    }, methods=('GET', 'PUT', 'DELETE'), invalidates=('doctors',)),
+    Route('users/all/', 'USER_SERVICE', '/api/users/all/'),
+    Route('doctors/', 'USER_SERVICE', '/api/users/doctors/', cache='doctors', hedge=True),
+
+    # Appointment
+    Route('appointments/create/', 'APPOINTMENT_SERVICE', '/api/appointments/create/', methods=('POST',),
+          inject_patient_id=True),
+    Route('appointments/', 'APPOINTMENT_SERVICE', '/api/appointments/', forward_query=True, default_role=True,
+          etag=True, hedge=True),
+    Route('appointments/<int:pk>/', 'APPOINTMENT_SERVICE', '/api/appointments/{pk}/',
+          methods=('GET', 'PUT', 'DELETE'), auth=('PUT', 'DELETE')),
+    Route('appointments/schedules/', 'APPOINTMENT_SERVICE', '/api/appointments/schedules/',
+          methods=('GET', 'POST'), auth=('POST',), forward_query=True,
+          cache='doctor_schedule', cache_tag='doctor_schedule:{doctor_id}',
+          invalidates=('doctor_schedule:{doctor_id}',)),
+    Route('appointments/available-slots/', 'APPOINTMENT_SERVICE', '/api/appointments/available-slots/',
+          forward_query=True, required_params=('doctor_id',)),
+    Route('appointments/daily-availability/', 'APPOINTMENT_SERVICE', '/api/appointments/daily-availability/',
+          forward_query=True, required_params=('doctor_id',), rate_limit='daily_availability'),
+    Route('appointments/earliest-slots/', 'APPOINTMENT_SERVICE', '/api/appointments/earliest-slots/',
+          forward_query=True),
+    Route('appointments/calendar-density/', 'APPOINTMENT_SERVICE', '/api/appointments/calendar-density/',
+          forward_query=True, required_params=('doctor_id',)),
+    Route('appointments/departments/', 'APPOINTMENT_SERVICE', '/api/appointments/departments/', cache='departments',
+          hedge=True),
+    Route('appointments/token-debug/', 'APPOINTMENT_SERVICE', '/api/appointments/token-debug/'),
+    Route('appointments/internal/', 'APPOINTMENT_SERVICE', '/api/appointments/internal/',
+          forward_auth=False, forward_query=True, required_params=('user_id', 'role')),
+    Route('appointments/patient-calendar/', 'APPOINTMENT_SERVICE', '/api/appointments/patient-calendar/',
+          auth=('GET',), forward_query=True),
+
+    # Clinical
+    Route('records/', 'CLINICAL_SERVICE', '/api/records/', etag=True, hedge=True),
+    Route('records/create/', 'CLINICAL_SERVICE', '/api/records/create/', methods=('POST',)),
+    Route('records/vitals/', 'CLINICAL_SERVICE', '/api/records/vitals/', methods=('POST',)),
+
+    # Pharmacy
+    Route('pharmacy/prescriptions/', 'PHARMACY_SERVICE', '/api/pharmacy/prescriptions/'),
+    Route('pharmacy/prescriptions/create/', 'PHARMACY_SERVICE', '/api/pharmacy/prescriptions/create/',
+          methods=('POST',)),
+    Route('pharmacy/prescriptions/<int:pk>/dispense/', 'PHARMACY_SERVICE',
+          '/api/pharmacy/prescriptions/{pk}/dispense/', methods=('POST',), forward_body=False),
+    Route('pharmacy/inventory/', 'PHARMACY_SERVICE', '/api/pharmacy/inventory/', hedge=True),
+
+    # Lab
+    Route('lab/tests/', 'LAB_SERVICE', '/api/lab/tests/', forward_auth=False, cache='lab_tests', cache_public=True,
+          hedge=True),
+    Route('lab/orders/', 'LAB_SERVICE', '/api/lab/orders/'),
+    Route('lab/orders/create/', 'LAB_SERVICE', '/api/lab/orders/create/', methods=('POST',)),
+    Route('lab/results/', 'LAB_SERVICE', '/api/lab/results/'),
+    Route('lab/results/create/', 'LAB_SERVICE', '/api/lab/results/create/', methods=('POST',)),
+
+    # Insurance
+    Route('insurance/claims/', 'INSURANCE_SERVICE', '/api/insurance/claims/'),
+    Route('insurance/claims/create/', 'INSURANCE_SERVICE', '/api/insurance/claims/create/', methods=('POST',)),
+    Route('insurance/claims/<int:pk>/update/', 'INSURANCE_SERVICE', '/api/insurance/claims/{pk}/update/',
+          methods=('PUT',)),
+
+    # Notification
+    Route('notify/send/', 'NOTIFICATION_SERVICE', '/api/notify/send/', methods=('POST',)),
+    Route('notify/', 'NOTIFICATION_SERVICE', '/api/notify/', etag=True, hedge=True),
+
+    # Virtual robot / Chatbot
+    Route('vr/diagnose/', 'VIRTUALROBOT_SERVICE', '/api/vr/diagnose/', methods=('POST',), forward_auth=False,
+          rate_limit='vr_diagnose'),
+    Route('chatbot/respond/', 'CHATBOT_SERVICE', '/api/chatbot/respond/', methods=('POST',), forward_auth=False,
+          rate_limit='chatbot'),
+]
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import multiprocessing
+import socket
+
+
+class StubUpstream:
+    """
+    Upstream giả lập (HTTP/1.1 keep-alive) chạy trên event loop ở process riêng,
+    giữ được hàng nghìn kết nối chậm cùng lúc mà không tranh GIL với gateway.
+    Dùng cho benchmark gateway.
+
+        with StubUpstream(latency=0.01, payload_size=2048) as stub:
+            requests.get(stub.url + '/api/users/all/')
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, payload_size=256):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.body = self.make_body(payload_size)
+        self.process = None
+
+    @staticmethod
+    def make_body(payload_size):
+        item = {'id': 1, 'name': 'stub', 'status': 'PENDING'}
+        item_size = len(json.dumps(item)) + 2
+        return json.dumps([item] * max(1, payload_size // item_size)).encode()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        parent, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=serve,
+            args=(self.host, self.port, self.latency, self.body, child),
+            daemon=True,
+        )
+        self.process.start()
+        self.port = parent.recv()
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(timeout=5)
+            self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def serve(host, port, latency, body, conn):
+    response = (
+        b'HTTP/1.1 200 OK\r\n'
+        b'Content-Type: application/json\r\n'
+        b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+        b'\r\n' + body
+    )
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n')[1:]:
+                    name, _, value = line.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value.strip() or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                if latency:
+                    await asyncio.sleep(latency)
+
+                writer.write(response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(4096)
+        server = await asyncio.start_server(handle, sock=sock)
+        conn.send(sock.getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
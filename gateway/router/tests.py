@@ -0,0 +1,892 @@
+import asyncio
+import gzip
+import io
+import json
+import socket
+import threading
+import time
+from unittest import mock
+
+import jwt
+import requests
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, override_settings
+from multidict import CIMultiDict
+from token_cache import VerifiedTokenCache
+from urllib3 import HTTPResponse
+
+from . import aio, batch, compression, etag, loadtest, metrics, ratelimit, retry, uploads, upstream
+from .breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, get_breaker
+from .cache import CachedResponse, ResponseCache, astore_response, response_cache, store_response
+from .coalesce import SingleFlight
+from .dispatch import RouteTrie, async_proxy, build_forward, router
+from .middleware import MetricsMiddleware
+from .routes import Route
+from .stub_upstream import StubUpstream
+from .views import ProxyUserAvatar, forward_request, passthrough_response
+
+
+def upstream_response(body, status=200, headers=None):
+    """requests.Response có body chưa đọc, giống response stream=True của UpstreamPool"""
+    response = requests.Response()
+    response.status_code = status
+    response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    response.raw = HTTPResponse(
+        body=io.BytesIO(body), headers=headers, status=status, preload_content=False, decode_content=False,
+    )
+    return response
+
+
+def closed_port():
+    """Port không có ai lắng nghe: kết nối tới sẽ bị từ chối"""
+    with socket.create_server(('127.0.0.1', 0)) as server:
+        return server.getsockname()[1]
+
+
+@override_settings(
+    USER_SERVICE='http://user_service:8001',
+    APPOINTMENT_SERVICE='http://appointment_service:8002',
+    UPSTREAM_POOL_MAXSIZE=7,
+    UPSTREAM_POOL_BLOCK=True,
+    UPSTREAM_TIMEOUTS={'USER_SERVICE': (1.5, 4), 'APPOINTMENT_SERVICE': None},
+)
+class UpstreamPoolTests(SimpleTestCase):
+    def setUp(self):
+        upstream.build_pools()
+        self.addCleanup(upstream.close_pools)
+
+    def test_same_upstream_reuses_session_and_adapter(self):
+        first = upstream.get_pool('http://user_service:8001/api/users/1/')
+        second = upstream.get_pool('http://user_service:8001/api/users/doctors/list/')
+
+        self.assertIs(first, second)
+        self.assertIs(
+            first.session.get_adapter('http://user_service:8001/a'),
+            second.session.get_adapter('http://user_service:8001/b'),
+        )
+
+    def test_separate_upstreams_get_separate_pools(self):
+        users = upstream.get_pool('http://user_service:8001/api/users/')
+        appointments = upstream.get_pool('http://appointment_service:8002/api/appointments/')
+        other = upstream.get_pool('http://unknown:9000/')
+
+        self.assertEqual((users.name, appointments.name, other.name), ('USER_SERVICE', 'APPOINTMENT_SERVICE', 'DEFAULT'))
+        self.assertIsNot(users.session, appointments.session)
+        self.assertIsNot(
+            users.session.get_adapter('http://user_service:8001/').poolmanager,
+            appointments.session.get_adapter('http://appointment_service:8002/').poolmanager,
+        )
+
+    def test_pool_size_and_timeouts_reach_requests(self):
+        users = upstream.get_pool('http://user_service:8001/')
+        appointments = upstream.get_pool('http://appointment_service:8002/')
+        adapter = users.session.get_adapter('http://user_service:8001/')
+
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'], 7)
+        self.assertTrue(adapter.poolmanager.connection_pool_kw['block'])
+        self.assertEqual(appointments.timeout, (settings.UPSTREAM_CONNECT_TIMEOUT, settings.UPSTREAM_READ_TIMEOUT))
+
+        with mock.patch.object(upstream.UpstreamAdapter, 'send', return_value=upstream_response(b'{}')) as send:
+            users.request('GET', 'http://user_service:8001/api/users/1/')
+            users.request('GET', 'http://user_service:8001/api/users/1/', timeout=(1, 1))
+        self.assertEqual([c.kwargs['timeout'] for c in send.call_args_list], [(1.5, 4), (1, 1)])
+
+    def test_connect_failure_goes_down_the_error_path(self):
+        url = f'http://127.0.0.1:{closed_port()}/api/users/1/'
+        breaker = get_breaker(url)
+        before = breaker.snapshot()['requests']
+
+        with mock.patch('builtins.print'):
+            response = forward_request('GET', url)
+
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('error', json.loads(response.content))
+        snapshot = breaker.snapshot()
+        self.assertEqual(snapshot['requests'], before + 1)
+        self.assertGreater(snapshot['error_rate'], 0)
+
+
+class FakeContent:
+    """response.content của aiohttp: chỉ cần iter_chunked"""
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def iter_chunked(self, size):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def fake_upstream(status=200, headers=None, chunks=()):
+    """Thay AsyncUpstreamPool.request: trả response aiohttp giả, không mở kết nối"""
+    response = mock.Mock(status=status, headers=CIMultiDict(headers or {}), content=FakeContent(chunks))
+
+    async def request(*args, **kwargs):
+        return response
+    return mock.patch.object(aio.AsyncUpstreamPool, 'request', side_effect=request), response
+
+
+async def read_streaming(response):
+    return b''.join([chunk async for chunk in response.streaming_content])
+
+
+class AsyncProxyTests(SimpleTestCase):
+    factory = AsyncRequestFactory()
+
+    @override_settings(GATEWAY_COALESCE=False)
+    async def test_streams_stub_upstream_through_one_pool(self):
+        with StubUpstream(payload_size=4096) as stub, override_settings(USER_SERVICE=stub.url):
+            request_pool = mock.patch.object(
+                aio.AsyncUpstreamPool, 'request', autospec=True, side_effect=aio.AsyncUpstreamPool.request,
+            )
+            try:
+                with request_pool as pool_request:
+                    for _ in range(2):
+                        response = await async_proxy(self.factory.get('/api/users/all/'), 'users/all/')
+                        self.assertEqual(response.status_code, 200)
+                        self.assertTrue(response.streaming)
+                        self.assertEqual(response['Content-Type'], 'application/json')
+                        self.assertEqual(response['Content-Length'], str(len(stub.body)))
+                        self.assertEqual(await read_streaming(response), stub.body)
+            finally:
+                await aio.close_pools()
+
+        first, second = (call.args[0] for call in pool_request.call_args_list)
+        self.assertIs(first, second)
+        self.assertEqual(first.name, 'USER_SERVICE')
+
+    async def test_status_and_headers_pass_through(self):
+        body = gzip.compress(b'[{"id": 1}]' * 100)
+        patch, upstream_reply = fake_upstream(status=201, chunks=(body[:10], body[10:]), headers={
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+            'ETag': 'W/"1"',
+            'Set-Cookie': 'sessionid=upstream',
+        })
+        try:
+            with patch:
+                response = await aio.forward_request_async('GET', 'http://upstream.test/api/x/')
+            body_read = await read_streaming(response)
+        finally:
+            await aio.close_pools()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(body_read, body)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"1"')
+        self.assertFalse(response.has_header('Set-Cookie'))
+        upstream_reply.release.assert_called_once()
+
+    async def test_upstream_errors(self):
+        url = f'http://127.0.0.1:{closed_port()}/api/x/'
+        breaker = get_breaker(url)
+        try:
+            # Lỗi 5xx của upstream được trả nguyên
+            patch, _ = fake_upstream(status=502, headers={'Content-Type': 'application/json'}, chunks=(b'{}',))
+            with patch:
+                response = await aio.forward_request_async('GET', 'http://upstream.test/api/x/')
+            self.assertEqual(response.status_code, 502)
+
+            # Lỗi kết nối: cùng đường lỗi với forward_request, được tính vào circuit breaker
+            with mock.patch('builtins.print'):
+                response = await aio.forward_request_async('GET', url)
+            self.assertEqual(response.status_code, 500)
+            self.assertEqual(breaker.snapshot()['requests'], 1)
+
+            # Mạch mở: 503 ngay, không gọi upstream
+            for _ in range(breaker.min_requests):
+                breaker.record(False, 0.01)
+            patch, _ = fake_upstream()
+            with patch as pool_request:
+                response = await aio.forward_request_async('GET', url)
+            self.assertEqual(response.status_code, 503)
+            self.assertTrue(response.has_header('Retry-After'))
+            pool_request.assert_not_called()
+        finally:
+            await aio.close_pools()
+
+
+class PassthroughTests(SimpleTestCase):
+    def test_streams_raw_upstream_body(self):
+        body = gzip.compress(b'[{"id": 1}]' * 100)
+        response = passthrough_response(upstream_response(body, headers={
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+            'Content-Length': str(len(body)),
+            'Set-Cookie': 'sessionid=upstream',
+        }))
+
+        self.assertTrue(response.streaming)
+        # Body nén của upstream được trả nguyên, không giải nén rồi serialize lại
+        self.assertEqual(b''.join(response.streaming_content), body)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Length'], str(len(body)))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertFalse(response.has_header('Set-Cookie'))
+
+    def test_upstream_is_asked_for_identity(self):
+        # Body được trả nguyên cùng Content-Encoding, nên upstream không được nén theo mặc định của requests
+        pool = upstream.UpstreamPool('STUB', 'http://stub', maxsize=1, block=False, timeout=(1, 1))
+        self.addCleanup(pool.close)
+        with mock.patch.object(upstream.UpstreamAdapter, 'send', return_value=upstream_response(b'{}')) as send:
+            pool.request('GET', 'http://stub/api/users/all/')
+            pool.request('GET', 'http://stub/api/users/all/', headers={'Authorization': 'Bearer x'})
+        self.assertEqual([c.args[0].headers['Accept-Encoding'] for c in send.call_args_list], ['identity'] * 2)
+
+    async def test_async_upstream_is_asked_for_identity(self):
+        heads = []
+
+        async def handle(reader, writer):
+            heads.append(await reader.readuntil(b'\r\n\r\n'))
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        url = f'http://127.0.0.1:{server.sockets[0].getsockname()[1]}/api/users/all/'
+        pool = aio.AsyncUpstreamPool('STUB', url, (1, 1))
+        try:
+            async with pool.request('GET', url):
+                pass
+        finally:
+            await pool.aclose()
+            server.close()
+            await server.wait_closed()
+        self.assertIn(b'\r\nAccept-Encoding: identity\r\n', heads[0])
+
+
+def cached(body, ttl=60, tags=()):
+    return CachedResponse(200, 'application/json', (), body, time.monotonic() + ttl, tags)
+
+
+def chunked_response(chunk, count, consumed, is_async=False):
+    """Response stream không có Content-Length (upstream trả chunked); consumed ghi lại các chunk đã bị đọc"""
+    def chunks():
+        for _ in range(count):
+            consumed.append(chunk)
+            yield chunk
+
+    async def achunks():
+        for chunk in chunks():
+            yield chunk
+    return StreamingHttpResponse(achunks() if is_async else chunks(), content_type='application/json')
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(max_entries=2)
+        cache.set('a', 'route', cached(b'a'))
+        cache.set('b', 'route', cached(b'b'))
+        cache.get('a', 'route')
+        cache.set('c', 'route', cached(b'c'))
+
+        self.assertIsNone(cache.get('b', 'route'))
+        self.assertEqual(cache.get('a', 'route').body, b'a')
+        self.assertEqual(cache.get('c', 'route').body, b'c')
+
+    def test_expired_entry_is_a_miss(self):
+        cache = ResponseCache()
+        cache.set('a', 'route', cached(b'a', ttl=-1))
+
+        self.assertIsNone(cache.get('a', 'route'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_invalidate_by_tag(self):
+        cache = ResponseCache()
+        cache.set(('schedules', '/1'), 'schedules', cached(b'1', tags=('doctor_schedule:1',)))
+        cache.set(('schedules', '/2'), 'schedules', cached(b'2', tags=('doctor_schedule:2',)))
+
+        self.assertEqual(cache.invalidate('doctor_schedule:1'), 1)
+        self.assertIsNone(cache.get(('schedules', '/1'), 'schedules'))
+        self.assertIsNotNone(cache.get(('schedules', '/2'), 'schedules'))
+        self.assertEqual(cache.stats()['routes']['schedules']['invalidations'], 1)
+
+    @override_settings(GATEWAY_CACHE_MAX_BODY=10)
+    def test_chunked_body_over_limit_is_streamed_not_cached(self):
+        self.addCleanup(response_cache.clear)
+        consumed = []
+        response = store_response(('big',), 'route', chunked_response(b'x' * 6, 5, consumed), 60, ())
+
+        # Dừng đọc ngay khi vượt giới hạn, phần còn lại stream thẳng về client
+        self.assertEqual(len(consumed), 2)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), b'x' * 30)
+        self.assertIsNone(response_cache.get(('big',), 'route'))
+
+        response = store_response(('small',), 'route', chunked_response(b'x' * 5, 2, []), 60, ())
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response_cache.get(('small',), 'route').body, b'x' * 10)
+
+    @override_settings(GATEWAY_CACHE_MAX_BODY=10)
+    async def test_async_chunked_body_over_limit_is_streamed_not_cached(self):
+        consumed = []
+        response = await astore_response(('abig',), 'route', chunked_response(b'x' * 6, 5, consumed, True), 60, ())
+
+        self.assertEqual(len(consumed), 2)
+        self.assertEqual(await read_streaming(response), b'x' * 30)
+        self.assertIsNone(response_cache.get(('abig',), 'route'))
+
+
+class VerifiedTokenCacheTests(SimpleTestCase):
+    key = 'test-secret'
+
+    def token(self, **claims):
+        return jwt.encode({'user_id': 1, **claims}, self.key, algorithm='HS256')
+
+    def test_signature_verified_once(self):
+        tokens = VerifiedTokenCache()
+        token = self.token(exp=int(time.time()) + 60)
+        with mock.patch('jwt.decode', wraps=jwt.decode) as decode:
+            self.assertEqual(tokens.decode(token, self.key)['user_id'], 1)
+            self.assertEqual(tokens.decode(token, self.key)['user_id'], 1)
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual((tokens.hits, tokens.misses), (1, 1))
+
+    def test_expired_entry_is_dropped(self):
+        tokens = VerifiedTokenCache()
+        tokens.put('token', {'user_id': 1, 'exp': time.time() - 1})
+
+        self.assertIsNone(tokens.get('token'))
+        self.assertEqual(tokens.stats()['size'], 0)
+
+    def test_invalid_token_is_not_cached(self):
+        tokens = VerifiedTokenCache()
+        token = self.token()
+        with self.assertRaises(jwt.InvalidSignatureError):
+            tokens.decode(token, 'other-secret')
+        self.assertEqual(tokens.stats()['size'], 0)
+
+
+class RouteTrieTests(SimpleTestCase):
+    def setUp(self):
+        self.detail = Route('appointments/<int:pk>/', 'APPOINTMENT_SERVICE', '/api/appointments/{pk}/')
+        self.static = Route('appointments/calendar/', 'APPOINTMENT_SERVICE', '/api/appointments/calendar/')
+        self.action = Route('appointments/<int:pk>/<str:action>/', 'APPOINTMENT_SERVICE', '/api/appointments/{pk}/')
+        self.trie = RouteTrie([self.detail, self.static, self.action])
+
+    def test_static_segment_wins_over_parameter(self):
+        self.assertEqual(self.trie.match('appointments/calendar/'), (self.static, {}))
+        self.assertEqual(self.trie.match('appointments/7/'), (self.detail, {'pk': 7}))
+        self.assertEqual(self.trie.match('appointments/7/cancel/'), (self.action, {'pk': 7, 'action': 'cancel'}))
+
+    def test_no_match(self):
+        self.assertEqual(self.trie.match('appointments/abc/'), (None, None))
+        self.assertEqual(self.trie.match('appointments/7'), (None, None))
+        self.assertEqual(self.trie.match('appointments/7/cancel/extra/'), (None, None))
+
+    def test_duplicate_route_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.trie.add(Route('appointments/<int:pk>/', 'APPOINTMENT_SERVICE', '/api/appointments/{pk}/'))
+
+
+class BuildForwardTests(SimpleTestCase):
+    def setUp(self):
+        self.token = jwt.encode({'user_id': 5}, settings.SECRET_KEY, algorithm='HS256')
+
+    def post(self, path, body, content_type):
+        route, kwargs = router.match(path)
+        request = RequestFactory().post(
+            f'/api/{path}', body, content_type=content_type, HTTP_AUTHORIZATION=f'Bearer {self.token}',
+        )
+        return build_forward(route, request, kwargs)
+
+    def test_inject_patient_id_requires_object_body(self):
+        forward = self.post('appointments/create/', json.dumps([1, 2]), 'application/json')
+        self.assertEqual(forward.status_code, 400)
+
+        forward = self.post('appointments/create/', json.dumps({'doctor_id': 3}), 'application/json')
+        self.assertEqual(forward['data'], {'doctor_id': 3, 'patient_id': 5})
+        self.assertIsNone(forward['body'])
+
+    def test_inject_patient_id_rejects_form_body(self):
+        forward = self.post('appointments/create/', 'doctor_id=3', 'application/x-www-form-urlencoded')
+        self.assertEqual(forward.status_code, 415)
+
+    def test_multipart_body_forwarded_unchanged(self):
+        # File và key lặp lại (request.POST.dict() làm mất cả hai) được chuyển tiếp nguyên byte
+        request = RequestFactory().post('/api/records/create/', {
+            'tag': ['a', 'b'],
+            'attachment': SimpleUploadedFile('scan.png', b'\x89PNG-data', content_type='image/png'),
+        }, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        route, kwargs = router.match('records/create/')
+        forward = build_forward(route, request, kwargs)
+
+        self.assertIsNone(forward['data'])
+        self.assertEqual(forward['body'], request.body)
+        self.assertTrue(forward['headers']['Content-Type'].startswith('multipart/form-data; boundary='))
+
+        with mock.patch.object(upstream.UpstreamAdapter, 'send', return_value=upstream_response(b'{}')) as send:
+            forward_request(**forward)
+        sent = send.call_args.args[0]
+        self.assertEqual(sent.body, request.body)
+        self.assertEqual(sent.headers['Content-Type'], request.headers['Content-Type'])
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_identical_calls_share_one_upstream_call(self):
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return HttpResponse(b'[1, 2]', content_type='application/json')
+
+        results = {}
+        leader = threading.Thread(target=lambda: results.update(leader=flights.do('key', 'route', fetch)))
+        follower = threading.Thread(target=lambda: results.update(follower=flights.do('key', 'route', fetch)))
+        leader.start()
+        started.wait(5)
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results['leader'].content, b'[1, 2]')
+        self.assertEqual(results['follower'].content, b'[1, 2]')
+        self.assertEqual(flights.stats()['routes']['route'], {'leaders': 1, 'coalesced': 1, 'fallbacks': 0})
+        self.assertEqual(flights.stats()['in_flight'], 0)
+
+    @override_settings(GATEWAY_CACHE_MAX_BODY=10)
+    def test_chunked_body_over_limit_is_not_shared(self):
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        consumed = []
+
+        def fetch():
+            started.set()
+            release.wait(5)
+            return chunked_response(b'x' * 6, 5, consumed)
+
+        results = {}
+        leader = threading.Thread(target=lambda: results.update(leader=flights.do('key', 'route', fetch)))
+        follower = threading.Thread(target=lambda: results.update(follower=flights.do('key', 'route', fetch)))
+        leader.start()
+        started.wait(5)
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        # Leader dừng đọc khi vượt giới hạn và stream phần còn lại; request chờ tự gọi upstream
+        self.assertEqual(len(consumed), 2)
+        self.assertTrue(results['leader'].streaming)
+        self.assertEqual(b''.join(results['leader'].streaming_content), b'x' * 30)
+        self.assertEqual(b''.join(results['follower'].streaming_content), b'x' * 30)
+        self.assertEqual(flights.stats()['routes']['route'], {'leaders': 1, 'coalesced': 0, 'fallbacks': 1})
+
+    @override_settings(GATEWAY_CACHE_MAX_BODY=10)
+    async def test_async_chunked_body_over_limit_is_streamed(self):
+        flights = SingleFlight()
+        consumed = []
+
+        async def fetch():
+            return chunked_response(b'x' * 6, 5, consumed, is_async=True)
+
+        response = await flights.ado('key', 'route', fetch)
+        self.assertEqual(len(consumed), 2)
+        self.assertEqual(await read_streaming(response), b'x' * 30)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('router.breaker.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(
+            'USER_SERVICE', window=30, min_requests=4, error_rate=0.5, slow_call=1, slow_rate=0.5,
+            open_seconds=10, half_open_calls=2,
+        )
+
+    def trip(self):
+        for success in (True, False, True, False):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(success, 0.01)
+
+    def test_opens_on_error_rate_and_rejects(self):
+        self.trip()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.retry_after(), 10)
+        self.assertEqual(self.breaker.snapshot()['rejected'], 1)
+
+    def test_slow_calls_open_the_circuit(self):
+        for _ in range(4):
+            self.breaker.allow()
+            self.breaker.record(True, 2)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_half_open_probes_close_the_circuit(self):
+        self.trip()
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record(True, 0.01)
+        self.breaker.record(True, 0.01)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.snapshot()['requests'], 0)
+
+    def test_failed_probe_reopens(self):
+        self.trip()
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(False, 0.01)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.opened_count, 2)
+
+    def test_cancelled_probe_frees_its_slot(self):
+        self.trip()
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+        self.breaker.cancel()
+        self.assertTrue(self.breaker.allow())
+
+    def test_old_samples_leave_the_window(self):
+        for _ in range(3):
+            self.breaker.allow()
+            self.breaker.record(False, 0.01)
+        self.now += 31
+        self.breaker.allow()
+        self.breaker.record(False, 0.01)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+
+class BatchTests(SimpleTestCase):
+    def post(self, payload):
+        return RequestFactory().post('/api/batch/', json.dumps(payload), content_type='application/json')
+
+    def test_parse_batch_rejects_invalid_specs(self):
+        for payload in (
+            {},
+            {'requests': []},
+            {'requests': [{'method': 'GET'}]},
+            {'requests': [{'path': '/api/a/'}], 'on_error': 'ignore'},
+            {'requests': [{'id': 'x', 'path': '/api/a/'}, {'id': 'x', 'path': '/api/b/'}]},
+            {'requests': [{'path': '/api/a/', 'method': 'PATCH'}]},
+        ):
+            with self.subTest(payload=payload), self.assertRaises(batch.BatchError):
+                batch.parse_batch(self.post(payload))
+
+    def test_build_subrequest_merges_params(self):
+        parent = RequestFactory().post('/api/batch/', HTTP_AUTHORIZATION='Bearer token')
+        spec = {'id': '0', 'method': 'GET', 'path': '/api/appointments/?status=PENDING', 'params': {'page': 2}, 'body': None}
+        request, path = batch.build_subrequest(parent, spec)
+
+        self.assertEqual(path, 'appointments/')
+        self.assertEqual(request.GET.dict(), {'status': 'PENDING', 'page': '2'})
+        self.assertEqual(request.headers['Authorization'], 'Bearer token')
+
+    def test_decode_body(self):
+        response = HttpResponse(content_type='application/json', headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(batch.decode_body(response, gzip.compress(b'{"id": 1}')), {'id': 1})
+        self.assertIsNone(batch.decode_body(HttpResponse(), b''))
+
+    def test_sub_request_status_and_abort(self):
+        payload = {'requests': [{'id': 'missing', 'path': '/api/no-such-route/'}]}
+        response = batch.batch(self.post(payload))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['results'][0]['status'], 404)
+
+        response = batch.batch(self.post(dict(payload, on_error='abort')))
+        self.assertEqual(response.status_code, 424)
+        self.assertEqual(json.loads(response.content)['failed'], 1)
+
+
+class AvatarUploadTests(SimpleTestCase):
+    boundary = 'upload-boundary'
+
+    def multipart(self, content_type, data=b'GIF89a'):
+        return (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="avatar"; filename="a.gif"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode() + data + f'\r\n--{self.boundary}--\r\n'.encode()
+
+    def upload(self, body, **extra):
+        request = RequestFactory().generic(
+            'POST', '/api/users/me/upload-avatar/', body,
+            content_type=f'multipart/form-data; boundary={self.boundary}', HTTP_AUTHORIZATION='Bearer token', **extra,
+        )
+        return ProxyUserAvatar.as_view()(request)
+
+    def test_first_part_headers(self):
+        head = self.multipart('image/gif')
+        self.assertEqual(uploads.multipart_boundary(f'multipart/form-data; boundary={self.boundary}'), self.boundary.encode())
+        self.assertIsNone(uploads.multipart_boundary('application/json'))
+        self.assertEqual(uploads.first_part(head, self.boundary.encode()), ('avatar', 'image/gif'))
+        self.assertIsNone(uploads.first_part(head[:40], self.boundary.encode()))
+
+    def test_rejected_before_calling_upstream(self):
+        with mock.patch('router.upstream.get_pool') as get_pool:
+            self.assertEqual(self.upload(self.multipart('text/html')).status_code, 415)
+            response = self.upload(self.multipart('image/gif'), CONTENT_LENGTH=str(100 * 1024 * 1024))
+            self.assertEqual(response.status_code, 413)
+        get_pool.assert_not_called()
+
+    def test_upload_stream_detects_disconnect(self):
+        request = RequestFactory().post('/', b'abc', content_type='application/octet-stream')
+        stream = uploads.UploadStream(request, 10)
+        self.assertEqual(len(stream), 10)
+        with self.assertRaises(uploads.ClientDisconnected):
+            list(stream)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe('users', value=value)
+
+        self.assertEqual(histogram.collect()[2:], [
+            'latency_seconds_bucket{route="users",le="0.1"} 2',
+            'latency_seconds_bucket{route="users",le="1"} 3',
+            'latency_seconds_bucket{route="users",le="+Inf"} 4',
+            'latency_seconds_sum{route="users"} 3.65',
+            'latency_seconds_count{route="users"} 4',
+        ])
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(metrics.format_labels(('path',), ('a"b\\',)), '{path="a\\"b\\\\"}')
+
+    def test_server_timing_separates_upstream_time(self):
+        def view(request):
+            request.route_name = 'users'
+            metrics.observe_upstream('USER_SERVICE', 200, 0.25)
+            return HttpResponse(b'ok')
+
+        response = MetricsMiddleware(view)(RequestFactory().get('/api/users/'))
+
+        gateway, upstream = response['Server-Timing'].split(', ')
+        self.assertTrue(gateway.startswith('gateway;dur='))
+        self.assertEqual(upstream, 'upstream;dur=250.0;desc="USER_SERVICE"')
+        self.assertIn('gateway_requests_total{route="users",method="GET",status="200"}', metrics.render())
+
+
+class ETagTests(SimpleTestCase):
+    def test_weak_comparison(self):
+        self.assertTrue(etag.matches('"abc"', '"abc"'))
+        self.assertTrue(etag.matches('W/"abc"', '"abc"'))
+        self.assertTrue(etag.matches('"xyz", "abc"', 'W/"abc"'))
+        self.assertTrue(etag.matches('*', '"abc"'))
+        self.assertFalse(etag.matches('"abc"', '"abd"'))
+        self.assertFalse(etag.matches(None, '"abc"'))
+
+    def test_not_modified_when_body_unchanged(self):
+        def upstream():
+            return passthrough_response(upstream_response(b'[1, 2]', headers={'Content-Type': 'application/json'}))
+
+        first = etag.conditional(RequestFactory().get('/api/appointments/'), upstream())
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.content, b'[1, 2]')
+        self.assertEqual(first['ETag'], etag.make_etag(b'[1, 2]'))
+
+        request = RequestFactory().get('/api/appointments/', HTTP_IF_NONE_MATCH=f"W/{first['ETag']}")
+        response = etag.conditional(request, upstream())
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+    @override_settings(GATEWAY_CACHE_MAX_BODY=10)
+    def test_chunked_body_over_limit_streams_without_etag(self):
+        consumed = []
+        request = RequestFactory().get('/api/appointments/', HTTP_IF_NONE_MATCH='"abc"')
+        response = etag.conditional(request, chunked_response(b'x' * 6, 5, consumed))
+
+        self.assertEqual(len(consumed), 2)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(b''.join(response.streaming_content), b'x' * 30)
+
+    @override_settings(GATEWAY_CACHE_MAX_BODY=10)
+    async def test_async_chunked_body_over_limit_streams_without_etag(self):
+        consumed = []
+        request = RequestFactory().get('/api/appointments/')
+        response = await etag.aconditional(request, chunked_response(b'x' * 6, 5, consumed, is_async=True))
+
+        self.assertEqual(len(consumed), 2)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(await read_streaming(response), b'x' * 30)
+
+
+@mock.patch.dict(compression.ENCODERS, {'gzip': compression.GzipEncoder}, clear=True)
+class CompressionTests(SimpleTestCase):
+    body = json.dumps([{'id': i, 'status': 'PENDING'} for i in range(200)]).encode()
+
+    def compress(self, response, accept='gzip, deflate'):
+        return compression.compress_response(RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept), response)
+
+    def test_negotiate(self):
+        self.assertEqual(compression.negotiate('gzip, deflate'), 'gzip')
+        self.assertEqual(compression.negotiate('*;q=0.5'), 'gzip')
+        self.assertIsNone(compression.negotiate('gzip;q=0, identity'))
+        self.assertIsNone(compression.negotiate(None))
+
+    def test_gzip_large_json(self):
+        response = HttpResponse(self.body, content_type='application/json')
+        response['ETag'] = '"v1"'
+        response = self.compress(response)
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_streaming_response_compressed_by_chunk(self):
+        chunks = [self.body[:1000], self.body[1000:]]
+        response = self.compress(StreamingHttpResponse(iter(chunks), content_type='application/json'))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.body)
+
+    def test_left_alone(self):
+        small = HttpResponse(b'{}', content_type='application/json')
+        image = HttpResponse(self.body, content_type='image/png')
+        for response in (small, image):
+            with self.subTest(content_type=response['Content-Type']):
+                self.assertFalse(self.compress(response).has_header('Content-Encoding'))
+        unsupported = self.compress(HttpResponse(self.body, content_type='application/json'), 'br')
+        self.assertFalse(unsupported.has_header('Content-Encoding'))
+
+
+class LoadTestTests(SimpleTestCase):
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix('login=1,list_appointments=5'), {'login': 1.0, 'list_appointments': 5.0})
+        for value in ('unknown=1', 'login=x', 'login=0'):
+            with self.subTest(value=value), self.assertRaises(loadtest.LoadTestError):
+                loadtest.parse_mix(value)
+
+    def test_summarize(self):
+        samples = [('login', 200, i / 1000) for i in range(1, 101)] + [('login', 0, 0.5), ('login', 404, 0.001)]
+        total = loadtest.summarize(samples, elapsed=2)['total']
+
+        self.assertEqual((total['requests'], total['rps'], total['errors'], total['client_errors']), (102, 51.0, 1, 1))
+        self.assertEqual(loadtest.percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(total['max_ms'], 500)
+
+    def test_compare_reports_regressions_as_positive(self):
+        baseline = {'total': {'rps': 100, 'p95_ms': 10, 'p99_ms': 20}}
+        current = {'total': {'rps': 80, 'p95_ms': 15, 'p99_ms': 20}}
+        self.assertEqual(loadtest.compare(baseline, current), [
+            ('total', 'rps', 100, 80, 20.0),
+            ('total', 'p95_ms', 10, 15, 50.0),
+            ('total', 'p99_ms', 20, 20, 0.0),
+        ])
+
+    def test_stub_upstream_serves_payload(self):
+        with StubUpstream(payload_size=512) as stub, requests.Session() as session:
+            for _ in range(2):
+                response = session.get(stub.url + '/api/users/all/', timeout=5)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, stub.body)
+
+
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('router.ratelimit.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_bucket_burst_and_refill(self):
+        backend = ratelimit.LocalRateLimitBackend()
+        self.assertEqual([backend.consume('key', rate=2, burst=3) for _ in range(3)], [0, 0, 0])
+        self.assertEqual(backend.consume('key', rate=2, burst=3), 0.5)
+
+        self.now += 0.5
+        self.assertEqual(backend.consume('key', rate=2, burst=3), 0)
+        self.assertGreater(backend.consume('key', rate=2, burst=3), 0)
+
+    def test_evicted_bucket_starts_full(self):
+        backend = ratelimit.LocalRateLimitBackend(max_keys=1)
+        backend.consume('a', rate=1, burst=1)
+        backend.consume('b', rate=1, burst=1)
+        self.assertEqual(backend.consume('a', rate=1, burst=1), 0)
+
+    @override_settings(GATEWAY_RATE_LIMIT=True, GATEWAY_RATE_LIMITS={'default': {'client': (1, 2)}})
+    def test_admit_per_client(self):
+        route = Route('doctors/', 'USER_SERVICE', '/api/users/doctors/')
+        token = jwt.encode({'user_id': 5}, settings.SECRET_KEY, algorithm='HS256')
+        user = RequestFactory().get('/api/doctors/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        anonymous = RequestFactory().get('/api/doctors/')
+
+        with mock.patch.object(ratelimit, '_backend', ratelimit.LocalRateLimitBackend()):
+            self.assertEqual(ratelimit.client_id(user), 'user:5')
+            self.assertIsNone(ratelimit.admit(route, user))
+            self.assertIsNone(ratelimit.admit(route, user))
+            rejected = ratelimit.admit(route, user)
+            # Bucket của user khác (ở đây là IP) không bị ảnh hưởng
+            self.assertIsNone(ratelimit.admit(route, anonymous))
+
+        self.assertEqual(rejected.status_code, 429)
+        self.assertEqual(rejected['Retry-After'], '1')
+
+
+class RetryTests(SimpleTestCase):
+    def test_retry_budget(self):
+        budget = retry.RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+
+    def test_latency_threshold(self):
+        tracker = retry.LatencyTracker(size=100, percentile=95, min_samples=10)
+        for i in range(9):
+            tracker.observe(i / 100)
+        self.assertIsNone(tracker.threshold())
+        for i in range(9, 100):
+            tracker.observe(i / 100)
+        self.assertEqual(tracker.threshold(), 0.95)
+
+    def test_scheduler_runs_callbacks_in_order_and_skips_cancelled(self):
+        scheduler = retry.HedgeScheduler()
+        fired = []
+        done = threading.Event()
+        scheduler.schedule(0.03, lambda: (fired.append('late'), done.set()))
+        cancelled = scheduler.schedule(0.01, lambda: fired.append('cancelled'))
+        scheduler.schedule(0.02, lambda: fired.append('early'))
+        scheduler.cancel(cancelled)
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(fired, ['early', 'late'])
+
+    @override_settings(GATEWAY_HEDGE_MAX_WORKERS=1)
+    def test_no_hedge_when_pool_is_full(self):
+        with mock.patch.multiple(retry, _executor=None, _executor_slots=None):
+            self.assertTrue(retry.acquire_hedge_slot())
+            self.assertFalse(retry.acquire_hedge_slot())
+            release = threading.Event()
+            retry.submit_hedge(release.wait, 5)
+            release.set()
+            retry.get_executor().shutdown(wait=True)
+            self.assertTrue(retry.acquire_hedge_slot())
+
+    def test_abort_interrupts_a_waiting_upstream_call(self):
+        # Upstream nhận kết nối nhưng không bao giờ trả response
+        server = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+        url = f'http://127.0.0.1:{server.getsockname()[1]}/'
+        pool = upstream.UpstreamPool('STUB', url, maxsize=1, block=False, timeout=(1, 10))
+        self.addCleanup(pool.close)
+        handle = upstream.AbortHandle()
+        threading.Timer(0.1, handle.abort).start()
+
+        start = time.monotonic()
+        with upstream.abortable(handle), self.assertRaises(requests.ConnectionError):
+            pool.request('GET', url)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(handle.aborted)
@@ -0,0 +1,79 @@
+import re
+
+from django.conf import settings
+from django.utils.http import parse_header_parameters
+
+
+# Header của part đầu tiên trong body multipart phải nằm trong ngần này byte
+MAX_PART_HEADER = 8 * 1024
+
+_field_name = re.compile(r'\bname="([^"]*)"')
+
+
+class ClientDisconnected(IOError):
+    pass
+
+
+class UploadStream:
+    """
+    Body của request được đọc theo từng chunk và gửi thẳng lên upstream,
+    không giữ cả file trong bộ nhớ. __len__ để requests gửi Content-Length thay vì chunked.
+    """
+    def __init__(self, request, length, head=b''):
+        self.request = request
+        self.length = length
+        self.head = head
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        if self.head:
+            yield self.head
+        remaining = self.length - len(self.head)
+        while remaining > 0:
+            chunk = self.request.read(min(settings.GATEWAY_STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ClientDisconnected('Client ngắt kết nối khi đang upload')
+            remaining -= len(chunk)
+            yield chunk
+
+
+def multipart_boundary(content_type):
+    main, params = parse_header_parameters(content_type or '')
+    if main.lower() != 'multipart/form-data':
+        return None
+    boundary = params.get('boundary')
+    return boundary.encode('latin-1') if boundary else None
+
+
+def read_head(request, length):
+    """Đọc phần đầu body, đủ để chứa header của part đầu tiên"""
+    head = b''
+    limit = min(length, MAX_PART_HEADER)
+    while len(head) < limit:
+        chunk = request.read(limit - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head
+
+
+def first_part(head, boundary):
+    """(field name, content type) của part đầu tiên, hoặc None nếu header chưa đọc đủ"""
+    start = head.find(b'--' + boundary)
+    if start < 0:
+        return None
+    end = head.find(b'\r\n\r\n', start)
+    if end < 0:
+        return None
+    name = content_type = None
+    for line in head[start:end].split(b'\r\n')[1:]:
+        key, _, value = line.decode('latin-1').partition(':')
+        key = key.strip().lower()
+        if key == 'content-disposition':
+            match = _field_name.search(value)
+            name = match.group(1) if match else None
+        elif key == 'content-type':
+            content_type = value.strip().lower()
+    return name, content_type
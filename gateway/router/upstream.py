@@ -0,0 +1,211 @@
+import contextlib
+import contextvars
+import socket
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# AbortHandle của lần gọi upstream đang chạy trên thread/context hiện tại (xem abortable())
+_abort_handle = contextvars.ContextVar('upstream_abort_handle', default=None)
+
+
+class AbortHandle:
+    """
+    Cho phép thread khác ngắt một lần gọi upstream đang chờ response header (dùng khi hedge về trước):
+    socket của kết nối bị shutdown nên lần gọi raise ConnectionError ngay. Khi đã có response header thì
+    abort() không còn tác dụng, body của response không bao giờ bị cắt ngang.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sock = None
+        self.aborted = False
+
+    def attach(self, sock):
+        with self._lock:
+            self._sock = sock
+            if self.aborted:
+                self._shutdown()
+
+    def detach(self):
+        with self._lock:
+            self._sock = None
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            self._shutdown()
+
+    def _shutdown(self):
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+@contextlib.contextmanager
+def abortable(handle):
+    """Các lần gọi upstream trong block có thể bị ngắt bằng handle.abort()"""
+    token = _abort_handle.set(handle)
+    try:
+        yield handle
+    finally:
+        _abort_handle.reset(token)
+
+
+class AbortableConnectionMixin:
+    def getresponse(self, *args, **kwargs):
+        handle = _abort_handle.get()
+        if handle is None:
+            return super().getresponse(*args, **kwargs)
+        handle.attach(self.sock)
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            handle.detach()
+
+
+class AbortableHTTPConnection(AbortableConnectionMixin, HTTPConnection):
+    pass
+
+
+class AbortableHTTPSConnection(AbortableConnectionMixin, HTTPSConnection):
+    pass
+
+
+class AbortableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = AbortableHTTPConnection
+
+
+class AbortableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = AbortableHTTPSConnection
+
+
+class UpstreamAdapter(HTTPAdapter):
+    """HTTPAdapter có kết nối ngắt được bằng AbortHandle"""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': AbortableHTTPConnectionPool,
+            'https': AbortableHTTPSConnectionPool,
+        }
+
+
+class UpstreamPool:
+    """
+    Keep-alive connection pool cho một upstream service.
+    Session được dùng chung giữa các request nên không giữ cookie của upstream.
+    """
+    def __init__(self, name, base_url, maxsize, block, timeout):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.trust_env = False
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        # Body của upstream được stream nguyên về client cùng Content-Encoding, nên không xin upstream nén
+        # (client có thể không nhận gzip/br); CompressionMiddleware nén theo Accept-Encoding của client
+        self.session.headers['Accept-Encoding'] = 'identity'
+
+        adapter = UpstreamAdapter(pool_connections=1, pool_maxsize=maxsize, pool_block=block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        return self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __repr__(self):
+        return f"<UpstreamPool {self.name} {self.base_url}>"
+
+
+_pools = {}
+_default_pool = None
+
+# Header của upstream được giữ nguyên khi stream body về client
+PASSTHROUGH_HEADERS = (
+    'Content-Encoding',
+    'Content-Length',
+    'Content-Disposition',
+    'Cache-Control',
+    'ETag',
+    'Last-Modified',
+)
+
+
+def copy_passthrough_headers(upstream_headers, response):
+    for name in PASSTHROUGH_HEADERS:
+        value = upstream_headers.get(name)
+        if value is not None:
+            response[name] = value
+    return response
+
+
+def iter_upstream(response):
+    """Stream byte thô (chưa giải nén) của upstream, trả kết nối về pool khi xong"""
+    try:
+        yield from response.raw.stream(settings.GATEWAY_STREAM_CHUNK_SIZE, decode_content=False)
+    finally:
+        response.close()
+
+
+def build_pools():
+    """Tạo pool cho mọi upstream khai báo trong settings.UPSTREAM_TIMEOUTS"""
+    global _default_pool
+
+    close_pools()
+    default_timeout = (settings.UPSTREAM_CONNECT_TIMEOUT, settings.UPSTREAM_READ_TIMEOUT)
+    for name, timeout in settings.UPSTREAM_TIMEOUTS.items():
+        base_url = getattr(settings, name, None)
+        if not base_url:
+            continue
+        pool = UpstreamPool(
+            name,
+            base_url,
+            maxsize=settings.UPSTREAM_POOL_MAXSIZE,
+            block=settings.UPSTREAM_POOL_BLOCK,
+            timeout=timeout or default_timeout,
+        )
+        _pools[urlparse(base_url).netloc] = pool
+
+    _default_pool = UpstreamPool(
+        'DEFAULT',
+        '',
+        maxsize=settings.UPSTREAM_POOL_MAXSIZE,
+        block=settings.UPSTREAM_POOL_BLOCK,
+        timeout=default_timeout,
+    )
+    return _pools
+
+
+def close_pools():
+    global _default_pool
+
+    for pool in _pools.values():
+        pool.close()
+    _pools.clear()
+    if _default_pool is not None:
+        _default_pool.close()
+        _default_pool = None
+
+
+def get_pool(url):
+    """Trả về pool tương ứng với host:port của url"""
+    if _default_pool is None:
+        build_pools()
+    return _pools.get(urlparse(url).netloc, _default_pool)
+
+
+def get_pools():
+    if _default_pool is None:
+        build_pools()
+    return dict(_pools)
@@ -1,13 +1,135 @@
-import requests
-import jwt
 from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
+import contextvars
+import threading
+import time
 from urllib.parse import urlparse
+from . import metrics, retry, uploads, upstream
+from .breaker import breaker_stats, get_breaker, unavailable_response
+from .cache import response_cache
+from .coalesce import single_flight
 
 
-def forward_request(method, url, data=None, headers=None, params=None):
+def passthrough_response(response):
+    """Trả nguyên body của upstream về client, không parse lại JSON"""
+    proxied = StreamingHttpResponse(
+        upstream.iter_upstream(response),
+        status=response.status_code,
+        content_type=response.headers.get('Content-Type'),
+    )
+    return upstream.copy_passthrough_headers(response.headers, proxied)
 
+
+def send_upstream(breaker, method, url, route=None, abort=None, **kwargs):
+    """
+    Một lần gọi upstream (breaker.allow() đã được gọi trước đó); ghi nhận kết quả vào breaker và metrics.
+    route: ghi latency của response thành công để tính ngưỡng hedge
+    abort: AbortHandle nếu lần gọi có thể bị ngắt khi hedge về trước; bị ngắt thì không tính là lỗi của upstream
+    """
+    metrics.upstream_in_flight.inc(breaker.name)
+    start = time.monotonic()
+    try:
+        response = upstream.get_pool(url).request(method=method, url=url, stream=True, **kwargs)
+    except Exception:
+        elapsed = time.monotonic() - start
+        if abort is not None and abort.aborted:
+            breaker.cancel()
+            raise
+        breaker.record(False, elapsed)
+        metrics.observe_upstream(breaker.name, 'error', elapsed)
+        raise
+    finally:
+        metrics.upstream_in_flight.dec(breaker.name)
+    elapsed = time.monotonic() - start
+    breaker.record(response.status_code < 500, elapsed)
+    metrics.observe_upstream(breaker.name, response.status_code, elapsed)
+    if route is not None and response.status_code < 500:
+        retry.get_tracker(route).observe(elapsed)
+    return response
+
+
+def close_loser(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def send_hedged(breaker, method, url, route, **kwargs):
+    """
+    Gọi upstream ngay trên thread của request; nếu chưa có response sau ngưỡng hedge của route thì gửi thêm
+    một lần gọi trên pool của hedge (pool đầy thì bỏ qua, không xếp hàng) và dùng response về trước.
+    Hedge về trước thì lần gọi đầu bị ngắt (upstream.AbortHandle) để request không phải chờ nó;
+    response thua được đóng để trả kết nối về pool.
+    """
+    delay = retry.hedge_delay(route)
+    if delay is None:
+        return send_upstream(breaker, method, url, route, **kwargs)
+
+    # Lần hedge chạy trong context của request để Server-Timing vẫn thấy nó (lấy trước khi gắn AbortHandle)
+    context = contextvars.copy_context()
+    handle = upstream.AbortHandle()
+    lock = threading.Lock()
+    race = {'first_done': False, 'hedge': None}
+
+    def hedge_done(future):
+        with lock:
+            if race['first_done'] or future.exception() is not None:
+                return
+        handle.abort()
+
+    def fire():
+        with lock:
+            if race['first_done'] or not retry.acquire_hedge_slot():
+                return
+            if not breaker.allow():
+                retry.release_hedge_slot()
+                return
+            if not retry.allow_extra(breaker, 'hedge'):
+                breaker.cancel()
+                retry.release_hedge_slot()
+                return
+            hedge = race['hedge'] = retry.submit_hedge(
+                context.run, send_upstream, breaker, method, url, route, **kwargs,
+            )
+        hedge.add_done_callback(hedge_done)
+
+    scheduler = retry.get_scheduler()
+    timer = scheduler.schedule(delay, fire)
+    try:
+        with upstream.abortable(handle):
+            response = send_upstream(breaker, method, url, route, abort=handle, **kwargs)
+    except Exception as error:
+        with lock:
+            race['first_done'] = True
+            hedge = race['hedge']
+        scheduler.cancel(timer)
+        if hedge is None:
+            raise
+        try:
+            response = hedge.result()
+        except Exception:
+            raise error
+        metrics.hedge_wins_total.inc(route)
+        return response
+
+    with lock:
+        race['first_done'] = True
+        hedge = race['hedge']
+    scheduler.cancel(timer)
+    if hedge is not None:
+        hedge.add_done_callback(close_loser)
+    return response
+
+
+def forward_request(method, url, data=None, headers=None, params=None, timeout=None, retries=0, hedge=None,
+                    body=None):
+    """
+    data     body JSON
+    body     body thô (bytes) gửi nguyên cùng Content-Type trong headers, thay cho data
+    retries  số lần gửi lại khi lỗi kết nối (chỉ dùng cho request idempotent), trong giới hạn retry budget
+    hedge    tên route nếu được hedge (router/retry.py)
+    """
     headers = headers or {}
     parsed_url = urlparse(url)
     host = parsed_url.hostname  # Chỉ lấy phần 'user_service', không có ':8001'
@@ -15,439 +137,129 @@ def forward_request(method, url, data=None, headers=None, params=None):
     # ✅ Gán lại Host chính xác để không bị lỗi DisallowedHost
     headers['Host'] = host
 
-    try:
-        response = requests.request(
-            method=method,
-            url=url,
-            json=data,
-            headers=headers,
-            params=params,
-            timeout=10
-        )
-        return Response(response.json(), status=response.status_code)
-    except Exception as e:
-        print(f"❌ ERROR: {e}")
-        return Response({"error": str(e)}, status=500)
-
-
-# ---- USER SERVICE ----
-
-class ProxyRegister(APIView):
-    def post(self, request):
-        return forward_request('POST', f"{settings.USER_SERVICE}/api/users/register/", data=request.data)
-
-class ProxyLogin(APIView):
-    def post(self, request):
-        return forward_request('POST', f"{settings.USER_SERVICE}/api/users/login/", data=request.data)
-
-class ProxyUserMe(APIView):
-    def get(self, request):
-        return forward_request('GET', f"{settings.USER_SERVICE}/api/users/me/", headers={'Authorization': request.headers.get('Authorization')})
+    breaker = get_breaker(url)
+    kwargs = {'headers': headers, 'params': params, 'timeout': timeout}
+    if body is not None:
+        kwargs['data'] = body
+    else:
+        kwargs['json'] = data
+    retry.get_budget().deposit()
+    attempt = 0
+    while True:
+        # Upstream đang lỗi/treo: trả 503 ngay thay vì giữ worker chờ hết timeout
+        if not breaker.allow():
+            return unavailable_response(breaker)
+        try:
+            if hedge is not None:
+                response = send_hedged(breaker, method, url, hedge, **kwargs)
+            else:
+                response = send_upstream(breaker, method, url, **kwargs)
+        except Exception as e:
+            if attempt < retries and retry.is_connection_error(e) and retry.allow_extra(breaker, 'retry'):
+                time.sleep(retry.backoff(attempt))
+                attempt += 1
+                continue
+            print(f"❌ ERROR: {e}")
+            return JsonResponse({"error": str(e)}, status=500)
+        return passthrough_response(response)
 
-    def put(self, request):
-        return forward_request('PUT', f"{settings.USER_SERVICE}/api/users/me/", data=request.data, headers={'Authorization': request.headers.get('Authorization')})
 
-    def delete(self, request):
-        return forward_request('DELETE', f"{settings.USER_SERVICE}/api/users/delete/", headers={'Authorization': request.headers.get('Authorization')})
+# Các route proxy còn lại được khai báo trong router/routes.py và xử lý bởi router/dispatch.py
 
 class ProxyUserAvatar(APIView):
     def post(self, request):
-        """Proxy avatar upload to user service"""
-        import requests
-        from django.http import FileResponse
-        
+        """
+        Proxy avatar upload to user service.
+        Body multipart được stream từng chunk lên user_service, không đọc cả file vào bộ nhớ;
+        giới hạn kích thước và loại file được kiểm tra trước khi đọc hết body.
+        """
         auth_header = request.headers.get('Authorization')
         if not auth_header:
             return Response({'error': 'Authorization header required'}, status=401)
-            
-        # Prepare the file upload
-        files = {}
-        if 'avatar' in request.FILES:
-            avatar_file = request.FILES['avatar']
-            files['avatar'] = (avatar_file.name, avatar_file.read(), avatar_file.content_type)
-        
+
+        content_type = request.META.get('CONTENT_TYPE', '')
+        boundary = uploads.multipart_boundary(content_type)
+        if boundary is None:
+            return Response({'error': 'Content-Type phải là multipart/form-data'}, status=415)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length <= 0:
+            return Response({'error': 'Thiếu Content-Length'}, status=411)
+        if length > settings.AVATAR_MAX_SIZE + settings.AVATAR_MULTIPART_OVERHEAD:
+            return Response({'error': f'File quá lớn, tối đa {settings.AVATAR_MAX_SIZE // (1024 * 1024)}MB'}, status=413)
+
+        head = uploads.read_head(request, length)
+        part = uploads.first_part(head, boundary)
+        if part is None:
+            return Response({'error': 'Body multipart không hợp lệ'}, status=400)
+        name, file_type = part
+        if name == 'avatar' and file_type not in settings.AVATAR_CONTENT_TYPES:
+            return Response({'error': 'Invalid file type. Only JPEG, PNG, and GIF are allowed.'}, status=415)
+
+        url = f"{settings.USER_SERVICE}/api/users/me/upload-avatar/"
+        breaker = get_breaker(url)
+        if not breaker.allow():
+            return unavailable_response(breaker)
+        pool = upstream.get_pool(url)
+        metrics.upstream_in_flight.inc(breaker.name)
+        start = time.monotonic()
         try:
-            response = requests.post(
-                f"{settings.USER_SERVICE}/api/users/me/upload-avatar/",
-                files=files,
-                headers={'Authorization': auth_header},
-                timeout=30
+            response = pool.request(
+                'POST',
+                url,
+                data=uploads.UploadStream(request, length, head),
+                headers={'Authorization': auth_header, 'Content-Type': content_type},
+                timeout=(pool.timeout[0], 30),
+                stream=True,
             )
-            return Response(response.json(), status=response.status_code)
+        except uploads.ClientDisconnected as e:
+            breaker.cancel()
+            return Response({'error': str(e)}, status=400)
         except Exception as e:
+            elapsed = time.monotonic() - start
+            breaker.record(False, elapsed)
+            metrics.observe_upstream(breaker.name, 'error', elapsed)
             return Response({'error': str(e)}, status=500)
-
-class ProxyUserList(APIView):
-    def get(self, request):
-        return forward_request(
-            'GET',
-            f"{settings.USER_SERVICE}/api/users/all/",
-            headers={'Authorization': request.headers.get('Authorization')}
-        )
-
-class ProxyUserDoctors(APIView):
-    def get(self, request):
-        return forward_request(
-            'GET',
-            f"{settings.USER_SERVICE}/api/users/doctors/",
-            headers={'Authorization': request.headers.get('Authorization')}
-        )
-
-# ---- APPOINTMENT SERVICE ----
-
-class ProxyAppointmentCreate(APIView):
-    """
-    POST /api/appointments/create/
-    Body cần bao gồm field patient_id, doctor_id, scheduled_time, reason
-    """
-    def post(self, request):
-        # 1. Lấy token
-        auth = request.headers.get('Authorization','')
-        if not auth.startswith('Bearer '):
-            return Response({'error':'Missing Bearer token'}, status=401)
-        token = auth.split(' ',1)[1]
-
-        # 2. Decode JWT
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            patient_id = payload.get('user_id')
-        except jwt.PyJWTError as e:
-            return Response({'error':'Invalid token','detail':str(e)}, status=401)
-
-        # 3. Chuẩn bị body mới
-        body = request.data.copy()
-        body['patient_id'] = patient_id
-
-        # 4. Forward với Authorization header
-        return forward_request(
-            'POST',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/create/",
-            data=body,
-            headers={'Authorization': auth}  # Thêm Authorization header
-        )
-
-class ProxyAppointmentList(APIView):
-    """
-    GET /api/appointments/?role=PATIENT (hoặc DOCTOR)
-    Headers: Authorization Bearer <token>
-    """
-    def get(self, request):
-        auth = request.headers.get('Authorization','')
-        if not auth.startswith('Bearer '):
-            return Response({'error':'Missing Bearer token'}, status=401)
-        token = auth.split(' ',1)[1]
-
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            user_id = payload.get('user_id')
-            role = payload.get('role','PATIENT')  # nếu payload không có role
-        except jwt.PyJWTError as e:
-            return Response({'error':'Invalid token','detail':str(e)}, status=401)
-
-        # Forward ALL query params from the original request, and add/override role if needed
-        params = dict(request.query_params)
-        if 'role' not in params:
-            params['role'] = role
-            
-        return forward_request(
-            'GET',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/",
-            params=params,
-            headers={'Authorization': auth}  # Forward Authorization header
-        )
-
-class ProxyAppointmentDetail(APIView):
-    def get(self, request, pk):
-        auth_header = request.headers.get('Authorization', '')
-        return forward_request(
-            'GET',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/{pk}/",
-            headers={'Authorization': auth_header} if auth_header else {}
-        )
-
-    def put(self, request, pk):
-        auth = request.headers.get('Authorization','')
-        if not auth.startswith('Bearer '):
-            return Response({'error':'Missing Bearer token'}, status=401)
-        token = auth.split(' ',1)[1]
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-        except jwt.PyJWTError as e:
-            return Response({'error':'Invalid token','detail':str(e)}, status=401)
-
-        return forward_request(
-            'PUT',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/{pk}/",
-            data=request.data,
-            headers={'Authorization': auth}
-        )
-
-    def delete(self, request, pk):
-        auth = request.headers.get('Authorization','')
-        if not auth.startswith('Bearer '):
-            return Response({'error':'Missing Bearer token'}, status=401)
-        token = auth.split(' ',1)[1]
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-        except jwt.PyJWTError as e:
-            return Response({'error':'Invalid token','detail':str(e)}, status=401)
-
-        return forward_request(
-            'DELETE',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/{pk}/",
-            headers={'Authorization': auth}
-        )
-
-
-class ProxyDoctorSchedule(APIView):
-    """
-    Proxy cho Doctor Schedule API
-    GET /api/appointments/schedules/?doctor_id=123
-    POST /api/appointments/schedules/
-    """
-    def get(self, request):
-        auth_header = request.headers.get('Authorization', '')
-        return forward_request(
-            'GET',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/schedules/",
-            params=request.query_params,
-            headers={'Authorization': auth_header} if auth_header else {}
-        )
-    
-    def post(self, request):
-        auth = request.headers.get('Authorization','')
-        if not auth.startswith('Bearer '):
-            return Response({'error':'Missing Bearer token'}, status=401)
-        
-        return forward_request(
-            'POST',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/schedules/",
-            data=request.data,
-            headers={'Authorization': auth}
-        )
-
-
-class ProxyAvailableSlots(APIView):
-    """
-    Proxy cho Available Slots API
-    GET /api/appointments/available-slots/?doctor_id=123&date=2025-05-01
-    """
-    def get(self, request):
-        doctor_id = request.query_params.get('doctor_id')
-        if not doctor_id:
-            return Response({"error": "Thiếu doctor_id"}, status=400)
-        
-        # Forward Authorization header
-        auth_header = request.headers.get('Authorization', '')
-        
-        return forward_request(
-            'GET',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/available-slots/",
-            params=request.query_params,
-            headers={'Authorization': auth_header} if auth_header else {}
-        )
-
-
-class ProxyDailyAvailability(APIView):
-    """
-    Proxy cho Daily Availability API
-    GET /api/appointments/daily-availability/?doctor_id=123&start_date=2025-05-01&end_date=2025-05-31
-    """
-    def get(self, request):
-        doctor_id = request.query_params.get('doctor_id')
-        if not doctor_id:
-            return Response({"error": "Thiếu doctor_id"}, status=400)
-        
-        auth_header = request.headers.get('Authorization', '')
-        return forward_request(
-            'GET',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/daily-availability/",
-            params=request.query_params,
-            headers={'Authorization': auth_header} if auth_header else {}
-        )
+        finally:
+            metrics.upstream_in_flight.dec(breaker.name)
+        elapsed = time.monotonic() - start
+        breaker.record(response.status_code < 500, elapsed)
+        metrics.observe_upstream(breaker.name, response.status_code, elapsed)
+        return passthrough_response(response)
 
 
-class ProxyCalendarDensity(APIView):
+class GatewayCacheStats(APIView):
     """
-    Proxy cho Calendar Density API
-    GET /api/appointments/calendar-density/?doctor_id=123&year=2025&month=5
+    Số lần hit/miss của response cache theo route, dùng để chỉnh TTL
+    GET /api/gateway/cache/
     """
     def get(self, request):
-        doctor_id = request.query_params.get('doctor_id')
-        if not doctor_id:
-            return Response({"error": "Thiếu doctor_id"}, status=400)
-        
-        auth_header = request.headers.get('Authorization', '')
-        return forward_request(
-            'GET',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/calendar-density/",
-            params=request.query_params,
-            headers={'Authorization': auth_header} if auth_header else {}
-        )
+        return Response(response_cache.stats())
 
 
-class ProxyDepartmentList(APIView):
+class GatewayCoalesceStats(APIView):
     """
-    Proxy cho Department List API
-    GET /api/appointments/departments/
+    Số request GET được gộp vào lần gọi upstream của request khác, theo route
+    GET /api/gateway/coalesce/
     """
     def get(self, request):
-        auth_header = request.headers.get('Authorization', '')
-        return forward_request(
-            'GET',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/departments/",
-            headers={'Authorization': auth_header} if auth_header else {}
-        )
+        return Response(single_flight.stats())
 
 
-class ProxyTokenDebug(APIView):
+class GatewayBreakerStats(APIView):
     """
-    Proxy cho Token Debug API (chỉ dùng trong development)
-    GET /api/appointments/token-debug/
+    Trạng thái circuit breaker, tỉ lệ lỗi và độ trễ của từng upstream
+    GET /api/gateway/breakers/
     """
     def get(self, request):
-        auth = request.headers.get('Authorization','')
-        return forward_request(
-            'GET',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/token-debug/",
-            headers={'Authorization': auth} if auth else {}
-        )
-
-
-class ProxyInternalAppointmentList(APIView):
-    """
-    Proxy cho Internal Appointment List API (không cần xác thực)
-    GET /api/appointments/internal/?user_id=123&role=PATIENT
-    """
-    def get(self, request):
-        user_id = request.query_params.get('user_id')
-        role = request.query_params.get('role')
-        
-        if not user_id or not role:
-            return Response({"error": "Phải cung cấp user_id và role"}, status=400)
-        
-        return forward_request(
-            'GET',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/internal/",
-            params=request.query_params
-        )
-
-# ---- CLINICAL SERVICE ----
-
-class ProxyMedicalRecordCreate(APIView):
-    def post(self, request):
-        return forward_request('POST', f"{settings.CLINICAL_SERVICE}/api/records/create/", data=request.data, headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyMedicalRecordList(APIView):
-    def get(self, request):
-        return forward_request('GET', f"{settings.CLINICAL_SERVICE}/api/records/", headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyVitalSignCreate(APIView):
-    def post(self, request):
-        return forward_request('POST', f"{settings.CLINICAL_SERVICE}/api/records/vitals/", data=request.data, headers={'Authorization': request.headers.get('Authorization')})
-
-
-# ---- PHARMACY SERVICE ----
-class ProxyPharmacyPrescriptionCreate(APIView):
-    def post(self, request):
-        return forward_request('POST', f"{settings.PHARMACY_SERVICE}/api/pharmacy/prescriptions/create/", data=request.data, headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyPharmacyPrescriptionList(APIView):
-    def get(self, request):
-        return forward_request('GET', f"{settings.PHARMACY_SERVICE}/api/pharmacy/prescriptions/", headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyPharmacyPrescriptionDispense(APIView):
-    def post(self, request, pk):
-        return forward_request('POST', f"{settings.PHARMACY_SERVICE}/api/pharmacy/prescriptions/{pk}/dispense/", headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyPharmacyInventoryView(APIView):
-    def get(self, request):
-        return forward_request('GET', f"{settings.PHARMACY_SERVICE}/api/pharmacy/inventory/", headers={'Authorization': request.headers.get('Authorization')})
-    
-
-# ---- LAB SERVICE ----
-class ProxyLabTestList(APIView):
-    def get(self, request):
-        return forward_request('GET', f"{settings.LAB_SERVICE}/api/lab/tests/")
-
-class ProxyLabOrderList(APIView):
-    def get(self, request):
-        return forward_request('GET', f"{settings.LAB_SERVICE}/api/lab/orders/", headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyLabOrderCreate(APIView):
-    def post(self, request):
-        return forward_request('POST', f"{settings.LAB_SERVICE}/api/lab/orders/create/", data=request.data, headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyLabResultList(APIView):
-    def get(self, request):
-        return forward_request('GET', f"{settings.LAB_SERVICE}/api/lab/results/", headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyLabResultCreate(APIView):
-    def post(self, request):
-        return forward_request('POST', f"{settings.LAB_SERVICE}/api/lab/results/create/", data=request.data, headers={'Authorization': request.headers.get('Authorization')})
-
-
-# ---- INSURANCE SERVICE ----
-class ProxyClaimCreate(APIView):
-    def post(self, request):
-        return forward_request('POST', f"{settings.INSURANCE_SERVICE}/api/insurance/claims/create/", data=request.data, headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyClaimList(APIView):
-    def get(self, request):
-        return forward_request('GET', f"{settings.INSURANCE_SERVICE}/api/insurance/claims/", headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyClaimUpdate(APIView):
-    def put(self, request, pk):
-        return forward_request('PUT', f"{settings.INSURANCE_SERVICE}/api/insurance/claims/{pk}/update/", data=request.data, headers={'Authorization': request.headers.get('Authorization')})
-
+        return Response(breaker_stats())
 
 
-# ---- NOTIFICATION SERVICE ----
-class ProxyNotifySend(APIView):
-    def post(self, request):
-        return forward_request('POST', f"{settings.NOTIFICATION_SERVICE}/api/notify/send/", data=request.data, headers={'Authorization': request.headers.get('Authorization')})
-
-class ProxyNotifyList(APIView):
-    def get(self, request):
-        return forward_request('GET', f"{settings.NOTIFICATION_SERVICE}/api/notify/", headers={'Authorization': request.headers.get('Authorization')})
-
-
-# ---- VIRTUAL ROBOT SERVICE ----
-class ProxyVRDiagnose(APIView):
+def metrics_view(request):
     """
-    Proxy POST /api/vr/diagnose/ tới VirtualRobot Service
+    Metrics của gateway cho Prometheus scrape
+    GET /metrics
     """
-    def post(self, request):
-        return forward_request(
-            'POST',
-            f"{settings.VIRTUALROBOT_SERVICE}/api/vr/diagnose/",
-            data=request.data
-        )
-    
-
-
-class ProxyChatbotRespond(APIView):
-    def post(self, request):
-        return forward_request(
-            'POST',
-            f"{settings.CHATBOT_SERVICE}/api/chatbot/respond/",
-            data=request.data,
-        )
-
-
-class ProxyPatientCalendar(APIView):
-    """
-    Proxy cho Patient Calendar API
-    GET /api/appointments/patient-calendar/?year=2025&month=5
-    """
-    def get(self, request):
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header:
-            return Response({'error': 'Authorization required'}, status=401)
-        
-        return forward_request(
-            'GET',
-            f"{settings.APPOINTMENT_SERVICE}/api/appointments/patient-calendar/",
-            params=request.query_params,
-            headers={'Authorization': auth_header}
-        )
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
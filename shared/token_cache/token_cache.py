@@ -0,0 +1,82 @@
+"""
+Cache các JWT đã verify, dùng chung cho gateway và authentication class của các service.
+
+Package riêng (shared/token_cache), được cài vào image của gateway, user_service và appointment_service
+khi build Docker; chạy ngoài Docker thì cài bằng `pip install -e ../shared/token_cache`.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from django.conf import settings
+
+
+class VerifiedTokenCache:
+    """
+    LRU có giới hạn: sha256(token) -> payload đã verify.
+    Entry hết hạn theo claim `exp` của token; token lỗi không bao giờ được cache.
+    Payload trả về được dùng chung giữa các request nên không được sửa.
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token):
+        if isinstance(token, str):
+            token = token.encode()
+        return hashlib.sha256(token).digest()
+
+    def get(self, token):
+        key = self.digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, exp = entry
+                if exp is None or exp > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, payload):
+        exp = payload.get('exp')
+        entry = (payload, float(exp) if exp is not None else None)
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def decode(self, token, key, algorithms=('HS256',)):
+        """Giống jwt.decode nhưng bỏ qua bước verify chữ ký nếu token đã có trong cache"""
+        payload = self.get(token)
+        if payload is None:
+            payload = jwt.decode(token, key, algorithms=list(algorithms))
+            self.put(token, payload)
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+verified_tokens = VerifiedTokenCache(maxsize=getattr(settings, 'JWT_CACHE_SIZE', 4096))
+
+
+def decode_token(token):
+    """jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256']) có cache"""
+    return verified_tokens.decode(token, settings.SECRET_KEY)
@@ -29,6 +29,9 @@ ALLOWED_HOSTS = ['*']
 
 USE_X_FORWARDED_HOST = True
 
+# Số JWT đã verify được giữ trong cache (shared/token_cache)
+JWT_CACHE_SIZE = config('JWT_CACHE_SIZE', default=4096, cast=int)
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=9999),  # hoặc 100 năm cũng được
     'REFRESH_TOKEN_LIFETIME': timedelta(days=9999),
@@ -95,17 +98,23 @@ AUTH_USER_MODEL = 'users.User'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLITE_PATH: DB riêng, vd DB tạm của load test (gateway: manage.py loadtest --real-services)
+        'NAME': config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
     }
 }
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Giới hạn upload avatar (users/uploads.py, AvatarUploadView)
+AVATAR_MAX_SIZE = config('AVATAR_MAX_SIZE', default=5 * 1024 * 1024, cast=int)
+AVATAR_CONTENT_TYPES = ('image/jpeg', 'image/jpg', 'image/png', 'image/gif')
+AVATAR_MULTIPART_OVERHEAD = 64 * 1024
+
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     )
 }
 
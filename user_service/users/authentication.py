@@ -5,6 +5,8 @@ from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from token_cache import VerifiedTokenCache, decode_token
 
 User = get_user_model()
 
@@ -12,6 +14,12 @@ class MicroserviceUser:
     """
     Simple user class for microservices that don't have direct access to User model
     """
+    __slots__ = ('id', 'username', 'email', 'first_name', 'last_name', 'role', 'is_staff', 'is_superuser')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
     def __init__(self, user_data):
         self.id = user_data.get('id')
         self.username = user_data.get('username', '')
@@ -19,9 +27,6 @@ class MicroserviceUser:
         self.first_name = user_data.get('first_name', '')
         self.last_name = user_data.get('last_name', '')
         self.role = user_data.get('role', 'PATIENT')
-        self.is_authenticated = True
-        self.is_active = True
-        self.is_anonymous = False
         self.is_staff = user_data.get('is_staff', False)
         self.is_superuser = user_data.get('is_superuser', False)
     
@@ -43,8 +48,8 @@ class MicroserviceJWTAuthentication(BaseAuthentication):
         token = auth_header.split(' ', 1)[1]
         
         try:
-            # Decode JWT token
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+            # Decode JWT token (token đã verify được lấy từ cache)
+            payload = decode_token(token)
             user_id = payload.get('user_id')
             
             if not user_id:
@@ -92,3 +97,21 @@ class MicroserviceJWTAuthentication(BaseAuthentication):
             raise AuthenticationFailed(f'Invalid token: {str(e)}')
         except Exception as e:
             raise AuthenticationFailed(f'Authentication error: {str(e)}')
+
+
+# Cache riêng cho SimpleJWT: chỉ chứa token đã qua đủ các bước kiểm tra của SimpleJWT
+# (chữ ký, exp, token_type), lưu luôn đối tượng token đã validate
+validated_access_tokens = VerifiedTokenCache(maxsize=getattr(settings, 'JWT_CACHE_SIZE', 4096))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication của SimpleJWT, không verify lại token đã verify trước đó
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = validated_access_tokens.get(raw_token)
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            validated_access_tokens.put(raw_token, validated_token)
+        return validated_token
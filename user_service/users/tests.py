@@ -0,0 +1,112 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+import jwt
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import CachedJWTAuthentication, validated_access_tokens
+from .uploads import AvatarUploadHandler
+from .views import AvatarUploadView
+
+
+def access_token(user_id=1, lifetime=timedelta(minutes=5)):
+    token = AccessToken()
+    token['user_id'] = user_id
+    token.set_exp(lifetime=lifetime)
+    return str(token).encode()
+
+
+class CachedJWTAuthenticationTests(SimpleTestCase):
+    def setUp(self):
+        validated_access_tokens.clear()
+        self.addCleanup(validated_access_tokens.clear)
+        self.auth = CachedJWTAuthentication()
+
+    def test_token_verified_once(self):
+        raw = access_token()
+        with mock.patch('jwt.decode', wraps=jwt.decode) as decode:
+            first = self.auth.get_validated_token(raw)
+            second = self.auth.get_validated_token(raw)
+
+        self.assertEqual(decode.call_count, 1)
+        self.assertIs(first, second)
+        self.assertEqual(second['user_id'], 1)
+
+    def test_entry_dropped_after_exp(self):
+        raw = access_token()
+        exp = self.auth.get_validated_token(raw)['exp']
+
+        # Sau thời điểm exp của token, cache không trả entry nữa và token được SimpleJWT kiểm tra lại
+        with mock.patch('time.time', return_value=exp + 1), \
+                mock.patch('jwt.decode', wraps=jwt.decode) as decode:
+            self.auth.get_validated_token(raw)
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(validated_access_tokens.stats()['size'], 1)
+
+    def test_expired_token_rejected_and_not_cached(self):
+        raw = access_token(lifetime=timedelta(seconds=-1))
+        with self.assertRaises(InvalidToken):
+            self.auth.get_validated_token(raw)
+        self.assertEqual(validated_access_tokens.stats()['size'], 0)
+
+    def test_invalid_token_never_cached(self):
+        bad_signature = jwt.encode(
+            {'user_id': 1, 'token_type': 'access', 'jti': 'x', 'exp': int(time.time()) + 60}, 'other-secret',
+        ).encode()
+        for raw in (bad_signature, bad_signature, b'not-a-token'):
+            with self.assertRaises(InvalidToken):
+                self.auth.get_validated_token(raw)
+        self.assertEqual(validated_access_tokens.stats()['size'], 0)
+        self.assertEqual(validated_access_tokens.hits, 0)
+
+
+@override_settings(AVATAR_MAX_SIZE=1000)
+class AvatarUploadHandlerTests(SimpleTestCase):
+    def upload(self, name, content, content_type):
+        request = APIRequestFactory().post('/api/users/me/upload-avatar/', {
+            'avatar': SimpleUploadedFile(name, content, content_type=content_type),
+        }, format='multipart')
+        force_authenticate(request, user=mock.Mock(is_authenticated=True))
+        return AvatarUploadView.as_view()(request)
+
+    def test_rejects_content_type_before_reading_the_file(self):
+        handler = AvatarUploadHandler()
+        with self.assertRaises(StopUpload) as stop:
+            handler.new_file('avatar', 'avatar.txt', 'text/plain', None)
+        self.assertTrue(stop.exception.connection_reset)
+        self.assertIsNone(getattr(handler, 'file', None))
+
+        with mock.patch.object(AvatarUploadHandler, 'receive_data_chunk') as receive:
+            response = self.upload('avatar.txt', b'hello', 'text/plain')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Invalid file type. Only JPEG, PNG, and GIF are allowed.')
+        receive.assert_not_called()
+
+    def test_aborts_once_the_file_passes_the_size_limit(self):
+        handler = AvatarUploadHandler()
+        handler.new_file('avatar', 'avatar.png', 'image/png', None)
+        handler.receive_data_chunk(b'x' * 600, 0)
+        with self.assertRaises(StopUpload) as stop:
+            handler.receive_data_chunk(b'x' * 600, 600)
+        self.assertTrue(stop.exception.connection_reset)
+        self.assertTrue(handler.file.closed)
+
+        # Content-Length còn trong giới hạn (gồm overhead multipart) nên body được đọc tới khi vượt giới hạn
+        with mock.patch.object(AvatarUploadHandler, 'file_complete') as file_complete:
+            response = self.upload('avatar.png', b'x' * 2000, 'image/png')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data['error'].startswith('File too large'))
+        file_complete.assert_not_called()
+
+    @override_settings(AVATAR_MULTIPART_OVERHEAD=100)
+    def test_rejects_large_content_length_without_reading_the_body(self):
+        with mock.patch.object(AvatarUploadHandler, 'new_file') as new_file:
+            response = self.upload('avatar.png', b'x' * 2000, 'image/png')
+        self.assertEqual(response.status_code, 413)
+        new_file.assert_not_called()
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+
+class AvatarUploadHandler(TemporaryFileUploadHandler):
+    """
+    Ghi file avatar xuống file tạm theo từng chunk thay vì giữ trong bộ nhớ,
+    và dừng nhận file ngay khi loại file không hợp lệ hoặc vượt quá AVATAR_MAX_SIZE.
+    connection_reset=True: Django không đọc nốt phần body còn lại, kết nối bị đóng sau khi trả lỗi.
+    Lỗi được lưu ở self.error để view trả về cho client.
+    """
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.error = None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        if field_name == 'avatar' and content_type not in settings.AVATAR_CONTENT_TYPES:
+            self.error = 'Invalid file type. Only JPEG, PNG, and GIF are allowed.'
+            raise StopUpload(connection_reset=True)
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.AVATAR_MAX_SIZE:
+            self.error = f'File too large. Maximum size is {settings.AVATAR_MAX_SIZE // (1024 * 1024)}MB.'
+            self.file.close()
+            raise StopUpload(connection_reset=True)
+        return super().receive_data_chunk(raw_data, start)
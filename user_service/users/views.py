@@ -5,6 +5,7 @@ from rest_framework import status
 from .serializers import *
 from .authentication import MicroserviceJWTAuthentication
 from .permissions import IsAuthenticatedOrService
+from .uploads import AvatarUploadHandler
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
@@ -106,27 +107,43 @@ class ProfileView(APIView):
 
 class AvatarUploadView(APIView):
     permission_classes = [IsAuthenticated]
-    
+
+    def initialize_request(self, request, *args, **kwargs):
+        # File được ghi thẳng xuống file tạm trong lúc parse body, không đọc cả file vào bộ nhớ
+        request.upload_handlers = [AvatarUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request):
         """Upload user avatar"""
         try:
-            if 'avatar' not in request.FILES:
+            # Từ chối file quá lớn trước khi đọc body
+            max_size = settings.AVATAR_MAX_SIZE
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+            if content_length > max_size + settings.AVATAR_MULTIPART_OVERHEAD:
+                return Response({
+                    'error': f'File too large. Maximum size is {max_size // (1024 * 1024)}MB.'
+                }, status=413)
+
+            files = request.FILES
+            handler = request.upload_handlers[0]
+            if handler.error:
+                return Response({'error': handler.error}, status=400)
+
+            if 'avatar' not in files:
                 return Response({'error': 'No avatar file provided'}, status=400)
             
-            avatar_file = request.FILES['avatar']
+            avatar_file = files['avatar']
             
             # Validate file type
-            allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif']
-            if avatar_file.content_type not in allowed_types:
+            if avatar_file.content_type not in settings.AVATAR_CONTENT_TYPES:
                 return Response({
                     'error': 'Invalid file type. Only JPEG, PNG, and GIF are allowed.'
                 }, status=400)
             
-            # Validate file size (max 5MB)
-            max_size = 5 * 1024 * 1024  # 5MB
+            # Validate file size
             if avatar_file.size > max_size:
                 return Response({
-                    'error': 'File too large. Maximum size is 5MB.'
+                    'error': f'File too large. Maximum size is {max_size // (1024 * 1024)}MB.'
                 }, status=400)
             
             # Delete old avatar if exists